@@ -0,0 +1,402 @@
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from findash.trans_schema import TransDBSchema
+from findash.categories_db import CatDBSchema
+from findash.transfers import is_transfer
+
+"""
+Monthly aggregates of the transactions db - sums of inflow, outflow and amount
+per month, category, category group and account. Months are identified by an
+integer period key (yyyymm) so aggregates can be sorted and compared without
+parsing dates. Transfers between accounts are summed apart, so they are left
+out of the income and expense figures but still count in the balances.
+"""
+
+
+@dataclass
+class AggSchema:
+    PERIOD: str = 'period'
+    CAT: str = TransDBSchema.CAT
+    CAT_GROUP: str = TransDBSchema.CAT_GROUP
+    ACCOUNT: str = TransDBSchema.ACCOUNT
+    INFLOW: str = TransDBSchema.INFLOW
+    OUTFLOW: str = TransDBSchema.OUTFLOW
+    AMOUNT: str = TransDBSchema.AMOUNT
+    TRANSFER_AMOUNT: str = 'transfer_amount'
+    COUNT: str = 'count'
+
+    @classmethod
+    def get_key_cols(cls) -> List[str]:
+        return [cls.PERIOD, cls.CAT, cls.CAT_GROUP, cls.ACCOUNT]
+
+    @classmethod
+    def get_sum_cols(cls) -> List[str]:
+        return [cls.INFLOW, cls.OUTFLOW, cls.AMOUNT]
+
+    @classmethod
+    def get_agg_cols(cls) -> List[str]:
+        return [*cls.get_key_cols(), *cls.get_sum_cols(), cls.TRANSFER_AMOUNT, cls.COUNT]
+
+
+def get_period_keys(dates: pd.Series) -> pd.Series:
+    """ convert dates to integer period keys of form yyyymm """
+    return (dates.dt.year * 100 + dates.dt.month).astype(np.int32)
+
+
+def get_period_key(year: int, month: int) -> int:
+    return year * 100 + month
+
+
+def period_key_to_timestamp(periods: pd.Series) -> pd.Series:
+    """ convert period keys to the timestamp of the first day of the month """
+    return pd.to_datetime(periods.astype(str), format='%Y%m')
+
+
+def shift_period_key(period: int, months: int) -> int:
+    """ move a period key by a number of months (negative to move back) """
+    month_ind = (period // 100) * 12 + period % 100 - 1 + months
+    return get_period_key(month_ind // 12, month_ind % 12 + 1)
+
+
+def get_period_range(first_period: int, last_period: int) -> pd.Index:
+    """ period keys of every month from first_period to last_period, inclusive """
+    month_inds = np.arange(first_period // 100 * 12 + first_period % 100 - 1,
+                           last_period // 100 * 12 + last_period % 100)
+    return pd.Index(month_inds // 12 * 100 + month_inds % 12 + 1, name=AggSchema.PERIOD)
+
+
+def empty_aggregates() -> pd.DataFrame:
+    return pd.DataFrame(columns=AggSchema.get_agg_cols())
+
+
+def aggregate_monthly(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    aggregate transactions to monthly totals
+    :param df: transactions with at least the analytics cols of TransDBSchema
+    :return: one row per period, category, group and account. Uncategorized
+             transactions are kept under an empty category. The amount of
+             transfers is only in the transfer amount col
+    """
+    if len(df) == 0:
+        return empty_aggregates()
+
+    keys = {AggSchema.PERIOD: get_period_keys(df[TransDBSchema.DATE])}
+    for col in [AggSchema.CAT, AggSchema.CAT_GROUP, AggSchema.ACCOUNT]:
+        keys[col] = _to_key_col(df[col])
+
+    transfer = is_transfer(df)
+    values = df[AggSchema.get_sum_cols()].where(~transfer, 0., axis=0).assign(
+        **{AggSchema.TRANSFER_AMOUNT: df[AggSchema.AMOUNT].where(transfer, 0.),
+           AggSchema.COUNT: 1})
+    grouped = values.groupby([keys[col] for col in AggSchema.get_key_cols()])
+    aggs = grouped.sum()
+    aggs.index.names = AggSchema.get_key_cols()
+    return aggs.reset_index()[AggSchema.get_agg_cols()]
+
+
+# usage pcts of the budget from which a category is close to using it up and
+# from which it is overusing it
+LOW_USAGE_THR = 85
+HIGH_USAGE_THR = 100
+
+
+class UsageSchema:
+    USAGE: str = 'usage'
+    USAGE_PCT: str = 'usage_pct'
+    LEFT: str = 'left'
+    PROJECTED: str = 'projected'
+    PROJECTED_PCT: str = 'projected_pct'
+    CARRYOVER: str = 'carryover'
+    COLOR: str = 'color'
+    NUM_GREEN: str = 'num_green'
+    NUM_YELLOW: str = 'num_yellow'
+    NUM_RED: str = 'num_red'
+
+
+def get_budget_usage(month_aggs: pd.DataFrame,
+                     categories: pd.DataFrame,
+                     low_usage_thr: float,
+                     high_usage_thr: float,
+                     projected: Optional[pd.Series] = None,
+                     carryover: Optional[pd.Series] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    budget usage of a month per category and per category group
+    :param month_aggs: monthly aggregates of a single month
+    :param categories: the categories db frame (see CatDBSchema)
+    :param low_usage_thr: usage pct from which a budget is close to being used up
+    :param high_usage_thr: usage pct from which a budget is overused
+    :param projected: projected spend of the month per category (see
+                      projections.py). If given, colors are by the projected
+                      usage instead of the current one
+    :param carryover: balance carried into the month per rollover category
+                      (see rollover.py). If given, it is added to the budget
+                      of the month, so what is left is the available to spend
+    :return: cat usage - the categories frame with usage cols, and group usage -
+             one row per group (sorted by name) with its usage and the number of
+             its categories in each color
+    """
+    color_col = UsageSchema.USAGE if projected is None else UsageSchema.PROJECTED
+
+    def get_pct(df: pd.DataFrame, col: str) -> pd.Series:
+        budget = df[CatDBSchema.BUDGET]
+        pct = (df[col] * 100 / budget.where(budget != 0)).fillna(0)
+        # a budget overdrawn by its carryover is overused by any spend
+        overdrawn_pct = (df[col] > 0) * high_usage_thr
+        return pct.where(budget >= 0, overdrawn_pct)
+
+    def get_colors(pct: pd.Series, colors: List[str]) -> np.ndarray:
+        return np.select([pct < low_usage_thr, pct < high_usage_thr], colors[:2], colors[2])
+
+    def add_usage_cols(df: pd.DataFrame) -> pd.DataFrame:
+        df[UsageSchema.USAGE_PCT] = get_pct(df, UsageSchema.USAGE).astype(int)
+        df[UsageSchema.LEFT] = df[CatDBSchema.BUDGET] - df[UsageSchema.USAGE]
+        if projected is not None:
+            df[UsageSchema.PROJECTED_PCT] = get_pct(df, UsageSchema.PROJECTED).astype(int)
+        df[UsageSchema.COLOR] = get_colors(get_pct(df, color_col).astype(int),
+                                           ['green', 'yellow', 'red'])
+        return df
+
+    if carryover is not None:
+        categories = categories.assign(**{UsageSchema.CARRYOVER: categories[
+            CatDBSchema.CAT_NAME].map(carryover).fillna(0)})
+        categories[CatDBSchema.BUDGET] += categories[UsageSchema.CARRYOVER]
+
+    cat_usage = month_aggs.groupby(AggSchema.CAT)[AggSchema.AMOUNT].sum()
+    cats = categories.merge(cat_usage.rename(UsageSchema.USAGE), how='left',
+                            left_on=CatDBSchema.CAT_NAME, right_index=True)
+    cats[UsageSchema.USAGE] = cats[UsageSchema.USAGE].fillna(0).astype(int)
+    if projected is not None:
+        cats[UsageSchema.PROJECTED] = \
+            cats[CatDBSchema.CAT_NAME].map(projected).fillna(0).astype(int)
+    cats = add_usage_cols(cats)
+
+    # categories are counted by their exact usage, not the truncated one
+    color_counts = pd.get_dummies(pd.Categorical(
+        get_colors(get_pct(cats, color_col),
+                   [UsageSchema.NUM_GREEN, UsageSchema.NUM_YELLOW, UsageSchema.NUM_RED]),
+        categories=[UsageSchema.NUM_GREEN, UsageSchema.NUM_YELLOW, UsageSchema.NUM_RED]))
+    color_counts.index = cats.index
+    group_cols = [CatDBSchema.CAT_GROUP, CatDBSchema.BUDGET]
+    if projected is not None:
+        group_cols.append(UsageSchema.PROJECTED)
+    if carryover is not None:
+        group_cols.append(UsageSchema.CARRYOVER)
+    groups = pd.concat([cats[group_cols], color_counts], axis=1).groupby(
+        CatDBSchema.CAT_GROUP).sum()
+
+    group_usage = month_aggs.groupby(AggSchema.CAT_GROUP)[AggSchema.AMOUNT].sum()
+    groups[UsageSchema.USAGE] = group_usage.reindex(groups.index).fillna(0).astype(int)
+    groups = add_usage_cols(groups.reset_index())
+    return cats, groups
+
+
+class ComparisonSchema:
+    BASE: str = 'base'
+    COMPARED: str = 'compared'
+    DELTA: str = 'delta'
+    DELTA_PCT: str = 'delta_pct'
+
+
+class FilterTotalsSchema:
+    INFLOW: str = TransDBSchema.INFLOW
+    OUTFLOW: str = TransDBSchema.OUTFLOW
+    NET: str = 'net'
+    COUNT: str = 'count'
+    FIRST_DATE: str = 'first_date'
+    LAST_DATE: str = 'last_date'
+
+
+def get_filter_totals(df: pd.DataFrame, mask: Union[pd.Series, bool]) -> pd.Series:
+    """
+    totals of the rows a filter selects, reduced from the filter mask col by
+    col so the selected rows are not copied as a frame
+    :param mask: boolean mask over the rows of df, or True for all rows
+    :return: inflow, outflow, net (inflow minus outflow) and count of the rows
+             and their first and last dates (NaT if none are selected)
+    """
+    mask = np.broadcast_to(np.asarray(mask, dtype=bool), (len(df),))
+    inflow = df[TransDBSchema.INFLOW].to_numpy(dtype=float)[mask].sum()
+    outflow = df[TransDBSchema.OUTFLOW].to_numpy(dtype=float)[mask].sum()
+    dates = df[TransDBSchema.DATE].to_numpy()[mask]
+    return pd.Series({FilterTotalsSchema.INFLOW: inflow,
+                      FilterTotalsSchema.OUTFLOW: outflow,
+                      FilterTotalsSchema.NET: inflow - outflow,
+                      FilterTotalsSchema.COUNT: int(mask.sum()),
+                      FilterTotalsSchema.FIRST_DATE: pd.Timestamp(dates.min()) if len(dates)
+                      else pd.NaT,
+                      FilterTotalsSchema.LAST_DATE: pd.Timestamp(dates.max()) if len(dates)
+                      else pd.NaT})
+
+
+def _to_key_col(col: pd.Series) -> pd.Series:
+    """ plain object col with empty strings for missing values, to group by """
+    return col.astype(object).where(col.notna(), '')
+
+
+class RollupCube:
+    """
+    Monthly aggregates of the whole db keyed by period, category, group and
+    account. The cube is immutable - apply_delta returns a new cube, so readers
+    can keep using the one they got while a writer publishes the next.
+    """
+    def __init__(self, aggs: Optional[pd.DataFrame] = None):
+        """
+        :param aggs: monthly aggregates (see aggregate_monthly). Rows with the
+                     same keys are summed
+        """
+        aggs = empty_aggregates() if aggs is None else aggs
+        self._cube = self._to_cube(aggs)
+        self._content_hash: Optional[str] = None
+
+    @classmethod
+    def from_rows(cls, df: pd.DataFrame,
+                  cold_aggregates: Optional[pd.DataFrame] = None) -> 'RollupCube':
+        """
+        build a cube from transactions
+        :param cold_aggregates: aggregates of months whose rows are not in df
+        """
+        aggs = [aggregate_monthly(df)]
+        if cold_aggregates is not None:
+            aggs.append(cold_aggregates)
+        return cls(pd.concat(aggs, ignore_index=True))
+
+    @staticmethod
+    def _to_cube(aggs: pd.DataFrame) -> pd.DataFrame:
+        value_cols = [*AggSchema.get_sum_cols(), AggSchema.TRANSFER_AMOUNT, AggSchema.COUNT]
+        # aggregates stored before transfers were tagged
+        if AggSchema.TRANSFER_AMOUNT not in aggs.columns:
+            aggs = aggs.assign(**{AggSchema.TRANSFER_AMOUNT: 0.})
+        aggs = aggs.astype({AggSchema.PERIOD: np.int32,
+                            **{col: float for col in value_cols}})
+        return aggs.groupby(AggSchema.get_key_cols())[value_cols].sum()
+
+    def apply_delta(self,
+                    removed: Optional[pd.DataFrame] = None,
+                    added: Optional[pd.DataFrame] = None) -> 'RollupCube':
+        """
+        :param removed: rows as they were before the change, at least the
+                        analytics cols
+        :param added: rows as they are after the change
+        :return: a new cube with the change applied
+        """
+        cube = self._cube
+        if added is not None and len(added):
+            cube = cube.add(self._to_cube(aggregate_monthly(added)), fill_value=0)
+        if removed is not None and len(removed):
+            cube = cube.sub(self._to_cube(aggregate_monthly(removed)), fill_value=0)
+        if cube is self._cube:
+            return self
+
+        new_cube = RollupCube()
+        new_cube._cube = cube[cube[AggSchema.COUNT] > 0]
+        return new_cube
+
+    @property
+    def aggregates(self) -> pd.DataFrame:
+        """ the cube as a monthly aggregates frame (see aggregate_monthly) """
+        return self._to_aggregates(self._cube)
+
+    @staticmethod
+    def _to_aggregates(cube: pd.DataFrame) -> pd.DataFrame:
+        aggs = cube.reset_index()
+        aggs[AggSchema.COUNT] = aggs[AggSchema.COUNT].astype(np.int64)
+        return aggs[AggSchema.get_agg_cols()]
+
+    def get_period(self, period: int) -> pd.DataFrame:
+        """ monthly aggregates of a single period, sliced from the cube index """
+        try:
+            period_cube = self._cube.xs(period, level=AggSchema.PERIOD, drop_level=False)
+        except KeyError:  # no transactions in the period
+            period_cube = self._cube.iloc[:0]
+        return self._to_aggregates(period_cube)
+
+    def get_periods(self, start_period: int, end_period: int) -> pd.DataFrame:
+        """
+        monthly aggregates of the periods between start_period and end_period,
+        inclusive
+        """
+        periods = self._cube.index.get_level_values(AggSchema.PERIOD)
+        return self._to_aggregates(self._cube[(periods >= start_period) &
+                                              (periods <= end_period)])
+
+    def get_last_period(self) -> Optional[int]:
+        """ period key of the last month with transactions, None if there are none """
+        periods = self._cube.index.get_level_values(AggSchema.PERIOD)
+        return int(periods.max()) if len(periods) else None
+
+    def get_period_totals(self,
+                          period: int,
+                          cats: Iterable[str],
+                          value_col: str = AggSchema.OUTFLOW) -> pd.Series:
+        """
+        :return: total of value_col per category of a single period, only the
+                 given categories, read from their rows of the cube index
+        """
+        try:
+            period_cube = self._cube.xs(period, level=AggSchema.PERIOD)
+        except KeyError:  # no transactions in the period
+            period_cube = self._cube.iloc[:0].droplevel(AggSchema.PERIOD)
+        cat_rows = period_cube[period_cube.index.get_level_values(AggSchema.CAT).isin(cats)]
+        return cat_rows.groupby(level=AggSchema.CAT)[value_col].sum()
+
+    def get_totals(self,
+                   start_period: int,
+                   end_period: int,
+                   by: str = AggSchema.CAT,
+                   value_col: str = AggSchema.OUTFLOW) -> pd.Series:
+        """
+        :return: total of value_col per value of the by col, over the periods
+                 between start_period and end_period, inclusive
+        """
+        periods = self._cube.index.get_level_values(AggSchema.PERIOD)
+        in_range = self._cube[(periods >= start_period) & (periods <= end_period)]
+        return in_range.groupby(level=by)[value_col].sum()
+
+    def compare(self,
+                base: Tuple[int, int],
+                compared: Tuple[int, int],
+                by: str = AggSchema.CAT,
+                value_col: str = AggSchema.OUTFLOW) -> pd.DataFrame:
+        """
+        compare the totals of two ranges of periods
+        :param base: start and end period of the range compared against
+        :param compared: start and end period of the compared range
+        :return: totals of both ranges and their delta (in value and in pct of
+                 base, NaN where base is 0) per value of the by col, sorted by
+                 the size of the delta
+        """
+        comparison = pd.concat({ComparisonSchema.BASE: self.get_totals(*base, by, value_col),
+                                ComparisonSchema.COMPARED: self.get_totals(*compared, by,
+                                                                           value_col)},
+                               axis=1).fillna(0.)
+        comparison[ComparisonSchema.DELTA] = \
+            comparison[ComparisonSchema.COMPARED] - comparison[ComparisonSchema.BASE]
+        base_totals = comparison[ComparisonSchema.BASE]
+        comparison[ComparisonSchema.DELTA_PCT] = \
+            comparison[ComparisonSchema.DELTA] * 100 / base_totals.where(base_totals != 0)
+        return comparison.sort_values(ComparisonSchema.DELTA, key=abs, ascending=False)
+
+    def get_content_hash(self) -> str:
+        """
+        hash of the totals of the cube, equal for cubes holding the same totals
+        (rounded to cents) however they were built
+        """
+        if self._content_hash is None:
+            cube = self._cube.sort_index().round(2).reset_index()
+            self._content_hash = str(pd.util.hash_pandas_object(cube, index=False).sum())
+        return self._content_hash
+
+    def equals(self, other: 'RollupCube', periods: Optional[Iterable[int]] = None) -> bool:
+        """
+        whether both cubes hold the same totals, up to float rounding
+        :param periods: period keys of the months to compare, all if None
+        """
+        this, other = self._cube.align(other._cube, fill_value=0)
+        if periods is not None:
+            in_periods = this.index.get_level_values(AggSchema.PERIOD).isin(list(periods))
+            this, other = this[in_periods], other[in_periods]
+        return np.allclose(this.to_numpy(dtype=float), other.to_numpy(dtype=float))
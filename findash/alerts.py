@@ -0,0 +1,118 @@
+import threading
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from findash.aggregates import AggSchema, HIGH_USAGE_THR, LOW_USAGE_THR, RollupCube, \
+    get_period_keys
+from findash.categories_db import CategoriesDB, CatDBSchema
+from findash.file_io import FileIO
+from findash.trans_schema import TransDBSchema
+
+"""
+Alerts on categories crossing a budget usage threshold. Every change to the
+transactions db re-evaluates only the categories of the rows it touched, in
+the current month. An alert fires once when its category crosses the
+threshold and is kept in a small state table. If the usage drops back under
+the threshold, e.g. after a refund, the alert is cleared and can fire again.
+The budget of a rollover category includes its carryover (see rollover.py), as
+in the budget usage of the monthly page.
+"""
+
+
+class AlertSchema:
+    PERIOD: str = AggSchema.PERIOD
+    CAT: str = AggSchema.CAT
+    THRESHOLD: str = 'threshold'
+    USAGE: str = 'usage'
+    BUDGET: str = CatDBSchema.BUDGET
+    FIRED_AT: str = 'fired_at'
+
+    @classmethod
+    def get_cols(cls) -> List[str]:
+        return [cls.PERIOD, cls.CAT, cls.THRESHOLD, cls.USAGE, cls.BUDGET, cls.FIRED_AT]
+
+
+class BudgetAlertEngine:
+    def __init__(self,
+                 file_io: FileIO,
+                 cat_db: CategoriesDB,
+                 get_carryover: Optional[Callable[[int], pd.Series]] = None,
+                 thresholds: Tuple[int, ...] = (LOW_USAGE_THR, HIGH_USAGE_THR),
+                 state_path: str = 'trans_db_alerts.pq'):
+        """
+        :param get_carryover: balance carried into a month per rollover
+                              category, see RolloverEngine.get_carryover. None
+                              if budgets do not roll over
+        :param thresholds: usage pcts of the budget an alert fires at
+        """
+        self._file_io = file_io
+        self._cat_db = cat_db
+        self._get_carryover = get_carryover
+        self._thresholds = thresholds
+        self._state_path = state_path
+        self._lock = threading.Lock()
+        self.fired = pd.DataFrame(columns=AlertSchema.get_cols())
+
+    def load_state(self) -> None:
+        if self._state_path in self._file_io.get_files_in_dir(''):
+            self.fired = self._file_io.load_file(self._state_path)
+
+    def evaluate(self,
+                 cube: RollupCube,
+                 changed_rows: Iterable[Optional[pd.DataFrame]],
+                 period: int) -> pd.DataFrame:
+        """
+        :param cube: the rollup cube of the published version with the change
+                     applied
+        :param changed_rows: the removed and added rows of the change
+        :param period: the month alerts are evaluated in, rows of other months
+                       are ignored
+        :return: the alerts fired by the change
+        """
+        cats = set()
+        for rows in changed_rows:
+            if rows is None or not len(rows):
+                continue
+            in_period = get_period_keys(rows[TransDBSchema.DATE]) == period
+            cats.update(rows.loc[in_period & rows[TransDBSchema.CAT].notna(),
+                                 TransDBSchema.CAT].astype(object))
+        cats.discard('')
+        if not len(cats):
+            return pd.DataFrame(columns=AlertSchema.get_cols())
+
+        budgets = self._cat_db.db.set_index(CatDBSchema.CAT_NAME)[CatDBSchema.BUDGET]
+        budgets = budgets[budgets.index.isin(cats) & (budgets > 0)]
+        if self._get_carryover is not None and \
+                budgets.index.isin(self._cat_db.get_rollover_starts().index).any():
+            budgets = budgets + self._get_carryover(period).reindex(budgets.index, fill_value=0.)
+        usage = cube.get_period_totals(period, budgets.index, AggSchema.AMOUNT).reindex(
+            budgets.index, fill_value=0.)
+        usage_pct = (usage * 100 / budgets.where(budgets != 0)).fillna(0)
+        # a budget overdrawn by its carryover is crossed by any spend
+        usage_pct = usage_pct.where(budgets >= 0, (usage > 0) * max(self._thresholds))
+
+        evaluated_cats = pd.DataFrame({AlertSchema.PERIOD: period,
+                                       AlertSchema.CAT: budgets.index,
+                                       AlertSchema.USAGE: usage.to_numpy(),
+                                       AlertSchema.BUDGET: budgets.to_numpy()})
+        crossed = pd.concat([
+            evaluated_cats[(usage_pct >= threshold).to_numpy()].assign(
+                **{AlertSchema.THRESHOLD: threshold})
+            for threshold in self._thresholds], ignore_index=True)
+
+        with self._lock:
+            fired = self.fired
+            key_cols = [AlertSchema.PERIOD, AlertSchema.CAT, AlertSchema.THRESHOLD]
+            evaluated = (fired[AlertSchema.PERIOD] == period) & fired[AlertSchema.CAT].isin(cats)
+            still_crossed = fired[evaluated].merge(crossed[key_cols], on=key_cols)
+            new = crossed.merge(fired[evaluated][key_cols], on=key_cols, how='left',
+                                indicator=True)
+            new = new[new['_merge'] == 'left_only'].drop(columns='_merge')
+            new[AlertSchema.FIRED_AT] = pd.Timestamp.now()
+
+            if len(new) or len(still_crossed) < evaluated.sum():
+                self.fired = pd.concat([fired[~evaluated], still_crossed, new],
+                                       ignore_index=True)[AlertSchema.get_cols()]
+                self._file_io.save_file(self._state_path, self.fired)
+        return new[AlertSchema.get_cols()].reset_index(drop=True)
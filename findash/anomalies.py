@@ -0,0 +1,153 @@
+import threading
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from findash.file_io import FileIO
+from findash.trans_schema import TransDBSchema
+
+"""
+Detection of unusual charges. For every payee and every category the detector
+keeps the last charges and their median and MAD (median absolute deviation).
+A new charge is flagged when its robust z-score against its payee or category
+is high and it is also a multiple of the usual charge. Imported rows are
+scored together, and only the statistics of the payees and categories they
+touch are recomputed.
+"""
+
+# number of last charges per payee or category the statistics are computed on
+WINDOW_SIZE = 24
+# charges needed before a payee or category is scored
+MIN_HISTORY = 4
+ZSCORE_THR = 3.5
+# a flagged charge is also at least this many times the median charge
+MIN_RATIO = 2
+# scales the MAD to the std of normally distributed charges
+MAD_SCALE = 1.4826
+
+
+class AnomalySchema:
+    ID: str = TransDBSchema.ID
+    DATE: str = TransDBSchema.DATE
+    PAYEE: str = TransDBSchema.PAYEE
+    CAT: str = TransDBSchema.CAT
+    OUTFLOW: str = TransDBSchema.OUTFLOW
+    REASON: str = 'reason'
+    MEDIAN: str = 'median'
+    SCORE: str = 'score'
+
+    @classmethod
+    def get_cols(cls) -> List[str]:
+        return [cls.ID, cls.DATE, cls.PAYEE, cls.CAT, cls.OUTFLOW, cls.REASON, cls.MEDIAN,
+                cls.SCORE]
+
+
+class AnomalyDetector:
+    # key col: reason given for the charges flagged by it, in order of priority
+    KEY_COLS = {TransDBSchema.PAYEE: 'payee', TransDBSchema.CAT: 'category'}
+
+    def __init__(self,
+                 file_io: FileIO,
+                 flags_path: str = 'trans_db_anomalies.pq'):
+        self._file_io = file_io
+        self._flags_path = flags_path
+        # per key col - the last charges of every key and the stats of the keys
+        self._windows: Dict[str, pd.DataFrame] = {}
+        self._stats: Dict[str, pd.DataFrame] = {}
+        self._lock = threading.Lock()
+        self.flags = pd.DataFrame(columns=AnomalySchema.get_cols())
+
+    def fit(self, df: pd.DataFrame) -> None:
+        """ compute the statistics from scratch from the rows of the db """
+        with self._lock:
+            for key_col in self.KEY_COLS:
+                self._windows[key_col] = pd.DataFrame(columns=[key_col, TransDBSchema.DATE,
+                                                               TransDBSchema.OUTFLOW])
+                self._stats[key_col] = pd.DataFrame(columns=['median', 'mad', 'count'],
+                                                    dtype=float)
+            self._update(df)
+
+    def score(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        :param df: new transactions, not yet in the statistics
+        :return: the flagged charges of df (see AnomalySchema)
+        """
+        charges = self._get_charges(df)
+        best_scores = pd.Series(0., index=charges.index)
+        flags = pd.DataFrame(index=charges.index, columns=[AnomalySchema.REASON,
+                                                           AnomalySchema.MEDIAN])
+        with self._lock:
+            # the first key col to flag a charge is its reason
+            for key_col, reason in reversed(self.KEY_COLS.items()):
+                stats = self._stats[key_col].reindex(self._to_keys(charges[key_col]))
+                median = stats['median'].to_numpy()
+                spread = np.maximum(stats['mad'].to_numpy() * MAD_SCALE, 1e-9)
+                outflow = charges[TransDBSchema.OUTFLOW].to_numpy()
+                scores = (outflow - median) / spread
+                flagged = (stats['count'].to_numpy() >= MIN_HISTORY) & \
+                    (scores >= ZSCORE_THR) & (outflow >= MIN_RATIO * median)
+                best_scores[flagged] = scores[flagged]
+                flags.loc[flagged, AnomalySchema.REASON] = reason
+                flags.loc[flagged, AnomalySchema.MEDIAN] = median[flagged]
+
+        flagged = flags[AnomalySchema.REASON].notna()
+        result = charges.loc[flagged, [AnomalySchema.ID, AnomalySchema.DATE, AnomalySchema.PAYEE,
+                                       AnomalySchema.CAT, AnomalySchema.OUTFLOW]].copy()
+        result[AnomalySchema.CAT] = result[AnomalySchema.CAT].astype(object)
+        result[AnomalySchema.REASON] = flags.loc[flagged, AnomalySchema.REASON]
+        result[AnomalySchema.MEDIAN] = flags.loc[flagged, AnomalySchema.MEDIAN].astype(float)
+        result[AnomalySchema.SCORE] = best_scores[flagged]
+        return result.reset_index(drop=True)
+
+    def add(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        score new transactions, then add them to the statistics. Flagged
+        charges are added to self.flags and saved
+        :return: the flagged charges of df
+        """
+        flags = self.score(df)
+        with self._lock:
+            self._update(df)
+            if len(flags):
+                self.flags = pd.concat([self.flags, flags], ignore_index=True)
+                self._file_io.save_file(self._flags_path, self.flags)
+        return flags
+
+    def load_flags(self) -> None:
+        if self._flags_path in self._file_io.get_files_in_dir(''):
+            self.flags = self._file_io.load_file(self._flags_path)
+
+    def _update(self, df: pd.DataFrame) -> None:
+        charges = self._get_charges(df)
+        if not len(charges):
+            return
+
+        for key_col in self.KEY_COLS:
+            keys = self._to_keys(charges[key_col])
+            new_charges = pd.DataFrame({key_col: keys,
+                                        TransDBSchema.DATE: charges[TransDBSchema.DATE],
+                                        TransDBSchema.OUTFLOW: charges[TransDBSchema.OUTFLOW]})
+            window = pd.concat([self._windows[key_col], new_charges], ignore_index=True)
+            window = window.sort_values(TransDBSchema.DATE, kind='stable')
+            window = window.groupby(key_col).tail(WINDOW_SIZE)
+            self._windows[key_col] = window
+
+            touched = window[window[key_col].isin(keys.unique())]
+            grouped = touched.groupby(key_col)[TransDBSchema.OUTFLOW]
+            median = grouped.transform('median')
+            stats = pd.DataFrame({
+                'median': grouped.median(),
+                'mad': (touched[TransDBSchema.OUTFLOW] - median).abs().groupby(
+                    touched[key_col]).median(),
+                'count': grouped.count()}).astype(float)
+            self._stats[key_col] = pd.concat([
+                self._stats[key_col].drop(index=stats.index, errors='ignore'), stats])
+
+    @staticmethod
+    def _get_charges(df: pd.DataFrame) -> pd.DataFrame:
+        return df[df[TransDBSchema.OUTFLOW] > 0]
+
+    @staticmethod
+    def _to_keys(col: pd.Series) -> pd.Series:
+        return col.astype(object).where(col.notna(), '')
@@ -14,6 +14,8 @@ class CatDBSchema:
     CAT_GROUP: str = 'cat_group'
     IS_CONSTANT: str = 'is_constant'
     BUDGET: str = 'budget'
+    # period key from which unspent budget carries over, 0 for no rollover
+    ROLLOVER_START: str = 'rollover_start'
     NEW_CATEGORY_NAME = 'New Category'
 
 
@@ -37,6 +39,8 @@ class CategoriesDB:
         :return:
         """
         self._db = self._file_io.load_file(self._db_path, Ftype.PARQUET)
+        if CatDBSchema.ROLLOVER_START not in self._db.columns:
+            self._db[CatDBSchema.ROLLOVER_START] = 0
 
         if Path(self._payee2cat_db_path).exists():
             self._payee2cat = self._file_io.load_file(self._payee2cat_db_path,
@@ -74,7 +78,8 @@ class CategoriesDB:
             CatDBSchema.CAT_GROUP: cat_group,
             CatDBSchema.CAT_NAME: self.get_new_category_name(),
             CatDBSchema.IS_CONSTANT: False,
-            CatDBSchema.BUDGET: 0
+            CatDBSchema.BUDGET: 0,
+            CatDBSchema.ROLLOVER_START: 0
         }
 
     def add_category(self,
@@ -139,6 +144,16 @@ class CategoriesDB:
         self._db.loc[row_ind, CatDBSchema.BUDGET] = budget
         self._save_cat_db()
 
+    def update_category_rollover(self, category_name: str,
+                                 rollover_start: int) -> None:
+        """
+        :param rollover_start: period key of the first month whose unspent
+                               budget carries over, 0 to stop the rollover
+        """
+        row_ind = self._db[CatDBSchema.CAT_NAME] == category_name
+        self._db.loc[row_ind, CatDBSchema.ROLLOVER_START] = rollover_start
+        self._save_cat_db()
+
     def update_payee_to_cat_mapping(self, payee: str, cat: str):
         original_cat = self._payee2cat.get(payee)
         if original_cat is not None and original_cat != cat:
@@ -169,6 +184,14 @@ class CategoriesDB:
         cat_row = self._db[self._db[CatDBSchema.CAT_NAME] == cat]
         return cat_row[CatDBSchema.CAT_GROUP].iloc[0] if len(cat_row) > 0 else None
 
+    @property
+    def db(self) -> pd.DataFrame:
+        return self._db
+
+    def get_data_token(self) -> str:
+        """ hash of the categories db, changes on every edit of it """
+        return str(pd.util.hash_pandas_object(self._db, index=False).sum())
+
     def get_group_names(self) -> List[str]:
         return self._db[CatDBSchema.CAT_GROUP].unique().tolist()
 
@@ -189,6 +212,11 @@ class CategoriesDB:
         return self._db[self._db[CatDBSchema.CAT_NAME] == category_name][
             CatDBSchema.BUDGET].iloc[0]
 
+    def get_rollover_starts(self) -> pd.Series:
+        """ rollover start period per category (index) that rolls over """
+        starts = self._db.set_index(CatDBSchema.CAT_NAME)[CatDBSchema.ROLLOVER_START]
+        return starts[starts > 0].astype(int)
+
     def get_categories(self) -> List[str]:
         return self._db[CatDBSchema.CAT_NAME].to_list()
 
@@ -0,0 +1,73 @@
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from findash.file_io import FileIO
+from findash.trans_schema import TransDBSchema
+
+"""
+Persisted index of the dedupe keys of the transactions db (see
+TransDBSchema.get_cols_for_dup_checking). Every stored month has a set of 64 bit
+hashes of its keys, saved next to the partitions, so an import can tell which
+incoming transactions are certainly new without loading stored rows. Only rows
+whose hash is found need an exact check against the rows of their month.
+"""
+
+HASH_COL = 'key_hash'
+
+
+def hash_dedupe_keys(df: pd.DataFrame) -> np.ndarray:
+    """
+    64 bit hash per row of the dedupe cols. The cols are normalized first so
+    typed db rows and freshly imported rows hash alike
+    """
+    keys = pd.DataFrame({
+        TransDBSchema.PAYEE: df[TransDBSchema.PAYEE].astype(object),
+        TransDBSchema.AMOUNT: df[TransDBSchema.AMOUNT].astype(float),
+        TransDBSchema.DATE: pd.to_datetime(df[TransDBSchema.DATE]),
+    })
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+class DedupeIndex:
+    def __init__(self,
+                 file_io: FileIO,
+                 path_from_data_root: str = 'trans_db_index'):
+        self._file_io = file_io
+        self.path_from_data_root = path_from_data_root
+        self._month_hashes: Dict[int, np.ndarray] = {}
+        self._all_hashes: Optional[np.ndarray] = None
+
+    def load_month(self, period: int, path: str) -> None:
+        """ load the stored hashes of a month """
+        hashes = self._file_io.load_file(path)[HASH_COL].to_numpy(dtype=np.uint64)
+        self._set_month(period, hashes)
+
+    def update_month(self, period: int, month_df: pd.DataFrame) -> None:
+        """
+        replace the hashes of a month with those of its current rows and save
+        them
+        :param period: period key of the month
+        :param month_df: all the rows of the month, at least the dedupe cols
+        """
+        hashes = np.unique(hash_dedupe_keys(month_df))
+        self._set_month(period, hashes)
+        path = Path(self.path_from_data_root) / str(period // 100) / f'{period % 100}.pq'
+        self._file_io.save_file(str(path), pd.DataFrame({HASH_COL: hashes}))
+
+    def contains(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        :return: boolean array, True where the row's dedupe key may already be
+                 stored. False is certain, True has to be checked against the
+                 stored rows
+        """
+        if self._all_hashes is None:
+            self._all_hashes = np.unique(np.concatenate(
+                [np.empty(0, dtype=np.uint64), *self._month_hashes.values()]))
+        return np.isin(hash_dedupe_keys(df), self._all_hashes)
+
+    def _set_month(self, period: int, hashes: np.ndarray) -> None:
+        self._month_hashes[period] = hashes
+        self._all_hashes = None
@@ -1,6 +1,7 @@
 class TransIDs:
     TRANS_TBL = 'trans_table'
     TRANS_TBL_DIV = 'trans_table_div'
+    TRANS_TBL_TOTALS = 'trans_table_totals'
     CAT_PICKER = 'category_picker'
     ACC_PICKER = 'account_picker'
     GROUP_PICKER = 'group_picker'
@@ -44,6 +45,10 @@ class MonthlyIDs:
     URL = 'url'
     DUMMY_DIV = 'dummy_div'
     TRANS_DRAWER = 'trans_drawer'
+    CUSTOM_PERIOD_PICKER = 'custom_period_picker'
+    CUSTOM_PERIOD_ACCORDION = 'custom_period_accordion'
+    NOTIF_CARD = 'notif_card'
+    BALANCE_FIG = 'balance_fig'
 
 
 class BreakdownIDs:
@@ -53,6 +58,16 @@ class BreakdownIDs:
     BUDGET_USAGE_FIG = 'budget_usage_fig'
     BUDGET_USAGE_TITLE = 'budget_usage_title'
     BUDGET_USAGE_DD = 'budget_usage_dd'
+    TRENDS_DD = 'trends_dd'
+    TRENDS_FIG = 'trends_fig'
+    TRENDS_TABLE = 'trends_table'
+    COMPARISON_DD = 'comparison_dd'
+    COMPARISON_BY_DD = 'comparison_by_dd'
+    COMPARISON_FIG = 'comparison_fig'
+    TOP_PAYEES_MONTH_DD = 'top_payees_month_dd'
+    TOP_PAYEES_GROUP_DD = 'top_payees_group_dd'
+    TOP_PAYEES_BY_DD = 'top_payees_by_dd'
+    TOP_PAYEES_FIG = 'top_payees_fig'
 
 
 class CatIDs:
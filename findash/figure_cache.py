@@ -0,0 +1,162 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache, wraps
+from pathlib import Path
+from typing import Callable, Optional
+
+import plotly.graph_objects as go
+
+"""
+Cache of built plotly figures. A figure is identified by its builder, the
+builder's arguments and a data token - a content hash of the data it is built
+from (see TransactionsDBParquet.get_data_token and CategoriesDB.get_data_token).
+Figures are kept as serialized json with LRU eviction, and optionally also
+written to a directory so a fresh worker can serve the last figures without
+building them. Intermediate data shared by several figures is memoized per
+version of the data with memoize_per_version.
+"""
+
+logger = logging.getLogger('Logger')
+
+
+class FigureCache:
+    def __init__(self, max_size: int = 64, cache_dir: Optional[str] = None):
+        """
+        :param max_size: max number of figures kept, in memory and on disk
+        :param cache_dir: if given, figures are persisted to this directory
+        """
+        self._max_size = max_size
+        self._cache_dir = Path(cache_dir) if cache_dir else None
+        self._figures: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self._cache_dir is not None:
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+            self._prune_dir()
+
+    def get_or_build(self,
+                     builder: Callable[..., go.Figure],
+                     args: tuple,
+                     data_token: str) -> dict:
+        """
+        :return: the figure as a dict, to be passed to dcc.Graph. Every call
+                 returns a new dict so callers may modify it
+        """
+        key = self._get_key(builder, args, data_token)
+        with self._lock:
+            fig_json = self._figures.get(key)
+            if fig_json is not None:
+                self._figures.move_to_end(key)
+        if fig_json is None:
+            fig_json = self._load_from_dir(key)
+            if fig_json is not None:
+                self._put(key, fig_json, persist=False)
+
+        if fig_json is not None:
+            self.hits += 1
+            return json.loads(fig_json)
+
+        self.misses += 1
+        fig_json = builder(*args).to_json()
+        self._put(key, fig_json, persist=True)
+        return json.loads(fig_json)
+
+    def cached(self, get_data_token: Callable[[], str]):
+        """
+        decorator of a figure builder, caching its figures under the token
+        get_data_token returns when called
+        """
+        def decorator(builder: Callable[..., go.Figure]):
+            @wraps(builder)
+            def wrapper(*args):
+                return self.get_or_build(builder, args, get_data_token())
+            return wrapper
+        return decorator
+
+    def clear(self) -> None:
+        with self._lock:
+            keys = list(self._figures)
+            self._figures.clear()
+        for key in keys:
+            self._remove_from_dir(key)
+
+    def __len__(self):
+        return len(self._figures)
+
+    @staticmethod
+    def _get_key(builder: Callable, args: tuple, data_token: str) -> str:
+        name = f'{builder.__module__}.{builder.__qualname__}'
+        return hashlib.md5(f'{name}|{args!r}|{data_token}'.encode()).hexdigest()
+
+    def _put(self, key: str, fig_json: str, persist: bool) -> None:
+        with self._lock:
+            self._figures[key] = fig_json
+            self._figures.move_to_end(key)
+            evicted = []
+            while len(self._figures) > self._max_size:
+                evicted.append(self._figures.popitem(last=False)[0])
+
+        if persist:
+            self._save_to_dir(key, fig_json)
+        for evicted_key in evicted:
+            self._remove_from_dir(evicted_key)
+
+    def _get_path(self, key: str) -> Path:
+        return self._cache_dir / f'{key}.json'
+
+    def _load_from_dir(self, key: str) -> Optional[str]:
+        if self._cache_dir is None:
+            return None
+        try:
+            return self._get_path(key).read_text()
+        except FileNotFoundError:
+            return None
+
+    def _save_to_dir(self, key: str, fig_json: str) -> None:
+        if self._cache_dir is None:
+            return
+        try:
+            # write then rename so other workers never read a partial file
+            tmp_path = self._get_path(key).with_suffix(f'.{threading.get_ident()}.tmp')
+            tmp_path.write_text(fig_json)
+            tmp_path.replace(self._get_path(key))
+        except OSError:
+            logger.exception(f'failed to persist figure {key}')
+
+    def _remove_from_dir(self, key: str) -> None:
+        if self._cache_dir is not None:
+            self._get_path(key).unlink(missing_ok=True)
+
+    def _prune_dir(self) -> None:
+        """ keep only the max_size most recently written figures on disk """
+        paths = sorted(self._cache_dir.glob('*.json'), key=lambda path: path.stat().st_mtime,
+                       reverse=True)
+        for path in paths[self._max_size:]:
+            path.unlink(missing_ok=True)
+
+
+def memoize_per_version(get_version: Callable[[], int], max_size: int = 32):
+    """
+    decorator memoizing the results of a function per its args and the
+    version get_version returns when called. The entries are kept in an
+    lru_cache, which is safe to share between threads and evicts the entries
+    of older versions as those of new ones are added
+    """
+    def decorator(func: Callable):
+        @lru_cache(maxsize=max_size)
+        def cached(version: int, *args):
+            return func(*args)
+
+        @wraps(func)
+        def wrapper(*args):
+            return cached(get_version(), *args)
+
+        wrapper.cache_info = cached.cache_info
+        wrapper.cache_clear = cached.cache_clear
+        return wrapper
+    return decorator
@@ -1,5 +1,11 @@
+import atexit
+import hashlib
 import json
+import logging
+import os
 import pickle
+import queue
+import threading
 from collections import defaultdict
 from io import BytesIO
 from pathlib import Path
@@ -8,9 +14,13 @@ from abc import ABC, abstractmethod
 
 import boto3
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import yaml
 from botocore.exceptions import ClientError
 
+logger = logging.getLogger('Logger')
+
 
 class Ftype:
     JSON = 'json'
@@ -29,14 +39,21 @@ class FileIO(ABC):
             else str(Path(self._data_root).joinpath(path))
         )
 
-    def save_file(self, save_path: str, data: Any, ftype: Optional[Ftype] = None):
+    def save_file(self,
+                  save_path: str,
+                  data: Any,
+                  ftype: Optional[Ftype] = None,
+                  schema: Optional[pa.Schema] = None):
+        """
+        :param schema: optional arrow schema to enforce when writing parquet files
+        """
         save_path = self._add_root_prefix(save_path)
         if ftype == Ftype.JSON or save_path.endswith('.json'):
             self._save_json(data, save_path)
         elif ftype == Ftype.PARQUET or \
                 save_path.endswith('.parquet') or \
                 save_path.endswith('.pq'):
-            self._save_parquet(data, save_path)
+            self._save_parquet(data, save_path, schema)
         else:
             raise ValueError(f'Unknown file type: {ftype} or file extension: {save_path}')
 
@@ -50,6 +67,29 @@ class FileIO(ABC):
         else:
             raise ValueError(f'Unknown file type: {ftype} or file extension: {load_path}')
 
+    def load_table(self,
+                   load_path: str,
+                   schema: Optional[pa.Schema] = None,
+                   columns: Optional[List[str]] = None) -> pa.Table:
+        """
+        load a parquet file as an arrow table
+        :param schema: if given, the file must have been written with this schema
+        :param columns: if given, read only these columns
+        """
+        load_path = self._add_root_prefix(load_path)
+        table = self._read_table(load_path, columns)
+        if schema is not None and columns is not None:
+            schema = pa.schema([schema.field(col) for col in columns])
+        if schema is not None and not table.schema.equals(schema):
+            raise ValueError(f'{load_path} does not match the expected schema, '
+                             f'migrate it with migrate_trans_db.py')
+        return table
+
+    @staticmethod
+    def _get_parquet_write_args(schema: Optional[pa.Schema]) -> Dict[str, Any]:
+        # the index is not part of an explicit schema
+        return {} if schema is None else {'schema': schema, 'index': False}
+
     @abstractmethod
     def get_dirs_in_dir(
             self,
@@ -74,18 +114,28 @@ class FileIO(ABC):
     def _read_parquet(self, load_path: str) -> Any:
         pass
 
+    @abstractmethod
+    def _read_table(self, load_path: str, columns: Optional[List[str]] = None) -> pa.Table:
+        pass
+
     @abstractmethod
     def _save_json(self, data: Any, save_path: str) -> None:
         pass
 
     @abstractmethod
-    def _save_parquet(self, data: Any, save_path: str) -> None:
+    def _save_parquet(self, data: Any, save_path: str,
+                      schema: Optional[pa.Schema] = None) -> None:
         pass
 
     @abstractmethod
     def read_yaml(self, load_path: str) -> Any:
         pass
 
+    @abstractmethod
+    def get_content_hash(self, path: str) -> str:
+        """ md5 hex digest of a file's content, computed without parsing it """
+        pass
+
 
 class LocalIO(FileIO):
     def __init__(self, data_root: str):
@@ -100,6 +150,10 @@ class LocalIO(FileIO):
         with open(load_path) as f:
             return json.load(f)
 
+    def get_content_hash(self, path: str) -> str:
+        path = self._add_root_prefix(path)
+        return hashlib.md5(Path(path).read_bytes()).hexdigest()
+
     def _read_parquet(self, load_path: str) -> Any:
         try:
             return pd.read_parquet(load_path)
@@ -108,15 +162,19 @@ class LocalIO(FileIO):
                 f'Unknown data type for ' f'parquet(only support pd.DataFrame: {e}'
             ) from e
 
+    def _read_table(self, load_path: str, columns: Optional[List[str]] = None) -> pa.Table:
+        return pq.read_table(load_path, columns=columns)
+
     def _save_json(self, data: Any, save_path: str) -> None:
         with open(save_path, 'w') as f:
             json.dump(data, f, indent=4, ensure_ascii=False)
 
-    def _save_parquet(self, data: Any, save_path: str) -> None:
+    def _save_parquet(self, data: Any, save_path: str,
+                      schema: Optional[pa.Schema] = None) -> None:
         save_path = Path(save_path)
         save_path.parent.mkdir(parents=True, exist_ok=True)
         if isinstance(data, pd.DataFrame):
-            data.to_parquet(save_path)
+            data.to_parquet(save_path, **self._get_parquet_write_args(schema))
         else:
             raise ValueError(f'Unknown data type for parquet: {type(data)}')
 
@@ -174,9 +232,11 @@ class Bucket(FileIO):
             json.loads(Bucket._read_bytes_from_s3_obj(obj).decode()),
         )
 
-    def _save_parquet(self, data, save_path: str) -> None:
+    def _save_parquet(self, data, save_path: str,
+                      schema: Optional[pa.Schema] = None) -> None:
         if isinstance(data, pd.DataFrame):
-            data.to_parquet(f's3://{self._bucket_name}/{save_path}')
+            data.to_parquet(f's3://{self._bucket_name}/{save_path}',
+                            **self._get_parquet_write_args(schema))
         else:
             raise ValueError(f'Unknown data type for parquet: {type(data)}')
 
@@ -188,6 +248,9 @@ class Bucket(FileIO):
                 f'Unknown data type for ' f'parquet(only support pd.DataFrame: {e}'
             ) from e
 
+    def _read_table(self, load_path: str, columns: Optional[List[str]] = None) -> pa.Table:
+        return pq.read_table(f's3://{self._bucket_name}/{load_path}', columns=columns)
+
     def write_pickle(self, data, path: str) -> None:
         self._s3_res.Object(self._bucket_name, path).put(
             Body=pickle.dumps(data, protocol=4)
@@ -226,6 +289,10 @@ class Bucket(FileIO):
         obj = self._s3.get_object(Bucket=self._bucket_name, Key=path)
         return Bucket._read_bytes_from_s3_obj(obj)
 
+    def get_key(self, path: str) -> str:
+        """ the object key of a path from the data root """
+        return self._add_root_prefix(path)
+
     def write_from_local_file(self, local_file_path: str, path: str) -> None:
         self._s3.upload_file(
             local_file_path,
@@ -234,6 +301,21 @@ class Bucket(FileIO):
             ExtraArgs=Bucket._get_extra_args(path),
         )
 
+    def download_to_local_file(self, path: str, local_file_path: str) -> None:
+        Path(local_file_path).parent.mkdir(parents=True, exist_ok=True)
+        self._s3.download_file(self._bucket_name, path, local_file_path)
+
+    def get_etags(self) -> Dict[str, str]:
+        """
+        ETags of all the objects under the data root
+        :return: dict of path from the data root: ETag without quotes
+        """
+        prefix = f'{self._data_root}/' if self._data_root else ''
+        bucket = self._s3_res.Bucket(self._bucket_name)
+        return {obj.key[len(prefix):]: obj.e_tag.strip('"')
+                for obj in bucket.objects.filter(Prefix=prefix)
+                if not obj.key.endswith('/')}
+
     def copy_file(self, src_path: str, dst_path: str) -> None:
         self._s3_res.Object(self._bucket_name, dst_path).copy_from(
             CopySource=f"{self._bucket_name}/{src_path}"
@@ -300,6 +382,11 @@ class Bucket(FileIO):
             files_by_subdir[dir_name].append(file_name)
         return {k: v for k, v in files_by_subdir.items()}
 
+    def get_content_hash(self, path: str) -> str:
+        # the ETag of objects uploaded in a single part is their md5
+        path = self._add_root_prefix(path)
+        return self._s3.head_object(Bucket=self._bucket_name, Key=path)['ETag'].strip('"')
+
     def path_exists(self, path: str) -> bool:
         try:
             self._s3.head_object(Bucket=self._bucket_name, Key=path)
@@ -337,3 +424,134 @@ class Bucket(FileIO):
         )
         ext = path.rsplit(".", 1)[-1]
         return types.get(ext)
+
+
+class LocalFirstIO(LocalIO):
+    """
+    Serves all reads and writes from a local directory and keeps a bucket as
+    the durable copy. Saved files are uploaded by a background thread, skipping
+    files whose content did not change since they were last synced. Call
+    sync_from_bucket at startup to pull the objects that differ from the local
+    copies.
+
+    Content is compared by md5, which is the ETag of objects uploaded in a
+    single part - all the files of the app are far below the multipart size.
+    """
+    _SYNC_STATE_PATH = '.sync_state.json'
+
+    def __init__(self, data_root: str, bucket: Bucket):
+        super().__init__(data_root)
+        self._bucket = bucket
+        # md5 of every file as it was last synced with the bucket, by path
+        # from the data root
+        self._synced_hashes: Dict[str, str] = self._load_sync_state()
+        # held while a path is compared with its synced md5 and synced, the
+        # upload worker and sync_from_bucket may handle the same path
+        self._state_lock = threading.RLock()
+        self._upload_queue: queue.Queue = queue.Queue()
+        threading.Thread(target=self._upload_worker, name='bucket-sync',
+                         daemon=True).start()
+        atexit.register(self.flush)
+
+    def save_file(self,
+                  save_path: str,
+                  data: Any,
+                  ftype: Optional[Ftype] = None,
+                  schema: Optional[pa.Schema] = None):
+        super().save_file(save_path, data, ftype, schema)
+        self._upload_queue.put(self._to_relative_path(save_path))
+
+    def sync_from_bucket(self) -> None:
+        """
+        pull the objects whose ETag differs from the local copy. A local file
+        that changed since it was last synced was not uploaded yet (e.g. the app
+        stopped before the upload), so it is pushed instead of overwritten
+        """
+        remote_hashes = self._bucket.get_etags()
+        for path, etag in remote_hashes.items():
+            with self._state_lock:
+                self._sync_from_bucket(path, etag)
+
+        for local_path in Path(self._data_root).rglob('*'):
+            path = self._to_relative_path(str(local_path))
+            if local_path.is_file() and path not in remote_hashes \
+                    and path != self._SYNC_STATE_PATH:
+                self._upload_queue.put(path)
+
+    def _sync_from_bucket(self, path: str, etag: str) -> None:
+        local_hash = self._get_local_hash(path)
+        if local_hash == etag:
+            self._set_synced_hash(path, etag)
+        elif local_hash is not None and local_hash != self._synced_hashes.get(path):
+            logger.warning(f'{path} has local changes that were not synced, '
+                           f'pushing it to the bucket')
+            self._upload_queue.put(path)
+        else:
+            self._bucket.download_to_local_file(self._bucket.get_key(path),
+                                                self._add_root_prefix(path))
+            self._set_synced_hash(path, etag)
+            logger.info(f'pulled {path} from the bucket')
+
+    def flush(self) -> None:
+        """ block until all the pending uploads are done """
+        self._upload_queue.join()
+
+    def _upload_worker(self) -> None:
+        while True:
+            path = self._upload_queue.get()
+            try:
+                self._upload(path)
+            except Exception:  # the file is uploaded again on its next save
+                logger.exception(f'failed to upload {path} to the bucket')
+            finally:
+                self._upload_queue.task_done()
+
+    def _upload(self, path: str) -> None:
+        with self._state_lock:
+            local_hash = self._get_local_hash(path)
+            if local_hash is None or local_hash == self._synced_hashes.get(path):
+                return
+
+            self._bucket.write_from_local_file(self._add_root_prefix(path),
+                                               self._bucket.get_key(path))
+            self._set_synced_hash(path, local_hash)
+
+    def _get_local_hash(self, path: str) -> Optional[str]:
+        if not Path(self._add_root_prefix(path)).is_file():
+            return None
+        return self.get_content_hash(path)
+
+    def _to_relative_path(self, path: str) -> str:
+        return Path(self._add_root_prefix(path)).relative_to(self._data_root).as_posix()
+
+    def _load_sync_state(self) -> Dict[str, str]:
+        state_path = Path(self._add_root_prefix(self._SYNC_STATE_PATH))
+        return self._read_json(str(state_path)) if state_path.is_file() else {}
+
+    def _set_synced_hash(self, path: str, md5: str) -> None:
+        with self._state_lock:
+            self._synced_hashes[path] = md5
+            # written directly, the sync state itself is not uploaded
+            Path(self._data_root).mkdir(parents=True, exist_ok=True)
+            self._save_json(self._synced_hashes,
+                            self._add_root_prefix(self._SYNC_STATE_PATH))
+
+
+def create_file_io(env_name: str) -> FileIO:
+    """
+    the file io of an env, configured by the env vars of its .env file
+    :param env_name: 'stag', 'prod_local', 'prod' or 'prod_hybrid'
+    """
+    if env_name in ['stag', 'prod_local']:
+        return LocalIO(os.environ.get("DATA_PATH"))
+    elif env_name == 'prod':
+        return Bucket(os.environ.get("BUCKET_NAME"),
+                      os.environ.get("APP_NAME"))
+    elif env_name == 'prod_hybrid':
+        file_io = LocalFirstIO(os.environ.get("DATA_PATH"),
+                               Bucket(os.environ.get("BUCKET_NAME"),
+                                      os.environ.get("APP_NAME")))
+        file_io.sync_from_bucket()
+        return file_io
+    else:
+        raise ValueError(f'Invalid env name: {env_name} for file io creation')
@@ -0,0 +1,227 @@
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+from findash.aggregates import get_period_keys
+from findash.file_io import FileIO
+from findash.trans_schema import TransDBSchema
+
+"""
+Background verifier of the stored transaction partitions. A partition is
+checked when its content hash or the hash of its rows in memory changed since
+it last passed, so a scan of an unchanged db reads no partitions. Checked
+partitions go through vectorized consistency rules and are compared to the rows
+TransactionsDBParquet holds in memory. Only the months the db reports changed
+since the previous scan are hashed in memory, and the rollup cube and the prefix
+sums are verified against a rebuild of those months only.
+"""
+
+logger = logging.getLogger('Logger')
+
+
+@dataclass
+class Discrepancy:
+    partition: str
+    check: str
+    detail: str
+    trans_ids: List[str] = field(default_factory=list)
+
+
+def hash_month_rows(df: pd.DataFrame) -> pd.Series:
+    """
+    order independent hash of the resident cols of each month's rows
+    :return: series of period key: hash
+    """
+    row_hashes = _hash_rows(df)
+    return row_hashes.groupby(get_period_keys(df[TransDBSchema.DATE]).to_numpy()).sum()
+
+
+def _hash_rows(df: pd.DataFrame) -> pd.Series:
+    return pd.util.hash_pandas_object(df[TransDBSchema.get_resident_cols()], index=False)
+
+
+def check_partition(df: pd.DataFrame, period: int, partition: str) -> List[Discrepancy]:
+    """ consistency rules every stored partition must pass """
+    discrepancies = []
+
+    def add(check: str, detail: str, mask: pd.Series):
+        if mask.any():
+            discrepancies.append(Discrepancy(partition, check, detail,
+                                             df.loc[mask, TransDBSchema.ID].tolist()))
+
+    add('duplicate_id', 'ids appear more than once',
+        df[TransDBSchema.ID].duplicated(keep=False))
+    add('wrong_month', 'rows are dated outside the month of the partition',
+        get_period_keys(df[TransDBSchema.DATE]) != period)
+
+    # amount holds the signed value of the single non zero flow col, whatever
+    # the inflow sign convention of the account
+    flows = df[TransDBSchema.INFLOW].abs() + df[TransDBSchema.OUTFLOW].abs()
+    add('amount_mismatch', 'amount does not match inflow and outflow',
+        ~np.isclose(df[TransDBSchema.AMOUNT].abs(), flows))
+    add('inflow_and_outflow', 'both inflow and outflow are set',
+        (df[TransDBSchema.INFLOW] != 0) & (df[TransDBSchema.OUTFLOW] != 0))
+
+    # a split replaces its transaction with parts numbered 1..n of one group
+    split_parts = df[TransDBSchema.SPLIT].dropna().str.split('-', expand=True)
+    if len(split_parts):
+        parts = split_parts[1].astype(int)
+        groups = parts.groupby(split_parts[0])
+        incomplete = groups.transform('count').lt(2) | \
+            groups.transform('max').ne(groups.transform('count')) | \
+            groups.transform('min').ne(1)
+        add('incomplete_split', 'split groups are missing parts',
+            df.index.isin(incomplete[incomplete].index))
+
+    return discrepancies
+
+
+def compare_to_memory(stored: pd.DataFrame, resident: pd.DataFrame,
+                      partition: str) -> List[Discrepancy]:
+    """ compare a partition to the rows of its month held in memory """
+    stored_hashes = pd.Series(_hash_rows(stored).to_numpy(),
+                              index=stored[TransDBSchema.ID])
+    resident_hashes = pd.Series(_hash_rows(resident).to_numpy(),
+                                index=resident[TransDBSchema.ID])
+    discrepancies = []
+    only_stored = stored_hashes.index.difference(resident_hashes.index)
+    if len(only_stored):
+        discrepancies.append(Discrepancy(partition, 'not_in_memory',
+                                         'stored rows are missing in memory',
+                                         only_stored.tolist()))
+    only_resident = resident_hashes.index.difference(stored_hashes.index)
+    if len(only_resident):
+        discrepancies.append(Discrepancy(partition, 'not_stored',
+                                         'rows in memory were not stored',
+                                         only_resident.tolist()))
+    both = stored_hashes.index.intersection(resident_hashes.index)
+    differ = both[stored_hashes[both].to_numpy() != resident_hashes[both].to_numpy()]
+    if len(differ):
+        discrepancies.append(Discrepancy(partition, 'differs_from_memory',
+                                         'stored rows differ from memory',
+                                         differ.tolist()))
+    return discrepancies
+
+
+class IntegrityScanner:
+    def __init__(self,
+                 file_io: FileIO,
+                 trans_db,  # TransactionsDBParquet, not imported to avoid a cycle
+                 manifest_path: str = 'trans_db_integrity.json'):
+        self._file_io = file_io
+        self._trans_db = trans_db
+        self._manifest_path = manifest_path
+        # partition path: [content hash, hash of its rows in memory] of the
+        # last time it passed all checks
+        self._manifest: Dict[str, list] = self._load_manifest()
+        self.discrepancies: List[Discrepancy] = []
+        # version of the db the last scan completed on, and the hashes of the
+        # rows in memory per period key (None for cold months) as of that scan
+        self._scanned_version: Optional[int] = None
+        self._memory_hashes: Dict[int, Optional[str]] = {}
+        self._stop = threading.Event()
+
+    def scan(self) -> List[Discrepancy]:
+        """
+        check the partitions that changed since they last passed
+        :return: the discrepancies found, also kept in self.discrepancies
+        """
+        version = self._trans_db.version
+        scanned_manifest = dict(self._manifest)
+        changed_periods = self._trans_db.get_changed_periods(self._scanned_version)
+        db = self._trans_db.snapshot().db
+        self._update_memory_hashes(db, changed_periods)
+
+        discrepancies = []
+        partitions = self._trans_db.list_partitions()
+        for period, partition in partitions.items():
+            content_hash = self._file_io.get_content_hash(partition)
+            memory_hash = self._memory_hashes.get(period)
+            signature = [content_hash, memory_hash]
+            if self._manifest.get(partition) == signature:
+                continue
+
+            partition_discrepancies = self._check(partition, period, db, memory_hash)
+            if self._trans_db.version != version:
+                # written during the scan, check it again on the next one
+                continue
+            if len(partition_discrepancies):
+                discrepancies.extend(partition_discrepancies)
+            else:
+                self._manifest[partition] = signature
+
+        drift = []
+        if len(changed_periods) and not self._trans_db.verify_cube(changed_periods):
+            drift.append(Discrepancy('rollup cube', 'cube_drift',
+                                     'the rollup cube differs from a rebuild'))
+        if len(changed_periods) and not self._trans_db.verify_prefix_sums(changed_periods):
+            drift.append(Discrepancy('prefix sums', 'prefix_sums_drift',
+                                     'the prefix sums differ from a rebuild'))
+        discrepancies.extend(drift)
+
+        partition_paths = set(partitions.values())
+        self._manifest = {path: signature for path, signature in self._manifest.items()
+                          if path in partition_paths}
+        if self._manifest != scanned_manifest:
+            self._save_manifest()
+        if not len(drift):
+            # months that drifted are verified again on the next scan
+            self._scanned_version = version
+
+        self.discrepancies = discrepancies
+        for discrepancy in discrepancies:
+            logger.warning(f'integrity: {discrepancy.partition} {discrepancy.check} - '
+                           f'{discrepancy.detail} ({len(discrepancy.trans_ids)} rows)')
+        return discrepancies
+
+    def _update_memory_hashes(self, db: pd.DataFrame, periods: Set[int]) -> None:
+        """ rehash the rows in memory of the given months """
+        if not len(periods):
+            return
+
+        cold_periods = self._trans_db.cold_periods
+        rows = db[get_period_keys(db[TransDBSchema.DATE]).isin(list(periods - cold_periods))]
+        hashes = hash_month_rows(rows)
+        for period in periods:
+            self._memory_hashes[period] = None if period in cold_periods else \
+                str(hashes.get(period, 0))
+
+    def _check(self, partition: str, period: int, db: pd.DataFrame,
+               memory_hash: Optional[str]) -> List[Discrepancy]:
+        try:
+            stored = self._file_io.load_table(
+                partition, TransDBSchema.get_arrow_schema()).to_pandas()
+        except Exception as e:
+            return [Discrepancy(partition, 'unreadable', str(e))]
+
+        discrepancies = check_partition(stored, period, partition)
+        if memory_hash is not None:
+            resident = db[get_period_keys(db[TransDBSchema.DATE]) == period]
+            discrepancies.extend(compare_to_memory(stored, resident, partition))
+        return discrepancies
+
+    def start(self, interval_sec: float) -> None:
+        """ scan every interval_sec seconds in a background thread """
+        def run():
+            while not self._stop.wait(interval_sec):
+                try:
+                    self.scan()
+                except Exception:
+                    logger.exception('integrity scan failed')
+
+        threading.Thread(target=run, name='integrity-scan', daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _load_manifest(self) -> Dict[str, list]:
+        if self._manifest_path not in self._file_io.get_files_in_dir(''):
+            return {}
+        return self._file_io.load_file(self._manifest_path)
+
+    def _save_manifest(self) -> None:
+        self._file_io.save_file(self._manifest_path, self._manifest)
@@ -12,7 +12,10 @@ import dash_auth
 from findash.transactions_db import TransactionsDBParquet, TransDBSchema
 from findash.categories_db import CategoriesDB
 from findash.accounts import ACCOUNTS, init_accounts
-from findash.file_io import Bucket, LocalIO
+from findash.file_io import create_file_io
+from findash.integrity import IntegrityScanner
+from findash.figure_cache import FigureCache
+from findash.trends import TrendEngine
 
 
 VALID_USERNAME_PASSWORD_PAIRS = {
@@ -42,7 +45,9 @@ def setup_trans_db(cat_db: CategoriesDB):
     :param cat_db:
     :return:
     """
-    trans_db = TransactionsDBParquet(file_io, cat_db, ACCOUNTS)
+    hot_months = os.environ.get("HOT_MONTHS")
+    trans_db = TransactionsDBParquet(file_io, cat_db, ACCOUNTS,
+                                     hot_months=int(hot_months) if hot_months else None)
 
     # if load_type == 'dummy':
     #     trans_gen = TransGenerator(60)
@@ -132,18 +137,7 @@ def setup_app():
     return app
 
 
-def _create_file_io():
-    if ENV_NAME in ['stag', 'prod_local']:
-        return LocalIO(os.environ.get("DATA_PATH"))
-    elif ENV_NAME == 'prod':
-        return Bucket(os.environ.get("BUCKET_NAME"),
-                      os.environ.get("APP_NAME"))
-    else:
-        raise ValueError(f'Invalid env name: {ENV_NAME} for file io creation')
-
-
-
-file_io = _create_file_io()
+file_io = create_file_io(ENV_NAME)
 init_accounts(file_io)
 
 # _validate_accounts(ACCOUNTS)
@@ -154,6 +148,17 @@ logger.info('Created cat db')
 TRANS_DB = setup_trans_db(CAT_DB)
 logger.info('Created trans db')
 
+TREND_ENGINE = TrendEngine(TRANS_DB)
+ROLLOVER_ENGINE = TRANS_DB.rollover_engine
+
+# the background scan runs only in envs that set its interval
+INTEGRITY_SCANNER = IntegrityScanner(file_io, TRANS_DB)
+if os.environ.get("INTEGRITY_SCAN_MINUTES"):
+    INTEGRITY_SCANNER.start(float(os.environ.get("INTEGRITY_SCAN_MINUTES")) * 60)
+
+FIGURE_CACHE = FigureCache(int(os.environ.get("FIGURE_CACHE_SIZE", 64)),
+                           os.environ.get("FIGURE_CACHE_DIR"))
+
 app = setup_app()
 server = app.server
 
@@ -0,0 +1,65 @@
+import logging
+import sys
+from typing import List
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from findash.file_io import FileIO, create_file_io
+from findash.transactions_db import TransDBSchema, apply_dtypes, conform_to_schema
+
+"""
+One-shot tool for migrating transaction partitions that were written before the
+partitions had an explicit schema. Every partition is cast to the dtypes of
+TransDBSchema and rewritten with its arrow schema, after which
+TransactionsDBParquet.connect loads it without any casting.
+
+usage: python migrate_trans_db.py <env_name>
+The partitions are read and written with the file io of the env (see
+file_io.create_file_io), configured by its .env file as in main.py.
+"""
+
+logger = logging.getLogger('Logger')
+
+
+def migrate_trans_db(file_io: FileIO, trans_db_path: str = 'trans_db') -> List[str]:
+    """
+    rewrite all transaction partitions with the db schema. Partitions that
+    already match it are left untouched
+    :param file_io: file io of the data root
+    :param trans_db_path: path of the transactions db from the data root
+    :return: paths of the migrated partitions
+    """
+    schema = TransDBSchema.get_arrow_schema()
+    migrated = []
+    for year_dir in file_io.get_dirs_in_dir(trans_db_path, full_paths=True):
+        for file in file_io.get_files_in_dir(year_dir, full_paths=True):
+            if file_io.load_table(file).schema.equals(schema):
+                continue
+
+            df = _add_missing_cols(file_io.load_file(file))
+            df = apply_dtypes(df, include_date=True)
+            file_io.save_file(file, conform_to_schema(df), schema=schema)
+            migrated.append(file)
+            logger.info(f'migrated {file} to the transactions schema')
+
+    return migrated
+
+
+def _add_missing_cols(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    add cols that were added to the schema after the partition was written
+    """
+    for col_name, default_val in TransDBSchema.get_non_mandatory_cols().items():
+        if col_name not in df.columns:
+            df[col_name] = default_val
+
+    return df
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    env_name = sys.argv[1]
+    load_dotenv(f'.env.{env_name}')
+    for path in migrate_trans_db(create_file_io(env_name)):
+        print(f'migrated {path}')
@@ -1,7 +1,8 @@
 import base64
 import datetime
 import io
-from typing import List, Tuple, Union, Any, Optional
+from functools import reduce
+from typing import Dict, List, Tuple, Union, Any, Optional
 
 import pandas as pd
 import dash
@@ -11,14 +12,16 @@ import dash_mantine_components as dmc
 
 from element_ids import TransIDs
 from main import TRANS_DB, CAT_DB
-from page_elements.transactions_layout_creators import _create_main_trans_table
+from page_elements.transactions_layout_creators import _create_main_trans_table, \
+    create_table_totals
 from page_elements.transactions_split_window import _create_split_input_card, \
     _create_split_trans_table, create_split_trans_modal
 from shared_elements import create_split_fail, create_split_success, create_error_notif
 from transactions_db import TransDBSchema
+from aggregates import get_filter_totals
 from transactions_importer import import_file
 from utils import detect_changes_in_table, Change, \
-    get_add_row_change_obj, START_DATE_DEFAULT, ChangeType
+    get_add_row_change_obj, START_DATE_DEFAULT, ChangeType, format_date_col_for_display
 from page_elements.transactions_layout_creators import create_trans_table
 
 
@@ -72,6 +75,7 @@ def _split_amounts_eq_orig(row_amount, split_amounts):
     Output(TransIDs.TRANS_TBL_DIV, 'children'),
     Output(TransIDs.SPLIT_TBL_DIV, 'children'),
     Output(TransIDs.NOTIF_DIV, 'children'),
+    Output(TransIDs.TRANS_TBL_TOTALS, 'children', allow_duplicate=True),
     Input(TransIDs.APPLY_SPLIT_BTN, 'n_clicks'),
     State(TransIDs.SPLIT_TBL, 'derived_virtual_data'),
     State(TransIDs.SPLIT_TBL, 'derived_virtual_selected_rows'),
@@ -92,9 +96,10 @@ def _apply_splits_callback(n_clicks,
         return \
             dash.no_update,\
             dash.no_update, \
-            create_split_fail("No transaction selected")
+            create_split_fail("No transaction selected"), \
+            dash.no_update
 
-    row = TRANS_DB.iloc[selected_row_original[0]]
+    row = TRANS_DB.snapshot().db.iloc[selected_row_original[0]]
     row_id = row[TransDBSchema.ID]
     row_amount = row[TransDBSchema.AMOUNT]
 
@@ -102,7 +107,8 @@ def _apply_splits_callback(n_clicks,
     if not _split_amounts_eq_orig(row_amount, split_amounts):
         return dash.no_update, dash.no_update, \
             create_split_fail(f"Split amount must equal original amount "
-                               f"({row_amount})")
+                               f"({row_amount})"), \
+            dash.no_update
 
     new_rows = TRANS_DB.apply_split(row_id, split_amounts, split_memos,
                                     split_cats)
@@ -116,7 +122,9 @@ def _apply_splits_callback(n_clicks,
     split_success_banner = create_split_success('Transaction '
                                                  'split successfully')
 
-    return main_table, split_trans_table, split_success_banner
+    # the main table is recreated unfiltered
+    totals = _create_filter_totals(None, None, None, None)
+    return main_table, split_trans_table, split_success_banner, totals
 
 
 def _create_new_split_table(filtered_data: List[dict],
@@ -141,13 +149,18 @@ def _create_new_split_table(filtered_data: List[dict],
 
 @dash.callback(
     Output(TransIDs.TRANS_TBL, 'data', allow_duplicate=True),
+    Output(TransIDs.TRANS_TBL_TOTALS, 'children', allow_duplicate=True),
     Input(TransIDs.ADD_ROW_BTN, 'n_clicks'),
+    State(TransIDs.CAT_PICKER, 'value'),
+    State(TransIDs.GROUP_PICKER, 'value'),
+    State(TransIDs.ACC_PICKER, 'value'),
+    State(TransIDs.DATE_PICKER, 'value'),
     config_prevent_initial_callbacks=True
 )
-def _add_row_callback(n_clicks):
+def _add_row_callback(n_clicks, *filter_values):
     change = get_add_row_change_obj()  # todo define the change obj here
     TRANS_DB.submit_change(change)
-    return TRANS_DB.get_records()
+    return TRANS_DB.get_records(), _create_filter_totals(*filter_values)
 
 
 @dash.callback(
@@ -172,31 +185,49 @@ def _delete_row_callback(data, data_prev):
 
 @dash.callback(
     Output(TransIDs.TRANS_TBL, 'data', allow_duplicate=True),
+    Output(TransIDs.TRANS_TBL_TOTALS, 'children', allow_duplicate=True),
     Input(TransIDs.ROW_DEL_CONFIRM_DIALOG, 'submit_n_clicks'),
     Input(TransIDs.ROW_DEL_CONFIRM_DIALOG, 'cancel_n_clicks'),
     State(TransIDs.CHANGE_STORE, 'data'),
+    State(TransIDs.CAT_PICKER, 'value'),
+    State(TransIDs.GROUP_PICKER, 'value'),
+    State(TransIDs.ACC_PICKER, 'value'),
+    State(TransIDs.DATE_PICKER, 'value'),
     config_prevent_initial_callbacks=True
 )
 def row_del_confirm_dialog_callback(submit_n_clicks: int,
                                     cancel_n_clicks: int,
-                                    change: dict):
+                                    change: dict,
+                                    *filter_values):
     triggered_props = list(ctx.triggered_prop_ids.keys())[0]
     if 'submit_n_clicks' in triggered_props:
         TRANS_DB.submit_change(Change.from_dict(change))
-        raise PreventUpdate
+        # the row is already gone from the table
+        return dash.no_update, _create_filter_totals(*filter_values)
     elif 'cancel_n_clicks' in triggered_props:
-        return TRANS_DB.get_records()
+        return TRANS_DB.get_records(), dash.no_update
     else:
         raise ValueError('Invalid trigger id when deleting row')
 
 
 @dash.callback(
     Output(TransIDs.TRANS_TBL, 'data', allow_duplicate=True),
+    Output(TransIDs.NOTIF_DIV, 'children', allow_duplicate=True),
+    Output(TransIDs.TRANS_TBL_TOTALS, 'children', allow_duplicate=True),
     Input(TransIDs.TRANS_TBL, "data"),
     Input(TransIDs.TRANS_TBL, "data_previous"),
+    State(TransIDs.CAT_PICKER, 'value'),
+    State(TransIDs.GROUP_PICKER, 'value'),
+    State(TransIDs.ACC_PICKER, 'value'),
+    State(TransIDs.DATE_PICKER, 'value'),
     config_prevent_initial_callbacks=True
 )
-def change_table_callback(data, data_prev):
+def change_table_callback(data, data_prev, *filter_values):
+    """
+    push the user's edits to the db. Only the edited rows are sent back - with
+    their new versions, or with the current db values for edits that were
+    rejected since someone else changed the row first
+    """
     if data is None or data_prev is None:
         raise PreventUpdate
 
@@ -210,15 +241,48 @@ def change_table_callback(data, data_prev):
         raise PreventUpdate
 
     changes: List[Change] = detect_changes_in_table(data, data_prev)
+    changes = [change for change in changes if change.col_name != TransDBSchema.VERSION]
+    if not len(changes):
+        raise PreventUpdate
 
+    stale_rows = []
+    applied_versions = {}  # several cells of a row may have been edited at once
     for change in changes:
-        TRANS_DB.submit_change(change)
-
-    return TRANS_DB.get_records()
+        change.row_version = applied_versions.get(change.trans_id, change.row_version)
+        if not TRANS_DB.submit_change(change):
+            stale_rows.append(change.row_ind)
+        elif change.row_version is not None and change.current_value != change.prev_value:
+            applied_versions[change.trans_id] = change.row_version + 1
+
+    patch = dash.Patch()
+    changed_rows = {change.row_ind: change.trans_id for change in changes}
+    table_cols = list(data.columns)
+    records = _get_table_records(list(changed_rows.values()), table_cols)
+    for row_ind, trans_id in changed_rows.items():
+        if trans_id in records:
+            patch[row_ind] = records[trans_id]
+
+    totals = _create_filter_totals(*filter_values)
+    if not len(stale_rows):
+        return patch, dash.no_update, totals
+
+    notif = create_error_notif(f'{len(stale_rows)} edits were not saved since the '
+                               f'transactions were changed by someone else. '
+                               f'Their current values are shown')
+    return patch, notif, totals
+
+
+def _get_table_records(trans_ids: List[str], table_cols: List[str]) -> dict:
+    """ table records of the given transactions, by id """
+    db = TRANS_DB.snapshot(full_rows=True).db
+    rows = db[db[TransDBSchema.ID].isin(trans_ids)]
+    rows = format_date_col_for_display(rows, TransDBSchema.DATE)[table_cols]
+    return {record[TransDBSchema.ID]: record for record in rows.to_dict('records')}
 
 
 @dash.callback(
     Output(TransIDs.TRANS_TBL, 'data', allow_duplicate=True),
+    Output(TransIDs.TRANS_TBL_TOTALS, 'children'),
     Input(TransIDs.CAT_PICKER, 'value'),
     Input(TransIDs.GROUP_PICKER, 'value'),
     Input(TransIDs.ACC_PICKER, 'value'),
@@ -228,35 +292,68 @@ def change_table_callback(data, data_prev):
 def filter_table(cat: str,
                  group: str,
                  account: str,
-                 date_values: List[str]) -> List[dict]:
+                 date_values: List[str]) -> Tuple[List[dict], List[dmc.Text]]:
     """
     Filters the table based on the chosen filters
-    :return: dict of filtered df
+    :return: dict of filtered df, and the totals of the filtered rows
+    """
+    if date_values is not None:
+        # drilling into months that are not resident loads them first
+        TRANS_DB.thaw_range(pd.to_datetime(date_values[0]),
+                            pd.to_datetime(date_values[1]))
+    else:
+        TRANS_DB.end_drill_in()
+
+    # all masks must be built from the same version of the db
+    trans_db = TRANS_DB.snapshot(full_rows=True)
+    filters = _create_filters(trans_db.db, cat, group, account, date_values)
+    mask = reduce(lambda x, y: x & y, filters.values())
+    table = trans_db[mask]
+
+    TRANS_DB.set_filters(filters)
+
+    # the totals are reduced from the same mask, not from the filtered table
+    totals = get_filter_totals(trans_db.db, mask)
+    return table.get_records(), create_table_totals(totals)
+
+
+def _create_filters(db: pd.DataFrame,
+                    cat: Optional[str],
+                    group: Optional[str],
+                    account: Optional[str],
+                    date_values: Optional[List[str]]) -> Dict[str, Union[pd.Series, bool]]:
+    """
+    the masks of the table filters over the rows of db, see filter_table
     """
     def create_conditional_filter(col, val):
-        return TRANS_DB[col] == val if val is not None else True
+        return db[col] == val if val is not None else True
 
     def create_date_cond_filter(col, date_values: list):
         if date_values is None:
-            return START_DATE_DEFAULT < TRANS_DB[col]
+            return START_DATE_DEFAULT < db[col]
 
         start_date = pd.to_datetime(date_values[0])
         end_date = pd.to_datetime(date_values[1])
-        return (start_date <= TRANS_DB[col]) & (TRANS_DB[col] <= end_date)
-
-    cat_cond = create_conditional_filter(TransDBSchema.CAT, cat)
-    account_cond = create_conditional_filter(TransDBSchema.ACCOUNT, account)
-    date_cond = create_date_cond_filter(TransDBSchema.DATE, date_values)
-    group_cond = create_conditional_filter(TransDBSchema.CAT_GROUP, group)
+        return (start_date <= db[col]) & (db[col] <= end_date)
 
-    table = TRANS_DB[(cat_cond) &
-                     (group_cond) &
-                     (account_cond) &
-                     (date_cond)]
+    return {'cat': create_conditional_filter(TransDBSchema.CAT, cat),
+            'group': create_conditional_filter(TransDBSchema.CAT_GROUP, group),
+            'account': create_conditional_filter(TransDBSchema.ACCOUNT, account),
+            'date': create_date_cond_filter(TransDBSchema.DATE, date_values)}
 
-    TRANS_DB.set_filters({'cat': cat_cond, 'group': group_cond, 'account': account_cond, 'date': date_cond})
 
-    return table.get_records()
+def _create_filter_totals(cat: Optional[str],
+                          group: Optional[str],
+                          account: Optional[str],
+                          date_values: Optional[List[str]]) -> List[dmc.Text]:
+    """
+    the totals above the table for the rows the filters select in the current
+    version of the db, for callbacks that change rows
+    """
+    db = TRANS_DB.snapshot().db
+    mask = reduce(lambda x, y: x & y, _create_filters(db, cat, group, account,
+                                                      date_values).values())
+    return create_table_totals(get_filter_totals(db, mask))
 
 
 def _get_removed_row_id(df: pd.DataFrame, df_previous: pd.DataFrame):
@@ -315,6 +412,7 @@ def _create_upload_summary_label(summary: dict):
     return dmc.Stack([
         dmc.Text(f'Inserted {summary["added"]} transactions'),
         dmc.Text(f'skipped {summary["skipped"]} transactions'),
+        dmc.Text(f'flagged {summary["flagged"]} unusual charges'),
     ])
 
 
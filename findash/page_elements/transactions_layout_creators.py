@@ -10,7 +10,9 @@ from element_ids import TransIDs
 from main import CAT_DB, TRANS_DB
 from accounts import ACCOUNTS
 from transactions_db import TransDBSchema
-from utils import SHEKEL_SYM, format_date_col_for_display
+from aggregates import FilterTotalsSchema, get_filter_totals
+from utils import SHEKEL_SYM, START_DATE_DEFAULT, format_date_col_for_display, \
+    format_currency_num
 from categories_db import _get_group_and_cat_for_dropdown
 
 
@@ -116,7 +118,7 @@ def create_trans_table(id: str,
                                 page_size=50,
                                 row_deletable=rows_deletable,
                                 fill_width=True,
-                                hidden_columns=[TransDBSchema.ID],
+                                hidden_columns=[TransDBSchema.ID, TransDBSchema.VERSION],
                                 style_table={'overflowX': 'auto'},
                                 columns=col_defs,
                                 dropdown=_setup_table_cell_dropdowns(),
@@ -161,12 +163,45 @@ def _create_main_trans_table() -> dash_table.DataTable:
     """
     col_subset = [TransDBSchema.DATE, TransDBSchema.PAYEE, TransDBSchema.INFLOW,
                  TransDBSchema.OUTFLOW, TransDBSchema.CAT, TransDBSchema.MEMO,
-                 TransDBSchema.ACCOUNT, TransDBSchema.ID]
+                 TransDBSchema.ACCOUNT, TransDBSchema.ID, TransDBSchema.VERSION]
     return create_trans_table(id=TransIDs.TRANS_TBL,
-                              table=TRANS_DB,
+                              table=TRANS_DB.snapshot(full_rows=True).db,
                               subset_cols=col_subset)
 
 
+def create_table_totals(totals: pd.Series) -> List[dmc.Text]:
+    """
+    Creates the totals shown above the transactions table
+    :param totals: see aggregates.get_filter_totals
+    :return:
+    """
+    count = totals[FilterTotalsSchema.COUNT]
+    if not count:
+        return [dmc.Text('No transactions', color='gray')]
+
+    first_date = totals[FilterTotalsSchema.FIRST_DATE]
+    last_date = totals[FilterTotalsSchema.LAST_DATE]
+    return [dmc.Text(f'{count:,} transactions', weight=700),
+            dmc.Text(f'{first_date:%d/%m/%Y} - {last_date:%d/%m/%Y}', color='gray'),
+            dmc.Text(f'Inflow {format_currency_num(totals[FilterTotalsSchema.INFLOW])}'),
+            dmc.Text(f'Outflow {format_currency_num(totals[FilterTotalsSchema.OUTFLOW])}'),
+            dmc.Text(f'Net {format_currency_num(totals[FilterTotalsSchema.NET])}',
+                     color='green' if totals[FilterTotalsSchema.NET] >= 0 else 'red')]
+
+
+def _create_main_trans_table_totals() -> dmc.Group:
+    """
+    Creates the totals of the unfiltered main transaction table, with the date
+    mask the table filters apply by default
+    :return:
+    """
+    db = TRANS_DB.snapshot().db
+    totals = get_filter_totals(db, START_DATE_DEFAULT < db[TransDBSchema.DATE])
+    return dmc.Group(create_table_totals(totals),
+                     id=TransIDs.TRANS_TBL_TOTALS,
+                     spacing='xl')
+
+
 def _create_file_insert_summary_modal() -> dmc.Modal:
     """
     Creates a modal for showing the summary of the file insert
@@ -60,7 +60,7 @@ def _create_split_trans_table(table_creation_func: Callable,
                               table: Optional[List[int]] = None) \
         -> dash_table.DataTable:
     if table is None:
-        table = TRANS_DB
+        table = TRANS_DB.snapshot(full_rows=True).db
 
     return table_creation_func(id=TransIDs.SPLIT_TBL,
                                table=table,
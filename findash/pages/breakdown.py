@@ -8,11 +8,17 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import dash_mantine_components as dmc
 
-from main import TRANS_DB, CAT_DB
+from main import TRANS_DB, CAT_DB, FIGURE_CACHE, TREND_ENGINE
+from figure_cache import memoize_per_version
 from shared_elements import create_page_heading
 from transactions_db import TransDBSchema
+from aggregates import AggSchema, ComparisonSchema, get_period_key, period_key_to_timestamp, \
+    shift_period_key
+from trends import TrendSchema
+from payees import PayeeSchema
 from categories_db import CatDBSchema
 from element_ids import BreakdownIDs
+from utils import create_table, format_currency_num
 from dash_bootstrap_templates import load_figure_template
 
 
@@ -23,20 +29,62 @@ load_figure_template('bootstrap')
 DEFAULT_GROUP = CAT_DB.get_group_names()[0]
 
 
-def sort_by_date(df: pd.DataFrame):
-    df['date_numeric'] = pd.to_datetime(df.index, format='%b-%y')
-    return df.sort_values('date_numeric')
+# figure data shared by the figures of the page, per version of the db
+_memoize_per_version = memoize_per_version(lambda: TRANS_DB.version)
 
 
+def _to_month_labels(periods: pd.Series) -> pd.Series:
+    return period_key_to_timestamp(periods).dt.strftime('%b-%y')
+
+
+@_memoize_per_version
+def _get_group_month_totals() -> pd.DataFrame:
+    """
+    inflow and outflow per period and category group, sorted by period. Shared
+    by the figures of the page
+    """
+    aggs = TRANS_DB.get_monthly_aggregates()
+    return aggs.groupby([AggSchema.PERIOD, AggSchema.CAT_GROUP])[
+        [AggSchema.INFLOW, AggSchema.OUTFLOW]].sum().reset_index()
+
+
+@_memoize_per_version
+def _get_month_in_out() -> pd.DataFrame:
+    totals = _get_group_month_totals()
+    month_in_out = totals.groupby(AggSchema.PERIOD)[
+        [AggSchema.INFLOW, AggSchema.OUTFLOW]].sum()
+    month_in_out['diff'] = month_in_out[AggSchema.INFLOW] - month_in_out[AggSchema.OUTFLOW]
+    month_in_out.index = _to_month_labels(month_in_out.index.to_series())
+    return month_in_out
+
+
+@_memoize_per_version
+def _get_group_outflow_by_month(group: str) -> pd.DataFrame:
+    totals = _get_group_month_totals()
+    grouped = totals.loc[totals[AggSchema.CAT_GROUP] == group,
+                         [AggSchema.PERIOD, AggSchema.OUTFLOW]]
+    return grouped.set_index(_to_month_labels(grouped[AggSchema.PERIOD]))[[AggSchema.OUTFLOW]]
+
+
+@_memoize_per_version
+def _get_cat_outflow() -> pd.DataFrame:
+    """ outflow of the whole history per category group and category """
+    aggs = TRANS_DB.get_monthly_aggregates()
+    return aggs.groupby([AggSchema.CAT_GROUP, AggSchema.CAT])[
+        [AggSchema.OUTFLOW]].sum().reset_index()
+
+
+@_memoize_per_version
+def _get_group_cat_outflow(group: str) -> pd.DataFrame:
+    cat_outflow = _get_cat_outflow()
+    grouped = cat_outflow.loc[cat_outflow[AggSchema.CAT_GROUP] == group,
+                              [AggSchema.CAT, AggSchema.OUTFLOW]]
+    return grouped.sort_values(by=AggSchema.OUTFLOW, ascending=False)
+
+
+@FIGURE_CACHE.cached(TRANS_DB.get_data_token)
 def _create_under_over_card():
-    trans_db = TRANS_DB.copy()
-    trans_db['month'] = trans_db[TransDBSchema.DATE].dt.strftime('%b-%y')
-    month_in_out = trans_db.groupby('month').agg({TransDBSchema.INFLOW: 'sum',
-                                                  TransDBSchema.OUTFLOW: 'sum'})
-    month_in_out['diff'] = month_in_out[TransDBSchema.INFLOW] - \
-                           month_in_out[TransDBSchema.OUTFLOW]
-
-    month_in_out = sort_by_date(month_in_out)
+    month_in_out = _get_month_in_out()
     fig = make_subplots(specs=[[{"secondary_y": True}]])
     fig.add_trace(go.Bar(x=month_in_out.index,
                          y=month_in_out[TransDBSchema.INFLOW],
@@ -63,14 +111,9 @@ def _create_under_over_card():
     return fig
 
 
+@FIGURE_CACHE.cached(TRANS_DB.get_data_token)
 def _expenses_over_time_by_group(group: str):
-    trans_db = TRANS_DB.copy()
-    trans_db['month'] = trans_db[TransDBSchema.DATE].dt.strftime('%b-%y')
-    trans_db = trans_db[trans_db[TransDBSchema.CAT_GROUP] == group]
-
-    grouped = trans_db.groupby('month').agg({TransDBSchema.OUTFLOW: 'sum'})
-    grouped = sort_by_date(grouped)
-
+    grouped = _get_group_outflow_by_month(group)
     fig = px.bar(data_frame=grouped, x=grouped.index, y=TransDBSchema.OUTFLOW)
     fig.update_yaxes(title_text='Amount')
     fig.update_xaxes(title_text='Month')
@@ -85,17 +128,14 @@ def _create_groups_dd(id):
                         value=options[0])
 
 
+@FIGURE_CACHE.cached(lambda: TRANS_DB.get_data_token() + CAT_DB.get_data_token())
 def _create_budget_usage(group_name: str):
     """
     create a bar chart of budget usage by category
     :param group_name:
     :return:
     """
-    trans_db = TRANS_DB.copy()
-    trans_db = trans_db[trans_db[TransDBSchema.CAT_GROUP] == group_name]
-    grouped = trans_db.groupby(TransDBSchema.CAT,
-                               observed=True).agg({TransDBSchema.OUTFLOW: 'sum'}).reset_index()
-    grouped = grouped.sort_values(by=TransDBSchema.OUTFLOW, ascending=False)
+    grouped = _get_group_cat_outflow(group_name)
     budget = CAT_DB.get_cats_in_group(group_name)
     final_df = budget.merge(grouped, left_on='cat_name', right_on='cat', how='left')
     final_df = final_df.fillna({'outflow': 0}).reset_index()
@@ -117,6 +157,136 @@ def _create_budget_usage(group_name: str):
     return fig
 
 
+@FIGURE_CACHE.cached(TRANS_DB.get_data_token)
+def _create_group_trends(group: str):
+    """ monthly expenses of the group with their trailing averages """
+    trends = TREND_ENGINE.get_trends(AggSchema.CAT_GROUP).get_key(group)
+    months = _to_month_labels(trends.index.to_series())
+
+    fig = go.Figure(go.Bar(x=months, y=trends[TrendSchema.OUTFLOW], name='Expenses'))
+    for name, window in TrendSchema.get_trailing_windows().items():
+        fig.add_trace(go.Scatter(x=months, y=trends[name], name=f'{window} month average'))
+    fig.update_layout(margin_t=10)
+    fig.update_yaxes(title_text='Amount')
+    fig.update_xaxes(title_text='Month')
+    return fig
+
+
+def _create_trends_table(group: str):
+    """ trends of the categories of the group in the last month """
+    trends = TREND_ENGINE.get_trends(AggSchema.CAT)
+    if not len(trends.periods):
+        return []
+    last_period = trends.periods[-1]
+    cats = trends.get_period(last_period).reindex(CAT_DB.get_categories_in_group(group),
+                                                  fill_value=0.)
+
+    table = pd.DataFrame({
+        'Category': cats.index,
+        'Expenses': cats[TrendSchema.OUTFLOW].map(format_currency_num),
+        '3 Month Avg.': cats[TrendSchema.AVG_3].map(format_currency_num),
+        '12 Month Avg.': cats[TrendSchema.AVG_12].map(format_currency_num),
+        'Change from Last Month': cats[TrendSchema.MOM_DELTA].map(format_currency_num),
+        'Share of Expenses': cats[TrendSchema.SHARE].map(lambda share: f'{share:.0%}'),
+    })
+    title = f'Categories in {_to_month_labels(pd.Series([last_period])).iloc[0]}'
+    return [dmc.Text(title, className='breakdown-fig-header'),
+            dmc.Table(create_table(table), striped=True, highlightOnHover=True)]
+
+
+# comparison name: function of the last period with data to the base and the
+# compared ranges of periods
+COMPARISONS = {
+    'Month vs. previous month': lambda last: ((shift_period_key(last, -1),) * 2, (last, last)),
+    'Month vs. same month last year': lambda last: ((shift_period_key(last, -12),) * 2,
+                                                    (last, last)),
+    'Quarter vs. same quarter last year': lambda last: _get_quarter_comparison(last),
+    'Year to date vs. last year': lambda last: (
+        (get_period_key(last // 100 - 1, 1), shift_period_key(last, -12)),
+        (get_period_key(last // 100, 1), last)),
+}
+COMPARISON_BY = {'Group': AggSchema.CAT_GROUP, 'Category': AggSchema.CAT,
+                 'Account': AggSchema.ACCOUNT}
+DEFAULT_COMPARISON = 'Month vs. same month last year'
+
+
+def _get_quarter_comparison(last: int):
+    quarter_start = get_period_key(last // 100, (last % 100 - 1) // 3 * 3 + 1)
+    quarter_end = shift_period_key(quarter_start, 2)
+    return ((shift_period_key(quarter_start, -12), shift_period_key(quarter_end, -12)),
+            (quarter_start, quarter_end))
+
+
+def _to_range_label(periods) -> str:
+    labels = _to_month_labels(pd.Series(periods)).drop_duplicates()
+    return ' - '.join(labels)
+
+
+@FIGURE_CACHE.cached(TRANS_DB.get_data_token)
+def _create_comparison(comparison_name: str, by_name: str):
+    """ expenses of two ranges of months side by side """
+    periods = TRANS_DB.get_monthly_aggregates()[AggSchema.PERIOD]
+    fig = go.Figure()
+    if not len(periods):
+        return fig
+
+    base, compared = COMPARISONS[comparison_name](periods.max())
+    comparison = TRANS_DB.compare_periods(base, compared, by=COMPARISON_BY[by_name])
+    comparison = comparison[(comparison[ComparisonSchema.BASE] != 0) |
+                            (comparison[ComparisonSchema.COMPARED] != 0)]
+    for col, range_periods in [(ComparisonSchema.BASE, base),
+                               (ComparisonSchema.COMPARED, compared)]:
+        fig.add_trace(go.Bar(x=comparison.index, y=comparison[col],
+                             name=_to_range_label(range_periods)))
+    delta_pcts = comparison[ComparisonSchema.DELTA_PCT]
+    fig.update_traces(selector=dict(type='bar'), customdata=delta_pcts.fillna(0),
+                      hovertemplate='%{y:,.0f} (%{customdata:+.0f}%)')
+    fig.update_layout(barmode='group', margin_t=10)
+    fig.update_yaxes(title_text='Amount')
+    return fig
+
+
+# number of payees in the top payees figure
+TOP_PAYEES_K = 10
+TOP_PAYEES_BY = {'Spend': PayeeSchema.OUTFLOW, 'Number of charges': PayeeSchema.COUNT}
+ALL_OPTION = 'All'
+
+
+def _to_period(month: str):
+    return None if month == ALL_OPTION else get_period_key(*map(int, month.split('-')))
+
+
+@_memoize_per_version
+def _get_top_payees(month: str, group: str, by_name: str) -> pd.DataFrame:
+    cat_group = None if group == ALL_OPTION else group
+    return TRANS_DB.get_top_payees(TOP_PAYEES_K, TOP_PAYEES_BY[by_name], _to_period(month),
+                                   cat_group=cat_group)
+
+
+def _create_top_payees(month: str, group: str, by_name: str):
+    """ the payees with the most spend or charges, largest on top """
+    top = _get_top_payees(month, group, by_name).iloc[::-1]
+    by = TOP_PAYEES_BY[by_name]
+    fig = go.Figure(go.Bar(x=top[by], y=top.index, orientation='h',
+                           customdata=top[[PayeeSchema.OUTFLOW, PayeeSchema.COUNT]],
+                           hovertemplate='%{customdata[0]:,.0f} in %{customdata[1]} charges'))
+    fig.update_layout(margin_t=10)
+    fig.update_xaxes(title_text=by_name)
+    return fig
+
+
+def _create_top_payees_dds():
+    periods = sorted(TRANS_DB.get_monthly_aggregates()[AggSchema.PERIOD].unique(), reverse=True)
+    months = [f'{period // 100}-{period % 100:02d}' for period in periods]
+    return dmc.Group([
+        dmc.Select(id=BreakdownIDs.TOP_PAYEES_MONTH_DD, data=[ALL_OPTION, *months],
+                   value=ALL_OPTION),
+        dmc.Select(id=BreakdownIDs.TOP_PAYEES_GROUP_DD,
+                   data=[ALL_OPTION, *CAT_DB.get_group_names()], value=ALL_OPTION),
+        dmc.Select(id=BreakdownIDs.TOP_PAYEES_BY_DD, data=list(TOP_PAYEES_BY), value='Spend')
+    ])
+
+
 def _create_layout():
     return dbc.Container([
         dbc.Row([
@@ -149,6 +319,47 @@ def _create_layout():
             dbc.Col(dcc.Graph(figure=_create_budget_usage(DEFAULT_GROUP),
                               id=BreakdownIDs.BUDGET_USAGE_FIG),
                     width=12),
+        ]),
+        dbc.Row([
+            dmc.Group([
+                dmc.Text('Spending trends', className='breakdown-fig-header'),
+                _create_groups_dd(BreakdownIDs.TRENDS_DD)
+            ], position='apart')
+        ]),
+        dbc.Row([
+            dbc.Col(dcc.Graph(figure=_create_group_trends(DEFAULT_GROUP),
+                              id=BreakdownIDs.TRENDS_FIG),
+                    width=12),
+        ]),
+        dbc.Row([
+            dbc.Col(_create_trends_table(DEFAULT_GROUP), id=BreakdownIDs.TRENDS_TABLE, width=12)
+        ]),
+        dbc.Row([
+            dmc.Group([
+                dmc.Text('Expenses comparison', className='breakdown-fig-header'),
+                dmc.Group([
+                    dmc.Select(id=BreakdownIDs.COMPARISON_DD, data=list(COMPARISONS),
+                               value=DEFAULT_COMPARISON),
+                    dmc.Select(id=BreakdownIDs.COMPARISON_BY_DD, data=list(COMPARISON_BY),
+                               value='Group')
+                ])
+            ], position='apart')
+        ]),
+        dbc.Row([
+            dbc.Col(dcc.Graph(figure=_create_comparison(DEFAULT_COMPARISON, 'Group'),
+                              id=BreakdownIDs.COMPARISON_FIG),
+                    width=12),
+        ]),
+        dbc.Row([
+            dmc.Group([
+                dmc.Text('Top payees', className='breakdown-fig-header'),
+                _create_top_payees_dds()
+            ], position='apart')
+        ]),
+        dbc.Row([
+            dbc.Col(dcc.Graph(figure=_create_top_payees(ALL_OPTION, ALL_OPTION, 'Spend'),
+                              id=BreakdownIDs.TOP_PAYEES_FIG),
+                    width=12),
         ])
     ], fluid=True)
 
@@ -172,3 +383,34 @@ def expenses_over_time_by_group_callback(dd_value: str):
 )
 def expenses_over_time_by_group_callback(dd_value: str):
     return _create_budget_usage(dd_value), f'Percent from budget: {dd_value}'
+
+
+@dash.callback(
+    Output(BreakdownIDs.TRENDS_FIG, 'figure'),
+    Output(BreakdownIDs.TRENDS_TABLE, 'children'),
+    Input(BreakdownIDs.TRENDS_DD, 'value'),
+    config_prevent_initial_callbacks=True
+)
+def trends_callback(dd_value: str):
+    return _create_group_trends(dd_value), _create_trends_table(dd_value)
+
+
+@dash.callback(
+    Output(BreakdownIDs.COMPARISON_FIG, 'figure'),
+    Input(BreakdownIDs.COMPARISON_DD, 'value'),
+    Input(BreakdownIDs.COMPARISON_BY_DD, 'value'),
+    config_prevent_initial_callbacks=True
+)
+def comparison_callback(comparison_name: str, by_name: str):
+    return _create_comparison(comparison_name, by_name)
+
+
+@dash.callback(
+    Output(BreakdownIDs.TOP_PAYEES_FIG, 'figure'),
+    Input(BreakdownIDs.TOP_PAYEES_MONTH_DD, 'value'),
+    Input(BreakdownIDs.TOP_PAYEES_GROUP_DD, 'value'),
+    Input(BreakdownIDs.TOP_PAYEES_BY_DD, 'value'),
+    config_prevent_initial_callbacks=True
+)
+def top_payees_callback(month: str, group: str, by_name: str):
+    return _create_top_payees(month, group, by_name)
@@ -10,10 +10,11 @@ from dash.dash_table.Format import Format, Symbol
 from dash.exceptions import PreventUpdate
 from dash_iconify import DashIconify
 
-from main import CAT_DB
+from main import CAT_DB, FIGURE_CACHE
 from categories_db import CatDBSchema
 from shared_elements import create_page_heading
-from utils import format_currency_num, SHEKEL_SYM
+from utils import format_currency_num, get_current_year_and_month, SHEKEL_SYM
+from aggregates import get_period_key
 from element_ids import CatIDs
 
 dash.register_page(__name__)
@@ -22,11 +23,14 @@ dash.register_page(__name__)
 class CatTableSchema:
     CATEGORY = 'Category'
     BUDGET = 'Budget'
+    ROLLOVER = 'Rollover'
+    ROLLOVER_OPTIONS = ['Yes', 'No']
 
     @classmethod
     def get_new_row(cls):
         return {cls.CATEGORY: CAT_DB.get_new_category_name(),
-                cls.BUDGET: 0}
+                cls.BUDGET: 0,
+                cls.ROLLOVER: 'No'}
 
 
 def create_cat_table(df: pd.DataFrame, group_name: str, index: int):
@@ -35,12 +39,19 @@ def create_cat_table(df: pd.DataFrame, group_name: str, index: int):
     budget_col = {'name': CatTableSchema.BUDGET, 'id': CatTableSchema.BUDGET,
                   'type': 'numeric', 'editable': True,
                   'format': Format(group=',').symbol(Symbol.yes).symbol_suffix(SHEKEL_SYM)}
+    # unspent budget of rollover categories carries over to the next month
+    rollover_col = {'name': CatTableSchema.ROLLOVER, 'id': CatTableSchema.ROLLOVER,
+                    'presentation': 'dropdown', 'editable': True}
 
     return dash_table.DataTable(
         id={'type': 'cat-table', 'index': index, 'group_name': group_name},
         data=df.to_dict('records'),
         row_deletable=True,
-        columns=[cat_col, budget_col],
+        columns=[cat_col, budget_col, rollover_col],
+        dropdown={CatTableSchema.ROLLOVER: {
+            'options': [{'label': option, 'value': option}
+                        for option in CatTableSchema.ROLLOVER_OPTIONS],
+            'clearable': False}},
         style_cell={'textAlign': 'left',
                     'border-right': 'none',
                     'border-left': 'none'},
@@ -53,9 +64,11 @@ def _create_group_card(group_name: str,
                        group_budget: str,
                        categories: List[str],
                        categories_budgets: List[str],
+                       categories_rollovers: List[str],
                        index: int):
     cat_df = pd.DataFrame(dict(Category=categories,
-                               Budget=categories_budgets))
+                               Budget=categories_budgets,
+                               Rollover=categories_rollovers))
     return dmc.Card([
         dmc.CardSection([
             dmc.Group([
@@ -86,15 +99,23 @@ def _create_category_card_grid():
         group_budget = CAT_DB.get_group_budget(group)
         categories = CAT_DB.get_categories_in_group(group)
         categories_budgets = [CAT_DB.get_category_budget(cat) for cat in categories]
+        rollover_starts = CAT_DB.get_rollover_starts()
+        categories_rollovers = ['Yes' if cat in rollover_starts else 'No' for cat in categories]
         cards.append(dmc.Col([_create_group_card(group,
                                                  group_budget,
                                                  categories,
                                                  categories_budgets,
+                                                 categories_rollovers,
                                                  index=i)], span=6))
     return cards
 
 
 def _create_pie_chart(group_or_group_name: str, id: str):
+    return dcc.Graph(figure=_create_pie_figure(group_or_group_name), id=id)
+
+
+@FIGURE_CACHE.cached(CAT_DB.get_data_token)
+def _create_pie_figure(group_or_group_name: str):
     if group_or_group_name == 'group':
         budgets = [(name, CAT_DB.get_group_budget(name)) for name in CAT_DB.get_group_names()]
     else:
@@ -104,7 +125,7 @@ def _create_pie_chart(group_or_group_name: str, id: str):
     chart = go.Pie(labels=[name for name, _ in budgets],
                    values=[budget for _, budget in budgets])
 
-    return dcc.Graph(figure=go.Figure(data=[chart]), id=id)
+    return go.Figure(data=[chart])
 
 
 def _create_category_pie_chart_col():
@@ -206,9 +227,20 @@ def _update_group_table(data, data_previous):
                                   data_previous[CatTableSchema.CATEGORY]]
     changed_budget_idx = data.index[data[CatTableSchema.BUDGET] !=
                                     data_previous[CatTableSchema.BUDGET]]
-    if len(changed_budget_idx) > 1 or len(changed_name_idx) > 1:
+    changed_rollover_idx = data.index[data[CatTableSchema.ROLLOVER] !=
+                                      data_previous[CatTableSchema.ROLLOVER]]
+    if len(changed_budget_idx) > 1 or len(changed_name_idx) > 1 or \
+            len(changed_rollover_idx) > 1:
         raise ValueError('Only one category can be changed at a time')
 
+    if len(changed_rollover_idx) == 1:
+        # a category starts rolling over from the current month
+        cat_name = data.loc[changed_rollover_idx, CatTableSchema.CATEGORY].iloc[0]
+        rollover = data.loc[changed_rollover_idx, CatTableSchema.ROLLOVER].iloc[0] == 'Yes'
+        CAT_DB.update_category_rollover(
+            cat_name, get_period_key(*map(int, get_current_year_and_month())) if rollover else 0)
+        raise PreventUpdate
+
     if len(changed_name_idx) == 1:
         CAT_DB.update_category_name(
             data_previous.loc[changed_name_idx, CatTableSchema.CATEGORY].iloc[0],
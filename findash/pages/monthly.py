@@ -1,4 +1,4 @@
-from typing import Dict, Tuple, Optional, List
+from typing import Tuple, Optional, List
 
 import dash
 import numpy as np
@@ -8,24 +8,37 @@ from dash import dcc
 import dash_mantine_components as dmc
 
 import pandas as pd
+import plotly.graph_objects as go
 from dash.exceptions import PreventUpdate
 from dash_iconify import DashIconify
 
-from main import CAT_DB, TRANS_DB
+from main import CAT_DB, TRANS_DB, ROLLOVER_ENGINE
 from accounts import ACCOUNTS
 from element_ids import MonthlyIDs
 from categories_db import CatDBSchema
 from shared_elements import create_page_heading
 from transactions_db import TransDBSchema
+from aggregates import AggSchema, UsageSchema, get_budget_usage, shift_period_key, \
+    LOW_USAGE_THR, HIGH_USAGE_THR
+from projections import ProjectionSchema, project_month_end
+from anomalies import AnomalySchema
+from alerts import AlertSchema
+from reconcile import ReconcileSchema
 from utils import SHEKEL_SYM, conditional_coloring, get_current_year_month, \
-    create_table, format_date_col_for_display, format_currency_num, safe_divide
+    create_table, format_date_col_for_display, format_currency_num
 
 dash.register_page(__name__)
 
+# accounts don't change while the app runs
+CHECKING_INSTITUTIONS = [acc.institution for acc in ACCOUNTS.values() if acc.is_checking]
+CHECKING_ACCOUNTS = [name for name, acc in ACCOUNTS.items() if acc.is_checking]
+
 
 def _create_month_dd():
-    months = TRANS_DB[TransDBSchema.DATE].dt.strftime('%Y-%m')
-    months = months.unique().tolist()
+    # from the aggregates so months that are not resident are offered too
+    periods = TRANS_DB.get_monthly_aggregates()[AggSchema.PERIOD].unique()
+    months = [f'{period // 100}-{period % 100:02d}'
+              for period in sorted(periods, reverse=True)]
     return dmc.Select(
         id=MonthlyIDs.MONTHLY_DD,
         data=months,
@@ -35,8 +48,18 @@ def _create_month_dd():
     )
 
 
+def _get_month_aggregates():
+    """ totals of the chosen month by category, group and account """
+    return TRANS_DB.get_specific_month_aggregates()
+
+
+def _get_month_projection() -> pd.DataFrame:
+    """ spend so far and projected end of month spend of the chosen month """
+    return project_month_end(TRANS_DB, TRANS_DB.get_specific_period())
+
+
 def _calculate_outflow_total(last: bool = False) -> float:
-    db = TRANS_DB.specific_month if last else TRANS_DB
+    db = _get_month_aggregates() if last else TRANS_DB.get_monthly_aggregates()
     return db[TransDBSchema.OUTFLOW].sum()
 
 
@@ -48,11 +71,24 @@ def _calculate_checking_total(last: bool = False) -> float:
     """
     # checking_accounts = [acc.institution for acc in ACCOUNTS.values()]
     checking_accounts = list(ACCOUNTS.keys())
-    db = TRANS_DB.specific_month if last else TRANS_DB
+    db = _get_month_aggregates() if last else TRANS_DB.get_monthly_aggregates()
     return db[db[TransDBSchema.ACCOUNT].isin(checking_accounts)][
             TransDBSchema.INFLOW].sum()
 
 
+def _get_checking_balances() -> pd.Series:
+    """ current balance of every checking account """
+    balances = TRANS_DB.get_balances()
+    return balances[balances.index.isin(CHECKING_ACCOUNTS)]
+
+
+def _calculate_month_net(period: int) -> float:
+    """ inflow minus outflow of a month over all accounts """
+    aggs = TRANS_DB.get_monthly_aggregates()
+    month_aggs = aggs[aggs[AggSchema.PERIOD] == period]
+    return month_aggs[AggSchema.INFLOW].sum() - month_aggs[AggSchema.OUTFLOW].sum()
+
+
 def _curr_expenses_from_budget_pct() -> Optional[float]:
     """ divide current month's expenses by current month's budget """
     current_budget = CAT_DB.get_total_budget()
@@ -67,7 +103,7 @@ def _curr_expenses_from_income_pct() -> Optional[float]:
     current_income = _calculate_checking_total(last=True)
     if current_income == 0:
         return None
-    current_expenses = TRANS_DB.specific_month[TransDBSchema.OUTFLOW].sum()
+    current_expenses = _get_month_aggregates()[TransDBSchema.OUTFLOW].sum()
     return current_expenses * 100 / current_income
 
 
@@ -78,24 +114,17 @@ def _pct_budget_used():
 
 
 def _get_balance_per_account_for_popup():
-    per_account = TRANS_DB.specific_month.groupby(TransDBSchema.ACCOUNT)[
-        TransDBSchema.INFLOW].sum()
-    checking_str = [acc.institution for acc in ACCOUNTS.values() if
-                    acc.is_checking]
-    checking_only = per_account[per_account.index.isin(checking_str)]
     string_rep = ''.join(
-        f'**{account}**: {acc_sum}\n'
-        for account, acc_sum in checking_only.items()
+        f'**{account}**: {format_currency_num(balance)}\n'
+        for account, balance in _get_checking_balances().items()
     )
     return string_rep[:-1]
 
 
 def _get_income_per_account_popup():
-    per_account = TRANS_DB.specific_month.groupby(TransDBSchema.ACCOUNT)[
+    per_account = _get_month_aggregates().groupby(TransDBSchema.ACCOUNT)[
         TransDBSchema.OUTFLOW].sum()
-    non_checking_str = [acc.institution for acc in ACCOUNTS.values() if
-                        acc.is_checking]
-    non_checking_only = per_account[per_account.index.isin(non_checking_str)]
+    non_checking_only = per_account[per_account.index.isin(CHECKING_INSTITUTIONS)]
     string_rep = ''.join(
         f'**{account}**: {acc_sum}\n'
         for account, acc_sum in non_checking_only.items()
@@ -136,7 +165,7 @@ def _create_banner_card(title: str,
 
 
 def _create_checking_card():
-    checking_total = _calculate_checking_total()
+    checking_total = _get_checking_balances().sum()
 
     checking_card = dbc.Card([
                     html.H2("Checking"),
@@ -215,33 +244,101 @@ def _create_expenses_card():
 
 
 def _create_savings_card():
+    period = TRANS_DB.get_specific_period()
+    net = _calculate_month_net(period)
+    prev_net = _calculate_month_net(shift_period_key(period, -1))
     return _create_banner_card(
         title='Savings',
-        value=2000,
-        subtitle='Previous month 1000',
-        color='green',
+        value=net,
+        subtitle=f'Previous month {format_currency_num(prev_net)}',
+        color='green' if net >= 0 else 'red',
         id=MonthlyIDs.SAVINGS_CARD,
     )
 
 
+def _create_balance_figure():
+    """ balance of every account over time """
+    balances = TRANS_DB.get_balance_series()
+    # rows without an account are kept under an empty one by the db
+    fig = go.Figure([go.Scatter(x=balances.index, y=balances[account], name=account,
+                                line_shape='hv')
+                     for account in balances.columns if account != ''])
+    fig.update_layout(xaxis_title='Date', yaxis_title='Balance', margin_t=10)
+    return dcc.Graph(figure=fig, id=MonthlyIDs.BALANCE_FIG)
+
+
+# max number of budget alerts and of unusual charges listed in the
+# notifications card
+MAX_NOTIFS = 5
+
+
 def _create_notif_card():
+    period = TRANS_DB.get_specific_period()
+    # only the highest threshold a category crossed
+    alerts = TRANS_DB.get_budget_alerts(period).sort_values(
+        AlertSchema.THRESHOLD, ascending=False, kind='stable').drop_duplicates(AlertSchema.CAT)
+    anomalies = TRANS_DB.get_anomalies(period)
+    # the card bills paid this month are of last month's charges
+    mismatches = TRANS_DB.get_reconcile_mismatches(shift_period_key(period, -1))
+    notifs = [*[_create_alert_notif(alert) for _, alert in alerts.head(MAX_NOTIFS).iterrows()],
+              *[_create_mismatch_notif(mismatch) for _, mismatch in mismatches.iterrows()],
+              *[_create_anomaly_notif(anomaly)
+                for _, anomaly in anomalies.head(MAX_NOTIFS).iterrows()]]
+    if not len(notifs):
+        notifs = [html.P('No notifications this month')]
     return dbc.Card([
-        html.H2('Notifications')
-    ])
+        html.H2('Notifications'),
+        *notifs
+    ], body=True, id=MonthlyIDs.NOTIF_CARD)
+
+
+def _create_alert_notif(alert: pd.Series):
+    used_up = alert[AlertSchema.THRESHOLD] >= HIGH_USAGE_THR
+    usage_pct = alert[AlertSchema.USAGE] * 100 / alert[AlertSchema.BUDGET]
+    return dmc.Alert(
+        f'{alert[AlertSchema.CAT]} used {format_currency_num(alert[AlertSchema.USAGE])} of '
+        f'{format_currency_num(alert[AlertSchema.BUDGET])} ({usage_pct:.0f}%)',
+        title='Budget used up' if used_up else 'Budget almost used up',
+        color='red' if used_up else 'yellow',
+        icon=DashIconify(icon='mdi:alert-octagon-outline'))
+
+
+def _create_mismatch_notif(mismatch: pd.Series):
+    charges = f'{format_currency_num(mismatch[ReconcileSchema.TOTAL])} of charges'
+    if pd.isna(mismatch[ReconcileSchema.PAYMENT_ID]):
+        paid = 'no matching payment found'
+    else:
+        paid = f'closest payment {format_currency_num(mismatch[ReconcileSchema.PAYMENT])} ' \
+               f'on {pd.Timestamp(mismatch[ReconcileSchema.PAYMENT_DATE]):%d/%m}'
+    return dmc.Alert(
+        f'{mismatch[ReconcileSchema.ACCOUNT]}: {charges}, {paid}',
+        title='Card bill mismatch',
+        color='orange',
+        icon=DashIconify(icon='mdi:credit-card-remove-outline'))
+
+
+def _create_anomaly_notif(anomaly: pd.Series):
+    usual = f'usual {anomaly[AnomalySchema.REASON]} charge ' \
+            f'{format_currency_num(anomaly[AnomalySchema.MEDIAN])}'
+    return dmc.Alert(
+        f'{format_currency_num(anomaly[AnomalySchema.OUTFLOW])} at {anomaly[AnomalySchema.PAYEE]} '
+        f'on {pd.Timestamp(anomaly[AnomalySchema.DATE]):%d/%m} ({usual})',
+        title='Unusual charge',
+        color='yellow',
+        icon=DashIconify(icon='mdi:alert-circle-outline'))
 
 
 """
 Categories
 """
-# thresholds for coloring the category progress bar
-LOW_USAGE_THR = 85
-HIGH_USAGE_THR = 100
 
 
 def _get_accordion_control_children(title, text_weight, usage, cat_budget, progress_val,
-                                    size, color, usage_pct, num_green, num_yellow, num_red):
+                                    size, color, usage_pct, left, num_green, num_yellow,
+                                    num_red, progress_id, tooltip):
     shared_children = _get_shared_accordion_children(title, text_weight, usage, cat_budget,
-                                                     progress_val, size, color, usage_pct)
+                                                     progress_val, size, color, usage_pct,
+                                                     left, progress_id, tooltip)
     additional_children = [
         dmc.Col(dmc.Text(f'{num_green}', color='green'), span=1),
         dmc.Col(dmc.Text(f'{num_yellow}', color='yellow'), span=1),
@@ -251,50 +348,59 @@ def _get_accordion_control_children(title, text_weight, usage, cat_budget, progr
     return shared_children + additional_children
 
 
-def _get_shared_accordion_children(title, text_weight, usage, cat_budget, progress_val, size, color, usage_pct):
+def _get_shared_accordion_children(title, text_weight, usage, cat_budget, progress_val, size,
+                                   color, usage_pct, left, progress_id, tooltip):
     return [
             dmc.Col(dmc.Text(f"{title}", weight=text_weight), span=2),
             dmc.Col(
                 dmc.Progress(value=progress_val, label=f"{usage}/{cat_budget}",
-                             size=size, color=color, id=f'{title}-progress'), span=5),
+                             size=size, color=color, id=progress_id), span=5),
             dmc.Col(dmc.Text(f"{usage_pct}%", align="center"), span=1),
-            dmc.Col(dmc.Text(f'{format_currency_num(cat_budget-usage)}'), span=1),
-            dbc.Tooltip(f"{usage}/{cat_budget}", target=f'{title}-progress', placement='bottom')
+            dmc.Col(dmc.Text(f'{format_currency_num(left)}'), span=1),
+            dbc.Tooltip(tooltip, target=progress_id, placement='bottom')
         ]
 
 
 def cat_content(title: str,
-                usage: float,
-                cat_budget: float,
+                usage_row: pd.Series,
                 button_id: Optional[dict] = None,
                 size: str = 'lg',
                 text_weight=500,
-                num_colors: Optional[List[int]] = None
+                num_colors: Optional[List[int]] = None,
+                id_prefix: str = ''
                 ):
     """
-
     create content for category progress line
     :param title:
-    :param usage:
-    :param cat_budget:
+    :param usage_row: budget usage of the category or group (see
+                      aggregates.get_budget_usage)
     :param button_id:
     :param size:
     :param text_weight:
+    :param id_prefix: prefix of the element ids, to tell apart accordions
+                      showing the same categories
     :return:
     """
-    usage_pct = int(usage*100/cat_budget) if cat_budget != 0 else 0
-    color = conditional_coloring(usage_pct, {
-        'green': (-np.inf, LOW_USAGE_THR),
-        'yellow': (LOW_USAGE_THR, HIGH_USAGE_THR),
-        'red': (HIGH_USAGE_THR, np.inf)
-    })
-    progress_val = min(100, usage_pct)
+    progress_id = f'{id_prefix}{title}-progress'
+    tooltip = f"{usage_row[UsageSchema.USAGE]}/{usage_row[CatDBSchema.BUDGET]}"
+    if usage_row.get(UsageSchema.CARRYOVER, 0) != 0:
+        # the budget includes what was carried over from the previous months
+        tooltip += f", {format_currency_num(usage_row[UsageSchema.CARRYOVER])} carried over"
+    if UsageSchema.PROJECTED in usage_row:
+        # the color is by the projected usage
+        tooltip += f", projected {format_currency_num(usage_row[UsageSchema.PROJECTED])} " \
+                   f"({usage_row[UsageSchema.PROJECTED_PCT]}%)"
+    usage_args = (usage_row[UsageSchema.USAGE], usage_row[CatDBSchema.BUDGET])
+    usage_pct = usage_row[UsageSchema.USAGE_PCT]
+    format_args = (usage_row[UsageSchema.COLOR], usage_pct, usage_row[UsageSchema.LEFT])
     if num_colors is None:
-        grid_children = _get_shared_accordion_children(title, text_weight, usage, cat_budget,
-                                                       progress_val, size, color, usage_pct)
+        grid_children = _get_shared_accordion_children(title, text_weight, *usage_args,
+                                                       min(100, usage_pct), size,
+                                                       *format_args, progress_id, tooltip)
     else:
-        grid_children = _get_accordion_control_children(title, text_weight, usage, cat_budget,
-                                                        usage_pct, size, color, usage_pct, *num_colors)
+        grid_children = _get_accordion_control_children(title, text_weight, *usage_args,
+                                                        usage_pct, size, *format_args,
+                                                        *num_colors, progress_id, tooltip)
 
     if button_id is not None:
         grid_children.append(dmc.Col(dmc.Button('View',
@@ -308,52 +414,40 @@ def cat_content(title: str,
     return dmc.Grid(grid_children, gutter="xs")
 
 
-def accordion_item(group_title: str,
-                   group_usage: int,
-                   group_budget: float,
-                   cat_stats: Dict[str, Tuple[float, float]]):
+def accordion_item(group_usage: pd.Series, cat_usage: pd.DataFrame, id_prefix: str = ''):
     """
-    :param cat_stats: dictionary of cat_name: (usage, budget)
+    :param group_usage: budget usage of the group
+    :param cat_usage: budget usage of the categories in the group
+    :param id_prefix: see cat_content. The month accordion (no prefix) is the
+                      only one with buttons that open the transactions drawer
     :return:
     """
-    num_green, num_yellow, num_red = 0, 0, 0
-    for usage, budget in cat_stats.values():
-        if safe_divide(usage, budget)*100 < LOW_USAGE_THR:
-            num_green += 1
-        elif safe_divide(usage, budget)*100 < HIGH_USAGE_THR:
-            num_yellow += 1
-        else:
-            num_red += 1
-
+    num_colors = group_usage[[UsageSchema.NUM_GREEN, UsageSchema.NUM_YELLOW,
+                              UsageSchema.NUM_RED]].tolist()
     return dmc.AccordionItem([
-        dmc.AccordionControl(cat_content(group_title, group_usage, group_budget,
+        dmc.AccordionControl(cat_content(group_usage[CatDBSchema.CAT_GROUP], group_usage,
                                          size='xl', text_weight=700,
-                                         num_colors=[num_green, num_yellow, num_red])),
+                                         num_colors=num_colors, id_prefix=id_prefix)),
         dmc.AccordionPanel([
-            cat_content(title, usage, budget,
-                        button_id={'type': 'drawer-btn', 'index': title})
-            for title, (usage, budget) in cat_stats.items()
+            cat_content(cat[CatDBSchema.CAT_NAME], cat,
+                        button_id=None if id_prefix else
+                        {'type': 'drawer-btn', 'index': cat[CatDBSchema.CAT_NAME]},
+                        id_prefix=id_prefix)
+            for _, cat in cat_usage.iterrows()
         ])
     ],
         value=str(np.random.randint(1000))
     )
 
 
-def create_cat_usage(group: pd.core.groupby.generic.DataFrameGroupBy):
-    cat_dict = {}
-    for ind, row in group.iterrows():
-        cat_name = row[CatDBSchema.CAT_NAME]
-        budget = row[CatDBSchema.BUDGET]
-        specific_month = TRANS_DB.specific_month
-        usage = specific_month[
-                        specific_month[TransDBSchema.CAT] == cat_name][
-                                                    TransDBSchema.AMOUNT].sum()
-
-        cat_dict[cat_name] = (int(usage), budget)
-    return cat_dict
-
-
-def create_accordion_items():
+def create_accordion_items(aggs: Optional[pd.DataFrame] = None, id_prefix: str = ''):
+    """
+    :param aggs: totals by category and group to show the budget usage of.
+                 Defaults to the aggregates of the chosen month, colored by the
+                 projected usage at the end of the month and with the
+                 carryover of the rollover categories in their budgets
+    :param id_prefix: see cat_content
+    """
     accordion_items = []
     item = dmc.AccordionItem([
         dmc.AccordionControl([
@@ -371,18 +465,56 @@ def create_accordion_items():
     ], value=str(np.random.randint(1000)))
 
     accordion_items.append(item)
-    for group_name, group in CAT_DB.get_groups_as_groupby():
-        group_budget = group[CatDBSchema.BUDGET].sum()
-        group_usage = TRANS_DB.specific_month.get_data_by_group(group_name)[
-            TransDBSchema.AMOUNT].sum()
-        group_usage = int(group_usage)
+    projected, carryover = None, None
+    if aggs is None:
+        aggs = _get_month_aggregates()
+        projected = _get_month_projection()[ProjectionSchema.PROJECTED]
+        carryover = ROLLOVER_ENGINE.get_carryover(TRANS_DB.get_specific_period())
+    cat_usage, group_usage = get_budget_usage(aggs, CAT_DB.db, LOW_USAGE_THR, HIGH_USAGE_THR,
+                                              projected, carryover)
+    cats_by_group = dict(list(cat_usage.groupby(CatDBSchema.CAT_GROUP, sort=False)))
+    for _, group in group_usage.iterrows():
+        accordion_items.append(accordion_item(group, cats_by_group[group[CatDBSchema.CAT_GROUP]],
+                                              id_prefix))
 
-        categories = create_cat_usage(group)
+    return accordion_items
 
-        accordion_items.append(accordion_item(group_name, group_usage,
-                                              group_budget, categories))
 
-    return accordion_items
+"""
+Custom period
+"""
+# day of the month pay cycles start on
+PAY_CYCLE_START_DAY = 10
+CUSTOM_PERIOD_ID_PREFIX = 'custom-'
+
+
+def _get_current_pay_cycle() -> Tuple[pd.Timestamp, pd.Timestamp]:
+    """ from the last start of a pay cycle until today """
+    today = pd.Timestamp.today().normalize()
+    start = today.replace(day=PAY_CYCLE_START_DAY)
+    if start > today:
+        start -= pd.DateOffset(months=1)
+    return start, today
+
+
+def _get_range_aggregates(start_date: pd.Timestamp, end_date: pd.Timestamp) -> pd.DataFrame:
+    """
+    totals by category of a date range, with the cols get_budget_usage needs
+    from monthly aggregates
+    """
+    totals = TRANS_DB.get_range_totals(start_date, end_date)
+    cat_groups = CAT_DB.db.set_index(CatDBSchema.CAT_NAME)[CatDBSchema.CAT_GROUP]
+    return pd.DataFrame({AggSchema.CAT: totals.index,
+                         AggSchema.CAT_GROUP: totals.index.map(cat_groups),
+                         AggSchema.AMOUNT: totals.to_numpy()})
+
+
+def _create_custom_period_picker():
+    start, end = _get_current_pay_cycle()
+    return dmc.DateRangePicker(id=MonthlyIDs.CUSTOM_PERIOD_PICKER,
+                               value=[start.date(), end.date()],
+                               clearable=False,
+                               icon=DashIconify(icon='ic:round-date-range'))
 
 
 def _create_layout():
@@ -404,6 +536,15 @@ def _create_layout():
             stat_headings
         ]),
         html.Br(),
+        dbc.Row([
+            _create_notif_card()
+        ]),
+        html.Br(),
+        dbc.Row([
+            dmc.Title('Balance', className='section-title'),
+            _create_balance_figure()
+        ]),
+        html.Br(),
         dbc.Row([
             html.Div(
                 dmc.Drawer(id=MonthlyIDs.TRANS_DRAWER, size='70%',
@@ -415,7 +556,17 @@ def _create_layout():
                         children=create_accordion_items())
                 ], style={'margin-top': '15px'})
             ], style={'position': 'relative'}),
-        ])
+        ]),
+        html.Br(),
+        dbc.Row([
+            dmc.Group([
+                dmc.Title('Custom Period', className='section-title'),
+                _create_custom_period_picker()
+            ], position='apart')
+        ]),
+        dbc.Row([
+            dmc.AccordionMultiple(id=MonthlyIDs.CUSTOM_PERIOD_ACCORDION)
+        ], style={'margin-top': '15px'})
     ], fluid=True)
 
 
@@ -449,6 +600,19 @@ def update_month_dd(_, month_store):
     return [dd]
 
 
+@dash.callback(
+    Output(MonthlyIDs.CUSTOM_PERIOD_ACCORDION, 'children'),
+    Input(MonthlyIDs.CUSTOM_PERIOD_PICKER, 'value'),
+)
+def update_custom_period(date_values: List[str]):
+    if date_values is None:
+        raise PreventUpdate
+
+    start_date, end_date = pd.to_datetime(date_values[0]), pd.to_datetime(date_values[1])
+    return create_accordion_items(_get_range_aggregates(start_date, end_date),
+                                  id_prefix=CUSTOM_PERIOD_ID_PREFIX)
+
+
 @dash.callback(
     Output(MonthlyIDs.TRANS_DRAWER, "opened"),
     Output(MonthlyIDs.TRANS_DRAWER, "children"),
@@ -457,7 +621,8 @@ def update_month_dd(_, month_store):
 )
 def drawer_demo(_):
     selection = ctx.triggered_id['index']
-    selection_trans = TRANS_DB.specific_month.get_data_by_cat(selection)
+    month_trans = TRANS_DB.get_period_rows(TRANS_DB.get_specific_period())
+    selection_trans = month_trans[month_trans[TransDBSchema.CAT] == selection]
     selection_trans = _format_table_for_drawer(selection_trans)
     table_parts = create_table(selection_trans)
     table = dmc.Table(table_parts, striped=True, highlightOnHover=True)
@@ -1,12 +1,13 @@
 from dash import html, dcc
 import dash_bootstrap_components as dbc
+import dash_mantine_components as dmc
 from dash_iconify import DashIconify
 
 from accounts import ACCOUNTS
 from shared_elements import create_page_heading
 from page_elements.transactions_split_window import create_split_trans_modal
 from page_elements.transactions_layout_creators import create_file_upload_modal, \
-    _create_main_trans_table, _create_file_insert_summary_modal
+    _create_main_trans_table, _create_main_trans_table_totals, _create_file_insert_summary_modal
 from page_elements.transactions_callbacks import *
 
 dash.register_page(__name__)
@@ -116,6 +117,9 @@ def _create_layout():
                 _create_add_action_icons()
             ], position='apart')
         ], style={'margin-bottom': '40px'}, span=12),
+        dmc.Col([
+            _create_main_trans_table_totals()
+        ], style={'margin-bottom': '10px'}, span=12),
         dmc.Col([
             html.Div(_create_main_trans_table(), id=TransIDs.TRANS_TBL_DIV, style={'width': '100%'})
         ], span=12)
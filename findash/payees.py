@@ -0,0 +1,191 @@
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from findash.aggregates import get_period_keys
+from findash.trans_schema import TransDBSchema
+from findash.transfers import is_transfer
+
+"""
+Monthly spend per payee, to answer top payee queries without grouping the
+transactions by payee strings. Payees are interned to integer ids, and the
+charges are aggregated per period, category, group and payee id. A top-k
+query sums the matching aggregates per id with bincount and selects the top
+ids with argpartition. Cold months are stored as the same aggregates keyed by
+payee name (see aggregate_payees), as ids are only valid in one process.
+"""
+
+
+class PayeeSchema:
+    PERIOD: str = 'period'
+    CAT: str = TransDBSchema.CAT
+    CAT_GROUP: str = TransDBSchema.CAT_GROUP
+    PAYEE_ID: str = 'payee_id'
+    PAYEE: str = TransDBSchema.PAYEE
+    OUTFLOW: str = TransDBSchema.OUTFLOW
+    COUNT: str = 'count'
+
+    @classmethod
+    def get_key_cols(cls) -> List[str]:
+        return [cls.PERIOD, cls.CAT, cls.CAT_GROUP, cls.PAYEE_ID]
+
+    @classmethod
+    def get_value_cols(cls) -> List[str]:
+        return [cls.OUTFLOW, cls.COUNT]
+
+    @classmethod
+    def get_stored_cols(cls) -> List[str]:
+        return [cls.PERIOD, cls.CAT, cls.CAT_GROUP, cls.PAYEE, *cls.get_value_cols()]
+
+
+class PayeeInterner:
+    """
+    Append only mapping of payee names to ids, shared by all versions of the
+    payee cube so ids stay valid in older cubes
+    """
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._lock = threading.Lock()
+
+    def intern(self, payees: pd.Series) -> np.ndarray:
+        """ ids of the payees, new payees are given the next ids """
+        payees = payees.astype(object).where(payees.notna(), '')
+        with self._lock:
+            for name in payees.unique():
+                if name not in self._ids:
+                    self._ids[name] = len(self._names)
+                    self._names.append(name)
+            return payees.map(self._ids).to_numpy(dtype=np.int64)
+
+    def get_names(self, ids: np.ndarray) -> List[str]:
+        return [self._names[payee_id] for payee_id in ids]
+
+    def __len__(self):
+        return len(self._names)
+
+
+class PayeeCube:
+    """
+    Charges (outflow and count) per period, category, group and payee id.
+    Immutable, like aggregates.RollupCube - apply_delta returns a new cube
+    """
+    def __init__(self, interner: Optional[PayeeInterner] = None):
+        self._interner = PayeeInterner() if interner is None else interner
+        self._cube = pd.DataFrame(
+            columns=PayeeSchema.get_value_cols(), dtype=float,
+            index=pd.MultiIndex.from_arrays([[]] * 4, names=PayeeSchema.get_key_cols()))
+
+    @classmethod
+    def from_rows(cls, df: pd.DataFrame,
+                  interner: Optional[PayeeInterner] = None,
+                  stored_aggregates: Optional[pd.DataFrame] = None) -> 'PayeeCube':
+        """
+        build a cube from transactions
+        :param stored_aggregates: aggregates (see aggregate_payees) of months
+                                  whose rows are not in df
+        """
+        cube = cls(interner)
+        cube._cube = cube._aggregate(df)
+        if stored_aggregates is not None and len(stored_aggregates):
+            cube._cube = cube._cube.add(cube._from_stored(stored_aggregates), fill_value=0)
+        return cube
+
+    def _from_stored(self, aggs: pd.DataFrame) -> pd.DataFrame:
+        keys = [aggs[PayeeSchema.PERIOD].astype(np.int64), aggs[PayeeSchema.CAT],
+                aggs[PayeeSchema.CAT_GROUP],
+                pd.Series(self._interner.intern(aggs[PayeeSchema.PAYEE]), index=aggs.index,
+                          name=PayeeSchema.PAYEE_ID)]
+        return aggs[PayeeSchema.get_value_cols()].astype(float).groupby(keys).sum()
+
+    def to_stored(self) -> pd.DataFrame:
+        """ the aggregates keyed by payee name, see aggregate_payees """
+        aggs = self._cube.reset_index()
+        aggs[PayeeSchema.PAYEE] = self._interner.get_names(aggs[PayeeSchema.PAYEE_ID])
+        return aggs[PayeeSchema.get_stored_cols()]
+
+    def _aggregate(self, df: pd.DataFrame) -> pd.DataFrame:
+        charges = df[(df[TransDBSchema.OUTFLOW] > 0) & ~is_transfer(df)]
+        keys = [get_period_keys(charges[TransDBSchema.DATE]).rename(PayeeSchema.PERIOD)]
+        for col in [PayeeSchema.CAT, PayeeSchema.CAT_GROUP]:
+            keys.append(charges[col].astype(object).where(charges[col].notna(), ''))
+        keys.append(pd.Series(self._interner.intern(charges[TransDBSchema.PAYEE]),
+                              index=charges.index, name=PayeeSchema.PAYEE_ID))
+        values = pd.DataFrame({PayeeSchema.OUTFLOW: charges[TransDBSchema.OUTFLOW],
+                               PayeeSchema.COUNT: 1.})
+        return values.groupby(keys).sum()
+
+    def apply_delta(self,
+                    removed: Optional[pd.DataFrame] = None,
+                    added: Optional[pd.DataFrame] = None) -> 'PayeeCube':
+        """
+        :param removed: rows as they were before the change
+        :param added: rows as they are after the change
+        :return: a new cube with the change applied
+        """
+        cube = self._cube
+        if added is not None and len(added):
+            cube = cube.add(self._aggregate(added), fill_value=0)
+        if removed is not None and len(removed):
+            cube = cube.sub(self._aggregate(removed), fill_value=0)
+        if cube is self._cube:
+            return self
+
+        new_cube = PayeeCube(self._interner)
+        new_cube._cube = cube[cube[PayeeSchema.COUNT] > 0]
+        return new_cube
+
+    def get_top(self,
+                k: int = 10,
+                by: str = PayeeSchema.OUTFLOW,
+                periods: Optional[List[int]] = None,
+                cat: Optional[str] = None,
+                cat_group: Optional[str] = None) -> pd.DataFrame:
+        """
+        :param by: PayeeSchema.OUTFLOW or PayeeSchema.COUNT
+        :param periods: period keys to sum, all periods if None
+        :param cat: if given, only the charges of this category
+        :param cat_group: if given, only the charges of this group
+        :return: the top k payees by the by col, one row per payee (index) with
+                 its outflow and count, in descending order
+        """
+        cube = self._cube
+        mask = np.ones(len(cube), dtype=bool)
+        for level, values in [(PayeeSchema.PERIOD, periods),
+                              (PayeeSchema.CAT, None if cat is None else [cat]),
+                              (PayeeSchema.CAT_GROUP, None if cat_group is None else [cat_group])]:
+            if values is not None:
+                mask &= cube.index.get_level_values(level).isin(values)
+
+        ids = cube.index.get_level_values(PayeeSchema.PAYEE_ID).to_numpy(dtype=np.int64)[mask]
+        totals = {col: np.bincount(ids, weights=cube[col].to_numpy()[mask],
+                                   minlength=len(self._interner))
+                  for col in PayeeSchema.get_value_cols()}
+        top_ids = np.flatnonzero(totals[PayeeSchema.COUNT] > 0)
+        if len(top_ids) > k:
+            top_ids = top_ids[np.argpartition(-totals[by][top_ids], k - 1)[:k]]
+        top_ids = top_ids[np.argsort(-totals[by][top_ids], kind='stable')]
+
+        top = pd.DataFrame({col: totals[col][top_ids] for col in PayeeSchema.get_value_cols()},
+                           index=pd.Index(self._interner.get_names(top_ids),
+                                          name=PayeeSchema.PAYEE))
+        top[PayeeSchema.COUNT] = top[PayeeSchema.COUNT].astype(np.int64)
+        return top
+
+    def equals(self, other: 'PayeeCube') -> bool:
+        """ whether both cubes hold the same totals, up to float rounding """
+        this, other = self._cube.align(other._cube, fill_value=0)
+        return np.allclose(this.to_numpy(dtype=float), other.to_numpy(dtype=float))
+
+
+def aggregate_payees(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    aggregate charges to monthly totals per payee, stored to represent cold
+    months in the payee cube
+    :param df: transactions with at least the analytics cols of TransDBSchema
+               and the payee
+    :return: one row per period, category, group and payee name
+    """
+    return PayeeCube.from_rows(df).to_stored()
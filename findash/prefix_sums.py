@@ -0,0 +1,193 @@
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from findash.trans_schema import TransDBSchema
+from findash.transfers import is_transfer
+
+"""
+Daily cumulative sums of the transaction amounts per value of a key col
+(category or account). The total of any date range is the cumulative sum at its
+end minus the one before its start, so spend over pay cycles or other
+arbitrary periods is answered without masking the rows. The sums per account
+are of outflow minus inflow, as the sign of the raw amount depends on the
+inflow sign of the account. The daily sums of a month can be stored (see
+get_daily_sums), so the sums of months whose rows are not loaded are still in
+the index.
+"""
+
+
+class DailySumsSchema:
+    KEY_COL: str = 'key_col'
+    KEY: str = 'key'
+    DATE: str = TransDBSchema.DATE
+    AMOUNT: str = TransDBSchema.AMOUNT
+
+    @classmethod
+    def get_cols(cls):
+        return [cls.KEY_COL, cls.KEY, cls.DATE, cls.AMOUNT]
+
+
+class PrefixSumIndex:
+    """
+    Immutable, like aggregates.RollupCube - apply_delta returns a new index.
+    Days without transactions are not stored, a lookup uses the last stored
+    day before it
+    """
+    def __init__(self, key_col: str, daily: Optional[pd.DataFrame] = None):
+        """
+        :param key_col: the col of TransDBSchema the sums are kept by
+        :param daily: amount per day (sorted index) and key (cols)
+        """
+        self.key_col = key_col
+        self._daily = pd.DataFrame(dtype=float) if daily is None else daily
+        self._cumsum = self._daily.to_numpy(dtype=float).cumsum(axis=0)
+
+    @classmethod
+    def from_rows(cls, df: pd.DataFrame, key_col: str,
+                  stored_daily_sums: Optional[pd.DataFrame] = None) -> 'PrefixSumIndex':
+        """
+        build an index from transactions
+        :param stored_daily_sums: daily sums (see get_daily_sums) of days whose
+                                  rows are not in df
+        """
+        daily = cls._to_daily(df, key_col)
+        if stored_daily_sums is not None:
+            stored = stored_daily_sums[stored_daily_sums[DailySumsSchema.KEY_COL] == key_col]
+            if len(stored):
+                daily = daily.add(stored.pivot_table(
+                    index=DailySumsSchema.DATE, columns=DailySumsSchema.KEY,
+                    values=DailySumsSchema.AMOUNT, aggfunc='sum', fill_value=0.),
+                    fill_value=0).fillna(0).sort_index()
+        return cls(key_col, daily.astype(float))
+
+    @staticmethod
+    def _to_daily(df: pd.DataFrame, key_col: str) -> pd.DataFrame:
+        # transfers move money between accounts, they only count in the sums
+        # per account
+        if key_col != TransDBSchema.ACCOUNT:
+            df = df[~is_transfer(df)]
+        # uncategorized rows are kept under an empty key, as in the aggregates
+        keys = df[key_col].astype(object).where(df[key_col].notna(), '')
+        daily = _get_amounts(df, key_col).groupby(
+            [df[TransDBSchema.DATE].dt.normalize(), keys]).sum()
+        return daily.unstack(fill_value=0).astype(float)
+
+    def apply_delta(self,
+                    removed: Optional[pd.DataFrame] = None,
+                    added: Optional[pd.DataFrame] = None) -> 'PrefixSumIndex':
+        """
+        :param removed: rows as they were before the change
+        :param added: rows as they are after the change
+        :return: a new index with the change applied. Only the cumulative sums
+                 from the first changed day on are recomputed
+        """
+        deltas = []
+        if added is not None and len(added):
+            deltas.append(self._to_daily(added, self.key_col))
+        if removed is not None and len(removed):
+            deltas.append(-self._to_daily(removed, self.key_col))
+        if not len(deltas):
+            return self
+
+        delta = deltas[0] if len(deltas) == 1 else deltas[0].add(deltas[1], fill_value=0)
+        daily = self._daily.add(delta, fill_value=0).fillna(0)
+
+        # days before the first changed one keep their sums, new keys start at 0
+        first_changed = daily.index.searchsorted(delta.index.min())
+        cumsum = np.empty(daily.shape)
+        cumsum[:first_changed] = pd.DataFrame(
+            self._cumsum[:first_changed], columns=self._daily.columns).reindex(
+            columns=daily.columns, fill_value=0).to_numpy()
+        base = cumsum[first_changed - 1] if first_changed else 0
+        cumsum[first_changed:] = base + daily.to_numpy()[first_changed:].cumsum(axis=0)
+
+        new_index = PrefixSumIndex(self.key_col)
+        new_index._daily = daily
+        new_index._cumsum = cumsum
+        return new_index
+
+    def get_range_totals(self, start_date: pd.Timestamp, end_date: pd.Timestamp) -> pd.Series:
+        """
+        :return: total amount per key between two dates, inclusive
+        """
+        return self.get_ranges_totals([start_date], [end_date]).iloc[0]
+
+    def get_range_total(self, start_date: pd.Timestamp, end_date: pd.Timestamp,
+                        key: str) -> float:
+        """ total amount of a single key between two dates, inclusive """
+        return self.get_range_totals(start_date, end_date).get(key, 0.)
+
+    def get_ranges_totals(self, start_dates: Iterable[pd.Timestamp],
+                          end_dates: Iterable[pd.Timestamp]) -> pd.DataFrame:
+        """
+        :return: total amount per range (rows, in the order given) and key
+                 (cols), between the start and end dates of each range,
+                 inclusive
+        """
+        start_dates = pd.DatetimeIndex(start_dates).normalize().to_numpy()
+        end_dates = pd.DatetimeIndex(end_dates).normalize().to_numpy()
+        days = self._daily.index.to_numpy()
+        totals = self._get_cumsum_until(days.searchsorted(end_dates, side='right')) - \
+            self._get_cumsum_until(days.searchsorted(start_dates, side='left'))
+        return pd.DataFrame(totals, columns=self._daily.columns, dtype=float)
+
+    def get_totals_until(self, end_date: pd.Timestamp) -> pd.Series:
+        """ total amount per key from the first stored day to a date, inclusive """
+        days = self._daily.index.to_numpy()
+        num_days = days.searchsorted(pd.DatetimeIndex([end_date]).normalize().to_numpy(),
+                                     side='right')
+        return pd.Series(self._get_cumsum_until(num_days)[0], index=self._daily.columns,
+                         dtype=float)
+
+    def get_cumulative(self) -> pd.DataFrame:
+        """ total amount per key (cols) up to the end of every stored day (index) """
+        return pd.DataFrame(self._cumsum, index=self._daily.index, columns=self._daily.columns,
+                            dtype=float)
+
+    def _get_cumsum_until(self, num_days: np.ndarray) -> np.ndarray:
+        """ cumulative sums of the first num_days stored days, per num_days """
+        if not len(self._cumsum):
+            return np.zeros((len(num_days), self._cumsum.shape[1]))
+        sums = self._cumsum[np.maximum(num_days - 1, 0)]
+        sums[num_days == 0] = 0
+        return sums
+
+    def equals(self, other: 'PrefixSumIndex', periods: Optional[Iterable[int]] = None) -> bool:
+        """
+        whether both indexes hold the same sums, up to float rounding
+        :param periods: period keys of the months whose days are compared, all
+                        if None
+        """
+        this, other = self._daily.align(other._daily, fill_value=0)
+        if periods is not None:
+            days = this.index.to_series()
+            in_periods = (days.dt.year * 100 + days.dt.month).isin(list(periods)).to_numpy()
+            this, other = this[in_periods], other[in_periods]
+        return np.allclose(this.to_numpy(dtype=float), other.to_numpy(dtype=float))
+
+
+def _get_amounts(df: pd.DataFrame, key_col: str) -> pd.Series:
+    """ the amount of every row as summed by the key col """
+    if key_col != TransDBSchema.ACCOUNT:
+        return df[TransDBSchema.AMOUNT]
+    # as in the integrity checks, the flow cols are compared by their
+    # absolute values whatever the inflow sign of the account
+    return df[TransDBSchema.OUTFLOW].abs() - df[TransDBSchema.INFLOW].abs()
+
+
+def get_daily_sums(df: pd.DataFrame, key_cols: Iterable[str]) -> pd.DataFrame:
+    """
+    amount per day and key of each of the key cols as one long frame (see
+    DailySumsSchema), e.g. to store the sums of a month
+    """
+    sums = []
+    for key_col in key_cols:
+        daily = PrefixSumIndex._to_daily(df, key_col)
+        daily = daily.rename_axis(index=DailySumsSchema.DATE, columns=DailySumsSchema.KEY)
+        sums.append(daily.stack().rename(DailySumsSchema.AMOUNT).reset_index().assign(
+            **{DailySumsSchema.KEY_COL: key_col}))
+    if not len(sums):
+        return pd.DataFrame(columns=DailySumsSchema.get_cols())
+    return pd.concat(sums, ignore_index=True)[DailySumsSchema.get_cols()]
@@ -0,0 +1,64 @@
+from typing import Optional
+
+import pandas as pd
+
+from findash.aggregates import AggSchema, period_key_to_timestamp, shift_period_key
+
+"""
+Projection of the end of month spend per category. A category is projected to
+spend what it spent so far this month plus the average of what it spent in
+the rest of the prior months from the same day of the month on. Both come from
+the daily prefix sums of the transactions db, so no rows are scanned.
+"""
+
+# number of prior months the rest of month spend is averaged over
+LOOKBACK_MONTHS = 6
+
+
+class ProjectionSchema:
+    SPENT: str = 'spent'
+    PROJECTED: str = 'projected'
+
+
+def project_month_end(trans_db,  # TransactionsDBParquet, not imported to avoid a cycle
+                      period: int,
+                      as_of: Optional[pd.Timestamp] = None,
+                      lookback_months: int = LOOKBACK_MONTHS) -> pd.DataFrame:
+    """
+    :param period: period key of the month to project
+    :param as_of: the last day whose spend is known, defaults to today. Months
+                  that ended by then are projected to their actual spend
+    :return: spend so far and projected spend of the month per category (index)
+    """
+    as_of = (pd.Timestamp.today() if as_of is None else as_of).normalize()
+    month_start = period_key_to_timestamp(pd.Series([period])).iloc[0]
+    month_end = month_start + pd.offsets.MonthEnd(0)
+    if as_of >= month_end:
+        spent = trans_db.get_range_totals(month_start, month_end)
+        return pd.DataFrame({ProjectionSchema.SPENT: spent, ProjectionSchema.PROJECTED: spent})
+
+    # none are known for a month that did not start yet
+    days_known = max((as_of - month_start).days + 1, 0)
+    spent = trans_db.get_range_totals(month_start,
+                                      month_start + pd.Timedelta(days=days_known - 1))
+
+    # the rest of the prior months with transactions, from the same day on
+    stored_periods = set(trans_db.cube.aggregates[AggSchema.PERIOD].unique())
+    prior_periods = [prior for prior in
+                     (shift_period_key(period, -months) for months in range(1, lookback_months + 1))
+                     if prior in stored_periods]
+    if not len(prior_periods):
+        return pd.DataFrame({ProjectionSchema.SPENT: spent, ProjectionSchema.PROJECTED: spent})
+
+    prior_starts = period_key_to_timestamp(pd.Series(prior_periods))
+    prior_ends = prior_starts + pd.offsets.MonthEnd(0)
+    rest_starts = prior_starts + pd.Timedelta(days=days_known)
+    # shorter months may have no days left, their ranges must be empty
+    no_days_left = (rest_starts > prior_ends).to_numpy()
+    rest_of_month = trans_db.get_ranges_totals(list(rest_starts.where(~no_days_left, prior_ends)),
+                                               list(prior_ends))
+    rest_of_month.loc[no_days_left] = 0
+
+    projected = spent.add(rest_of_month.mean(), fill_value=0)
+    return pd.DataFrame({ProjectionSchema.SPENT: spent.reindex(projected.index, fill_value=0),
+                         ProjectionSchema.PROJECTED: projected})
@@ -0,0 +1,177 @@
+import threading
+from typing import Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from findash.aggregates import get_period_keys, period_key_to_timestamp
+from findash.file_io import FileIO
+from findash.trans_schema import TransDBSchema
+
+"""
+Reconciliation of credit card bills against the checking accounts. The charges
+of a card in a month (its billing cycle) are paid from a checking account in
+one lump sum in the days after the cycle ends. The cycle totals are joined to
+the checking payments on the amount in agorot, and the pairs are kept where the
+payment falls in the window after the cycle. The rows of a matched cycle and
+its payment are marked reconciled. A cycle left without a matching payment is
+a mismatch, reported with the payment in its window closest in amount, if any.
+"""
+
+# days after the end of a billing cycle in which its payment is expected
+PAYMENT_WINDOW_DAYS = 20
+# a payment is reported as the likely payment of a mismatched cycle if it is
+# within this fraction of the cycle total
+MISMATCH_TOL = 0.1
+
+
+class ReconcileSchema:
+    ACCOUNT: str = TransDBSchema.ACCOUNT
+    PERIOD: str = 'period'
+    TOTAL: str = 'total'
+    PAYMENT_ID: str = 'payment_id'
+    PAYMENT_DATE: str = 'payment_date'
+    PAYMENT: str = 'payment'
+    DELTA: str = 'delta'
+
+    @classmethod
+    def get_cols(cls) -> List[str]:
+        return [cls.ACCOUNT, cls.PERIOD, cls.TOTAL, cls.PAYMENT_ID, cls.PAYMENT_DATE,
+                cls.PAYMENT, cls.DELTA]
+
+
+def _to_agorot(amounts: pd.Series) -> pd.Series:
+    return (amounts * 100).round().astype(np.int64)
+
+
+def get_cycles(db: pd.DataFrame,
+               card_accounts: List[str],
+               periods: Iterable[int]) -> pd.DataFrame:
+    """
+    :param periods: period keys of the cycles
+    :return: total amount per card account and period, whether all the rows of
+             the cycle are already reconciled and the window its payment is
+             expected in
+    """
+    period_keys = get_period_keys(db[TransDBSchema.DATE])
+    rows = db[db[TransDBSchema.ACCOUNT].isin(card_accounts) & period_keys.isin(periods)]
+    cycles = rows.groupby([rows[TransDBSchema.ACCOUNT].astype(object),
+                           period_keys[rows.index].rename(ReconcileSchema.PERIOD)]).agg(
+        **{ReconcileSchema.TOTAL: (TransDBSchema.AMOUNT, 'sum'),
+           'done': (TransDBSchema.RECONCILED, 'all')}).reset_index()
+    cycle_end = period_key_to_timestamp(cycles[ReconcileSchema.PERIOD]) + pd.offsets.MonthEnd(0)
+    cycles['window_start'] = cycle_end + pd.Timedelta(days=1)
+    cycles['window_end'] = cycle_end + pd.Timedelta(days=PAYMENT_WINDOW_DAYS)
+    return cycles
+
+
+def match_payments(db: pd.DataFrame,
+                   card_accounts: List[str],
+                   checking_accounts: List[str],
+                   periods: Iterable[int]) -> Tuple[List[str], pd.DataFrame]:
+    """
+    :param periods: period keys of the cycles to reconcile. Cycles whose payment
+                    window is not covered by the checking rows yet are skipped
+    :return: the ids of the rows to mark reconciled, and the mismatches (see
+             ReconcileSchema) of the evaluated cycles
+    """
+    checking = db[db[TransDBSchema.ACCOUNT].isin(checking_accounts)]
+    cycles = get_cycles(db, card_accounts, periods)
+    covered_until = checking[TransDBSchema.DATE].max()
+    # a cycle whose refunds cover its charges has no bill
+    cycles = cycles[~cycles['done'] & (cycles[ReconcileSchema.TOTAL] > 0) &
+                    (cycles['window_end'] <= covered_until)]
+    if not len(cycles):
+        return [], pd.DataFrame(columns=ReconcileSchema.get_cols())
+
+    payments = checking.loc[~checking[TransDBSchema.RECONCILED].astype(bool) &
+                            (checking[TransDBSchema.AMOUNT] > 0) &
+                            checking[TransDBSchema.DATE].between(cycles['window_start'].min(),
+                                                                 cycles['window_end'].max()),
+                            [TransDBSchema.ID, TransDBSchema.DATE, TransDBSchema.AMOUNT]]
+    payments.columns = [ReconcileSchema.PAYMENT_ID, ReconcileSchema.PAYMENT_DATE,
+                        ReconcileSchema.PAYMENT]
+
+    matched = cycles.assign(agorot=_to_agorot(cycles[ReconcileSchema.TOTAL])).merge(
+        payments.assign(agorot=_to_agorot(payments[ReconcileSchema.PAYMENT])), on='agorot')
+    matched = _in_window(matched)
+    # a cycle is paid once and a payment pays one cycle, the earliest first
+    matched = matched.sort_values(ReconcileSchema.PAYMENT_DATE, kind='stable').drop_duplicates(
+        [ReconcileSchema.ACCOUNT, ReconcileSchema.PERIOD]).drop_duplicates(
+        ReconcileSchema.PAYMENT_ID)
+
+    cycle_keys = [ReconcileSchema.ACCOUNT, ReconcileSchema.PERIOD]
+    is_matched = cycles.merge(matched[cycle_keys], how='left', indicator=True)['_merge'] == 'both'
+    unmatched = cycles[~is_matched.to_numpy()]
+    cycle_rows = db[db[TransDBSchema.ACCOUNT].isin(matched[ReconcileSchema.ACCOUNT]) &
+                    get_period_keys(db[TransDBSchema.DATE]).isin(matched[ReconcileSchema.PERIOD])]
+    row_keys = pd.concat([cycle_rows[TransDBSchema.ACCOUNT].astype(object),
+                          get_period_keys(cycle_rows[TransDBSchema.DATE]).rename(
+                              ReconcileSchema.PERIOD)], axis=1)
+    is_paid_row = row_keys.merge(matched[cycle_keys], how='left',
+                                 indicator=True)['_merge'] == 'both'
+    reconciled_ids = [*cycle_rows.loc[is_paid_row.to_numpy(), TransDBSchema.ID],
+                      *matched[ReconcileSchema.PAYMENT_ID]]
+
+    # the closest unmatched payment in the window of each unmatched cycle
+    candidates = _in_window(unmatched.merge(
+        payments[~payments[ReconcileSchema.PAYMENT_ID].isin(matched[ReconcileSchema.PAYMENT_ID])],
+        how='cross'))
+    candidates[ReconcileSchema.DELTA] = \
+        candidates[ReconcileSchema.PAYMENT] - candidates[ReconcileSchema.TOTAL]
+    candidates = candidates[candidates[ReconcileSchema.DELTA].abs() <=
+                            candidates[ReconcileSchema.TOTAL].abs() * MISMATCH_TOL]
+    candidates = candidates.loc[candidates[ReconcileSchema.DELTA].abs().sort_values(
+        kind='stable').index].drop_duplicates(cycle_keys)
+    mismatches = unmatched.merge(candidates[[*cycle_keys, ReconcileSchema.PAYMENT_ID,
+                                             ReconcileSchema.PAYMENT_DATE, ReconcileSchema.PAYMENT,
+                                             ReconcileSchema.DELTA]],
+                                 on=cycle_keys, how='left')
+    return reconciled_ids, mismatches[ReconcileSchema.get_cols()].reset_index(drop=True)
+
+
+def _in_window(pairs: pd.DataFrame) -> pd.DataFrame:
+    """ cycle and payment pairs where the payment is in the window of the cycle """
+    return pairs[(pairs[ReconcileSchema.PAYMENT_DATE] >= pairs['window_start']) &
+                 (pairs[ReconcileSchema.PAYMENT_DATE] <= pairs['window_end'])]
+
+
+class Reconciler:
+    """
+    Runs the reconciliation and keeps the mismatches of all the cycles it
+    evaluated so far in a small state table
+    """
+    def __init__(self,
+                 file_io: FileIO,
+                 state_path: str = 'trans_db_mismatches.pq'):
+        self._file_io = file_io
+        self._state_path = state_path
+        self._lock = threading.Lock()
+        self.mismatches = pd.DataFrame(columns=ReconcileSchema.get_cols())
+
+    def load_state(self) -> None:
+        if self._state_path in self._file_io.get_files_in_dir(''):
+            self.mismatches = self._file_io.load_file(self._state_path)
+
+    def reconcile(self,
+                  db: pd.DataFrame,
+                  card_accounts: List[str],
+                  checking_accounts: List[str],
+                  periods: Iterable[int]) -> List[str]:
+        """
+        see match_payments. The mismatches of the cycles of the given periods
+        are replaced by the new ones
+        :return: the ids of the rows to mark reconciled
+        """
+        periods = list(periods)
+        reconciled_ids, mismatches = match_payments(db, card_accounts, checking_accounts,
+                                                    periods)
+        with self._lock:
+            prev = self.mismatches
+            evaluated = prev[ReconcileSchema.ACCOUNT].isin(card_accounts) & \
+                prev[ReconcileSchema.PERIOD].isin(periods)
+            if len(mismatches) or evaluated.any():
+                self.mismatches = pd.concat([prev[~evaluated], mismatches],
+                                            ignore_index=True)[ReconcileSchema.get_cols()]
+                self._file_io.save_file(self._state_path, self.mismatches)
+        return reconciled_ids
@@ -0,0 +1,175 @@
+import threading
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from findash.trans_schema import TransDBSchema
+
+"""
+Detection of recurring transactions - subscriptions, fixed bills and salaries.
+Transactions are grouped by normalized payee, and a payee is recurring when
+the intervals between its transactions are regular and close to a week, a
+month or a year, and its amounts are stable. The detector keeps the last
+transactions of every payee, so a change to the db only recomputes the payees
+it touches.
+"""
+
+# number of last transactions per payee the detection is based on
+WINDOW_SIZE = 12
+MIN_OCCURRENCES = 3
+# max MAD of the intervals and of the amounts, relative to their median
+INTERVAL_TOL = 0.2
+AMOUNT_TOL = 0.1
+# frequency name: (min, max) days of the median interval
+FREQUENCIES = {'weekly': (6, 8), 'monthly': (26, 35), 'yearly': (350, 380)}
+
+
+class RecurringSchema:
+    PAYEE: str = 'payee'
+    CAT: str = TransDBSchema.CAT
+    COUNT: str = 'count'
+    FREQUENCY: str = 'frequency'
+    INTERVAL: str = 'interval_days'
+    AMOUNT: str = 'expected_amount'
+    LAST_DATE: str = 'last_date'
+    NEXT_DATE: str = 'next_date'
+    IS_RECURRING: str = 'is_recurring'
+
+
+def normalize_payees(payees: pd.Series) -> pd.Series:
+    """
+    lower case payees without digits and punctuation, so the charges of a
+    payee with changing reference numbers group together
+    """
+    return payees.astype(str).str.lower() \
+        .str.replace(r'[\d\W_]+', ' ', regex=True).str.strip()
+
+
+def get_payee_series(history: pd.DataFrame) -> pd.DataFrame:
+    """
+    :param history: transactions with a normalized payee col
+    :return: one row per payee (see RecurringSchema), recurring or not
+    """
+    history = history.sort_values([RecurringSchema.PAYEE, TransDBSchema.DATE], kind='stable')
+    payees = history[RecurringSchema.PAYEE]
+    dates = history[TransDBSchema.DATE]
+    amounts = history[TransDBSchema.AMOUNT]
+
+    same_payee = payees.eq(payees.shift())
+    intervals = dates.diff().dt.days.where(same_payee)
+
+    def get_median_and_mad(values: pd.Series):
+        median = values.groupby(payees).transform('median')
+        return values.groupby(payees).median(), (values - median).abs().groupby(payees).median()
+
+    interval, interval_mad = get_median_and_mad(intervals)
+    amount, amount_mad = get_median_and_mad(amounts)
+    grouped = history.groupby(RecurringSchema.PAYEE)
+    series = pd.DataFrame({
+        RecurringSchema.CAT: grouped[TransDBSchema.CAT].last().astype(object),
+        RecurringSchema.COUNT: grouped.size(),
+        RecurringSchema.INTERVAL: interval,
+        RecurringSchema.AMOUNT: amount,
+        RecurringSchema.LAST_DATE: grouped[TransDBSchema.DATE].max(),
+    })
+    series[RecurringSchema.FREQUENCY] = np.select(
+        [series[RecurringSchema.INTERVAL].between(low, high)
+         for low, high in FREQUENCIES.values()],
+        list(FREQUENCIES), None)
+    # payees with a single transaction have no interval and no next date
+    interval_days = pd.to_timedelta(interval.fillna(0).round(), unit='D')
+    series[RecurringSchema.NEXT_DATE] = (series[RecurringSchema.LAST_DATE] + interval_days).where(
+        interval.notna())
+    series[RecurringSchema.IS_RECURRING] = \
+        (series[RecurringSchema.COUNT] >= MIN_OCCURRENCES) & \
+        series[RecurringSchema.FREQUENCY].notna() & \
+        (interval_mad <= INTERVAL_TOL * interval) & \
+        (amount_mad <= AMOUNT_TOL * amount.abs()) & (amount != 0)
+    return series
+
+
+class RecurringDetector:
+    def __init__(self):
+        self._history = self._to_history(None)
+        self._series = get_payee_series(self._history)
+        self._lock = threading.Lock()
+
+    def fit(self, df: pd.DataFrame) -> None:
+        """ detect from scratch from the rows of the db """
+        history = self._to_history(df)
+        with self._lock:
+            self._history = history
+            self._series = get_payee_series(history)
+
+    def update(self, df: pd.DataFrame) -> None:
+        """ add new transactions and detect again only the payees they touch """
+        self.apply_delta(added=df)
+
+    def apply_delta(self,
+                    removed: Optional[pd.DataFrame] = None,
+                    added: Optional[pd.DataFrame] = None) -> None:
+        """
+        update the detection with the rows a writer removed and added, and
+        detect again only the payees they touch. Removed rows are matched by
+        id, and a payee whose rows were removed is detected from the rows of it
+        that are left in the window
+        :param removed: rows as they were before the change
+        :param added: rows as they are after the change
+        """
+        removed_history = self._to_history(removed, window=False)
+        added_history = self._to_history(added, window=False)
+        if not len(removed_history) and not len(added_history):
+            return
+
+        with self._lock:
+            history = self._history[~self._history[TransDBSchema.ID].isin(
+                removed_history[TransDBSchema.ID].dropna())]
+            history = pd.concat([history, added_history], ignore_index=True)
+            history = history.sort_values(TransDBSchema.DATE, kind='stable')
+            self._history = history.groupby(RecurringSchema.PAYEE).tail(WINDOW_SIZE)
+            touched = pd.concat([removed_history[RecurringSchema.PAYEE],
+                                 added_history[RecurringSchema.PAYEE]]).unique()
+            touched_series = get_payee_series(
+                self._history[self._history[RecurringSchema.PAYEE].isin(touched)])
+            self._series = pd.concat([self._series.drop(index=touched, errors='ignore'),
+                                      touched_series]).sort_index()
+
+    def get_recurring(self) -> pd.DataFrame:
+        """ the recurring series, by next expected date """
+        series = self._series
+        return series[series[RecurringSchema.IS_RECURRING]].sort_values(RecurringSchema.NEXT_DATE)
+
+    def get_constant_categories(self) -> List[str]:
+        """
+        categories whose every payee is recurring - fixed expenses that fit the
+        is_constant flag of the categories db
+        """
+        series = self._series
+        series = series[series[RecurringSchema.CAT].notna() & (series[RecurringSchema.CAT] != '')]
+        all_recurring = series.groupby(RecurringSchema.CAT)[RecurringSchema.IS_RECURRING].all()
+        return all_recurring[all_recurring].index.tolist()
+
+    @staticmethod
+    def _to_history(df: Optional[pd.DataFrame], window: bool = True) -> pd.DataFrame:
+        """
+        :param df: transactions, the id col is optional
+        :param window: keep only the last WINDOW_SIZE transactions of every payee
+        """
+        cols = [TransDBSchema.ID, TransDBSchema.PAYEE, TransDBSchema.DATE, TransDBSchema.CAT,
+                TransDBSchema.AMOUNT]
+        if df is None:
+            df = pd.DataFrame(columns=cols)
+        # rows without a payee (e.g. a blank row added in the table) are no series
+        df = df[(df[TransDBSchema.AMOUNT] != 0) & df[TransDBSchema.PAYEE].notna()]
+        history = pd.DataFrame({
+            TransDBSchema.ID: df[TransDBSchema.ID] if TransDBSchema.ID in df.columns else None,
+            RecurringSchema.PAYEE: normalize_payees(df[TransDBSchema.PAYEE]),
+            TransDBSchema.DATE: pd.to_datetime(df[TransDBSchema.DATE]),
+            TransDBSchema.CAT: df[TransDBSchema.CAT].astype(object),
+            TransDBSchema.AMOUNT: df[TransDBSchema.AMOUNT].astype(float)})
+        history = history[history[RecurringSchema.PAYEE] != '']
+        history = history.sort_values(TransDBSchema.DATE, kind='stable')
+        if not window:
+            return history
+        return history.groupby(RecurringSchema.PAYEE).tail(WINDOW_SIZE)
@@ -0,0 +1,135 @@
+import threading
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from findash.aggregates import AggSchema, RollupCube, get_period_key, get_period_range
+from findash.categories_db import CatDBSchema, CategoriesDB
+from findash.utils import get_current_year_and_month
+
+"""
+Envelope budgeting - the unspent (or overspent) budget of a category carries
+over to its next month, from the category's rollover start month on. The
+balances of the months are a cumulative sum over a period by category matrix
+of budget minus spend, so when the spend of a month changes only the spend and
+the balances from that month on are recomputed.
+"""
+
+
+def get_spent_by_period(aggs: pd.DataFrame,
+                        first_period: int,
+                        last_period: int) -> pd.DataFrame:
+    """
+    :param aggs: monthly aggregates (see aggregates.aggregate_monthly)
+    :return: spend (amount, as in the budget usage) per period (every month
+             from first_period to last_period) and category
+    """
+    aggs = aggs[(aggs[AggSchema.PERIOD] >= first_period) &
+                (aggs[AggSchema.PERIOD] <= last_period)]
+    spent = aggs.pivot_table(index=AggSchema.PERIOD, columns=AggSchema.CAT,
+                             values=AggSchema.AMOUNT, aggfunc='sum', fill_value=0.)
+    return spent.reindex(get_period_range(first_period, last_period), fill_value=0.).astype(float)
+
+
+def compute_balances(spent: pd.DataFrame,
+                     budgets: pd.Series,
+                     starts: pd.Series,
+                     previous: Optional[pd.DataFrame] = None,
+                     first_changed: int = 0) -> pd.DataFrame:
+    """
+    :param spent: see get_spent_by_period
+    :param budgets: monthly budget per category
+    :param starts: rollover start period per category, the cols of the result
+    :param previous: balances of an older spend frame with the same budgets
+                     and starts
+    :param first_changed: see trends.get_first_changed. The balances of the
+                          periods before it are taken from previous
+    :return: available to spend at the end of every period (rows of spent) per
+             category - its budget and what was carried over minus its spend.
+             0 before the rollover start of the category
+    """
+    spent = spent.reindex(columns=starts.index, fill_value=0.)
+    active = spent.index.to_numpy()[:, None] >= starts.to_numpy()[None, :]
+    net = (budgets.reindex(starts.index, fill_value=0.).to_numpy(dtype=float)[None, :] -
+           spent.to_numpy()) * active
+
+    if previous is None:
+        first_changed = 0
+    balances = np.empty(net.shape)
+    balances[:first_changed] = previous.to_numpy()[:first_changed] if first_changed else 0
+    base = balances[first_changed - 1] if first_changed else 0
+    balances[first_changed:] = base + net[first_changed:].cumsum(axis=0)
+    return pd.DataFrame(balances, index=spent.index, columns=starts.index)
+
+
+class RolloverEngine:
+    """
+    Balances of the rollover categories, updated when the rollup cube of the
+    transactions db or the categories db change
+    """
+    def __init__(self,
+                 trans_db,  # TransactionsDBParquet, not imported to avoid a cycle
+                 cat_db: CategoriesDB):
+        self._trans_db = trans_db
+        self._cat_db = cat_db
+        self._cube: Optional[RollupCube] = None
+        self._cat_token: Optional[str] = None
+        # version of the transactions db the balances were computed at
+        self._version: Optional[int] = None
+        self._spent = pd.DataFrame(dtype=float)
+        self._balances = pd.DataFrame(dtype=float)
+        self._lock = threading.Lock()
+
+    def get_carryover(self, period: int) -> pd.Series:
+        """
+        :return: the balance carried into the month per rollover category,
+                 positive if budget was left, negative if it was overspent
+        """
+        with self._lock:
+            self._update()
+            balances = self._balances
+            previous = balances[balances.index < period]
+            if not len(previous):
+                return pd.Series(0., index=balances.columns)
+            return previous.iloc[-1]
+
+    def _update(self) -> None:
+        # the version is read before the cube, so changes published in between
+        # are recomputed again on the next update
+        version = self._trans_db.version
+        cube = self._trans_db.cube
+        cat_token = self._cat_db.get_data_token()
+        if cube is self._cube and cat_token == self._cat_token:
+            return
+
+        starts = self._cat_db.get_rollover_starts()
+        budgets = self._cat_db.db.set_index(CatDBSchema.CAT_NAME)[CatDBSchema.BUDGET]
+        # the balances run to the current month even before it has transactions
+        last_period = get_period_key(*map(int, get_current_year_and_month()))
+        last_period = max(last_period, cube.get_last_period() or last_period)
+        first_period = starts.min() if len(starts) else last_period
+
+        changed = self._trans_db.get_changed_periods(self._version) \
+            if self._version is not None else set()
+        if cat_token == self._cat_token and len(changed) and len(self._spent) and \
+                self._spent.index[0] == first_period:
+            # only the spend of the changed months is pivoted again, the
+            # balances before the first of them hold
+            from_period = max(min(changed), first_period)
+            spent = pd.concat([
+                self._spent[self._spent.index < from_period],
+                get_spent_by_period(cube.get_periods(from_period, last_period),
+                                    from_period, last_period)])
+            spent = spent.reindex(get_period_range(first_period, last_period)).fillna(0.)
+            first_changed = min(spent.index.searchsorted(from_period), len(self._balances))
+            self._balances = compute_balances(spent, budgets, starts, self._balances,
+                                              first_changed)
+        else:
+            spent = get_spent_by_period(cube.get_periods(first_period, last_period),
+                                        first_period, last_period)
+            self._balances = compute_balances(spent, budgets, starts)
+        self._spent = spent
+        self._cube = cube
+        self._cat_token = cat_token
+        self._version = version
@@ -0,0 +1,184 @@
+from dataclasses import dataclass, fields
+from typing import Any, Dict, List, Tuple, Union
+
+import pyarrow as pa
+
+"""
+Schema of the transactions db. Kept apart from transactions_db so modules that
+maintain derived data over the transactions can use it without a circular import.
+"""
+
+
+@dataclass
+class TransDBSchema:
+    ID: str = 'id'
+    DATE: str = 'date'
+    PAYEE: str = 'payee'
+    CAT: str = 'cat'
+    CAT_GROUP: str = 'cat_group'
+    MEMO: str = 'memo'
+    ACCOUNT: str = 'account'
+    INFLOW: float = 'inflow'  # if forex trans will show the conversion to ils here
+    OUTFLOW: float = 'outflow'  # if forex trans will show the conversion to ils here
+    RECONCILED: bool = 'reconciled'
+    AMOUNT: float = 'amount'  # can be in forex
+    SPLIT: str = 'split'
+    VERSION: int = 'version'  # incremented on every edit of the row
+    TRANSFER: str = 'transfer'  # id of the other row of a transfer between accounts
+
+    @classmethod
+    def col_display_name_mapping(cls):
+        return {
+            cls.DATE: 'Date',
+            cls.PAYEE: 'Payee',
+            cls.CAT: 'Category',
+            cls.CAT_GROUP: 'Group',
+            cls.MEMO: 'Memo',
+            cls.ACCOUNT: 'Account',
+            cls.AMOUNT: 'Amount',
+            cls.INFLOW: 'Inflow',
+            cls.OUTFLOW: 'Outflow',
+            cls.ID: 'ID',
+            cls.VERSION: 'Version'
+        }
+
+    @classmethod
+    def get_mandatory_col_sets(cls) -> Tuple[List[Union[str, float]]]:
+        """
+        mandatory cols every raw transactions file must have
+        """
+        option1 = [cls.DATE, cls.PAYEE, cls.AMOUNT]
+        option2 = [cls.DATE, cls.PAYEE, cls.INFLOW, cls.OUTFLOW]
+        return option1, option2
+
+    @classmethod
+    def get_col_order_for_table(cls):
+        return [TransDBSchema.DATE, TransDBSchema.PAYEE,
+                TransDBSchema.AMOUNT, TransDBSchema.INFLOW, TransDBSchema.OUTFLOW,
+                TransDBSchema.CAT, TransDBSchema.MEMO, TransDBSchema.ACCOUNT, TransDBSchema.ID,
+                TransDBSchema.VERSION]
+
+    @classmethod
+    def get_cols_for_trans_drawer(cls) -> List[str]:
+        return [cls.DATE, cls.PAYEE, cls.MEMO, cls.INFLOW, cls.OUTFLOW]
+
+    @classmethod
+    def get_non_mandatory_cols(cls) -> Dict[str, Any]:
+        """
+        dictionary of non-mandatory cols (keys) to add to trans file to align with
+        DB schema along with default values (values)
+        """
+        return {cls.CAT: '',
+                cls.CAT_GROUP: '',
+                cls.MEMO: '',
+                cls.ACCOUNT: None,
+                cls.INFLOW: 0,
+                cls.OUTFLOW: 0,
+                cls.RECONCILED: False,
+                cls.SPLIT: None,
+                cls.VERSION: 0,
+                cls.TRANSFER: None}
+
+    @classmethod
+    def get_db_col_names(cls):
+        return [f.name for f in fields(cls)]
+
+    @classmethod
+    def get_db_col_vals(cls):
+        return [f.default for f in fields(cls)]
+
+    @classmethod
+    def get_db_col_dict(cls):
+        return dict(zip(cls.get_db_col_names(), cls.get_db_col_vals()))
+
+    @classmethod
+    def get_numeric_cols(cls):
+        return [cls.INFLOW, cls.OUTFLOW, cls.AMOUNT]
+
+    @classmethod
+    def get_displayed_cols_by_type(cls):
+        return {
+            'date': [cls.DATE],
+            'str': [cls.PAYEE, cls.MEMO, cls.ID],
+            'numeric': [cls.AMOUNT, cls.INFLOW, cls.OUTFLOW],
+            'cat': [cls.CAT, cls.ACCOUNT],
+            'readonly': [cls.VERSION],
+        }
+
+    @classmethod
+    def get_dropdown_cols(cls):
+        return [cls.CAT, cls.ACCOUNT]
+
+    @classmethod
+    def get_categorical_cols(cls):
+        return [cls.CAT, cls.ACCOUNT, cls.CAT_GROUP]
+
+    @classmethod
+    def get_analytics_cols(cls) -> List[str]:
+        """ the only cols the aggregations (cards, figures, budget usage) read """
+        return [cls.DATE, cls.CAT, cls.CAT_GROUP, cls.ACCOUNT,
+                cls.INFLOW, cls.OUTFLOW, cls.AMOUNT, cls.TRANSFER]
+
+    @classmethod
+    def get_resident_cols(cls) -> List[str]:
+        """
+        cols loaded on connect - the analytics cols, the payee the anomaly
+        detection is keyed by, plus the cols identifying and ordering rows
+        """
+        return [cls.ID, *cls.get_analytics_cols(), cls.PAYEE, cls.SPLIT, cls.VERSION]
+
+    @classmethod
+    def get_detail_cols(cls) -> List[str]:
+        """ heavy per-row cols that are loaded only when full rows are needed """
+        resident_cols = cls.get_resident_cols()
+        return [col for col in cls.get_db_col_vals() if col not in resident_cols]
+
+    @classmethod
+    def get_cols_for_dup_checking(cls):
+        """ these cols dictate which transactions are considered duplicates """
+        return [cls.PAYEE, cls.AMOUNT, cls.DATE]
+
+    @classmethod
+    def get_arrow_schema(cls) -> pa.Schema:
+        """
+        the schema every transactions partition is written with and validated
+        against on read. Categorical cols are dictionary encoded so partitions
+        load directly as pd.Categorical
+        """
+        dict_type = pa.dictionary(pa.int32(), pa.string())
+        return pa.schema([
+            pa.field(cls.ID, pa.string()),
+            pa.field(cls.DATE, pa.timestamp('ns')),
+            pa.field(cls.PAYEE, pa.string()),
+            pa.field(cls.CAT, dict_type),
+            pa.field(cls.CAT_GROUP, dict_type),
+            pa.field(cls.MEMO, pa.string()),
+            pa.field(cls.ACCOUNT, dict_type),
+            pa.field(cls.INFLOW, pa.float64()),
+            pa.field(cls.OUTFLOW, pa.float64()),
+            pa.field(cls.RECONCILED, pa.bool_()),
+            pa.field(cls.AMOUNT, pa.float64()),
+            pa.field(cls.SPLIT, pa.string()),
+            pa.field(cls.VERSION, pa.int64()),
+            pa.field(cls.TRANSFER, pa.string()),
+        ])
+
+    @classmethod
+    def get_pandas_dtypes(cls) -> Dict[str, str]:
+        """ dtype names of the in-memory db cols, as loaded from the arrow schema """
+        return {
+            cls.ID: 'object',
+            cls.DATE: 'datetime64[ns]',
+            cls.PAYEE: 'object',
+            cls.CAT: 'category',
+            cls.CAT_GROUP: 'category',
+            cls.MEMO: 'object',
+            cls.ACCOUNT: 'category',
+            cls.INFLOW: 'float64',
+            cls.OUTFLOW: 'float64',
+            cls.RECONCILED: 'bool',
+            cls.AMOUNT: 'float64',
+            cls.SPLIT: 'object',
+            cls.VERSION: 'int64',
+            cls.TRANSFER: 'object',
+        }
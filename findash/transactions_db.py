@@ -1,128 +1,89 @@
-from dataclasses import dataclass, fields
 from datetime import datetime
-from functools import reduce
+from functools import reduce, wraps
 from pathlib import Path
-from typing import Any, Dict, List, Tuple, Optional, Union
+from typing import Any, Dict, List, Tuple, Optional, Iterable, Set
+import contextlib
 import logging
+import threading
 
 import pandas as pd
+import pyarrow as pa
 
-from findash.categories_db import CategoriesDB
+from findash.categories_db import CategoriesDB, CatDBSchema
 from findash.utils import create_uuid, format_date_col_for_display, \
     check_null, get_current_year_and_month, Change, ChangeType, START_DATE_DEFAULT
 from findash.change_list import ChangeList
 from findash.file_io import FileIO
+from findash.trans_schema import TransDBSchema
+from findash.dedupe_index import DedupeIndex
+from findash.prefix_sums import PrefixSumIndex, get_daily_sums
+from findash.anomalies import AnomalyDetector, AnomalySchema
+from findash.recurring import RecurringDetector
+from findash.payees import PayeeCube, PayeeSchema, aggregate_payees
+from findash.alerts import AlertSchema, BudgetAlertEngine
+from findash.reconcile import Reconciler, ReconcileSchema
+from findash.rollover import RolloverEngine
+from findash.transfers import TRANSFER_WINDOW_DAYS, TransferSchema, find_transfers
+from findash.aggregates import RollupCube, aggregate_monthly, empty_aggregates, get_period_key, \
+    get_period_keys, shift_period_key
 
 """
 The purpose of this module is to provide a database for transactions.
 The database in a collection of parquet files, one per month, organized by year.
 This is the recorded history of the transactions.
+
+Concurrency model: the in-memory db is copy-on-write. Readers take the current
+frame (see `snapshot`) and never see it change under them. Writers hold a single
+writer lock, build a new frame and publish it with one reference assignment.
+A published frame must therefore never be mutated in place.
+
+Tiering: when created with hot_months, only the partitions of the last hot_months
+months are resident. Older (cold) months are represented by their monthly
+aggregates and daily sums, which are stored next to the partitions, and their
+rows are loaded back only when a period is drilled into (see `thaw_range`) or
+written to, and dropped again when the drill in ends or the write is saved.
+Reads of totals and balances never load them.
+
+Rollup cube: monthly totals of the whole history (see aggregates.RollupCube) are
+kept up to date by every writer passing the rows it removed and added to
+`_apply_row_delta` before publishing, so aggregations never scan the rows.
+The same hook maintains daily prefix sums per category and per account (see
+prefix_sums.py) for totals over arbitrary date ranges. Like the cube, they
+cover the cold months too. Budget alerts are evaluated on the changed rows once
+their version is published.
 """
 
 logger = logging.getLogger('Logger')
 
+# the cols the daily prefix sums are kept by
+PREFIX_SUM_COLS = [TransDBSchema.CAT, TransDBSchema.ACCOUNT]
 
-@dataclass
-class TransDBSchema:
-    ID: str = 'id'
-    DATE: str = 'date'
-    PAYEE: str = 'payee'
-    CAT: str = 'cat'
-    CAT_GROUP: str = 'cat_group'
-    MEMO: str = 'memo'
-    ACCOUNT: str = 'account'
-    INFLOW: float = 'inflow'  # if forex trans will show the conversion to ils here
-    OUTFLOW: float = 'outflow'  # if forex trans will show the conversion to ils here
-    RECONCILED: bool = 'reconciled'
-    AMOUNT: float = 'amount'  # can be in forex
-    SPLIT: str = 'split'
-
-    @classmethod
-    def col_display_name_mapping(cls):
-        return {
-            cls.DATE: 'Date',
-            cls.PAYEE: 'Payee',
-            cls.CAT: 'Category',
-            cls.CAT_GROUP: 'Group',
-            cls.MEMO: 'Memo',
-            cls.ACCOUNT: 'Account',
-            cls.AMOUNT: 'Amount',
-            cls.INFLOW: 'Inflow',
-            cls.OUTFLOW: 'Outflow',
-            cls.ID: 'ID'
-        }
-
-    @classmethod
-    def get_mandatory_col_sets(cls) -> Tuple[List[Union[str, float]]]:
-        """
-        mandatory cols every raw transactions file must have
-        """
-        option1 = [cls.DATE, cls.PAYEE, cls.AMOUNT]
-        option2 = [cls.DATE, cls.PAYEE, cls.INFLOW, cls.OUTFLOW]
-        return option1, option2
-
-    @classmethod
-    def get_col_order_for_table(cls):
-        return [TransDBSchema.DATE, TransDBSchema.PAYEE,
-                TransDBSchema.AMOUNT, TransDBSchema.INFLOW, TransDBSchema.OUTFLOW,
-                TransDBSchema.CAT, TransDBSchema.MEMO, TransDBSchema.ACCOUNT, TransDBSchema.ID]
-
-    @classmethod
-    def get_cols_for_trans_drawer(cls) -> List[str]:
-        return [cls.DATE, cls.PAYEE, cls.MEMO, cls.INFLOW, cls.OUTFLOW]
-
-    @classmethod
-    def get_non_mandatory_cols(cls) -> Dict[str, Any]:
-        """
-        dictionary of non-mandatory cols (keys) to add to trans file to align with
-        DB schema along with default values (values)
-        """
-        return {cls.CAT: '',
-                cls.CAT_GROUP: '',
-                cls.MEMO: '',
-                cls.ACCOUNT: None,
-                cls.INFLOW: 0,
-                cls.OUTFLOW: 0,
-                cls.RECONCILED: False,
-                cls.SPLIT: None}
-
-    @classmethod
-    def get_db_col_names(cls):
-        return [f.name for f in fields(cls)]
-
-    @classmethod
-    def get_db_col_vals(cls):
-        return [f.default for f in fields(cls)]
 
-    @classmethod
-    def get_db_col_dict(cls):
-        return dict(zip(cls.get_db_col_names(), cls.get_db_col_vals()))
-
-    @classmethod
-    def get_numeric_cols(cls):
-        return [cls.INFLOW, cls.OUTFLOW, cls.AMOUNT]
+def _writer(method):
+    """
+    run a mutating method of TransactionsDBParquet under the db writer lock.
+    The method works on the cols that are resident, see _full_row_writer
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._write_lock:
+            return method(self, *args, **kwargs)
 
-    @classmethod
-    def get_displayed_cols_by_type(cls):
-        return {
-            'date': [cls.DATE],
-            'str': [cls.PAYEE, cls.MEMO, cls.ID],
-            'numeric': [cls.AMOUNT, cls.INFLOW, cls.OUTFLOW],
-            'cat': [cls.CAT, cls.ACCOUNT],
-        }
+    return wrapper
 
-    @classmethod
-    def get_dropdown_cols(cls):
-        return [cls.CAT, cls.ACCOUNT]
 
-    @classmethod
-    def get_categorical_cols(cls):
-        return [cls.CAT, cls.ACCOUNT, cls.CAT_GROUP]
+def _full_row_writer(method):
+    """
+    like _writer, for methods that read or write the detail cols, which are
+    loaded first
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._write_lock:
+            self._load_detail_cols()
+            return method(self, *args, **kwargs)
 
-    @classmethod
-    def get_cols_for_dup_checking(cls):
-        """ these cols dictate which transactions are considered duplicates """
-        return [cls.PAYEE, cls.AMOUNT, cls.DATE]
+    return wrapper
 
 
 class TransactionsDBParquet:
@@ -130,10 +91,19 @@ class TransactionsDBParquet:
                  file_io: FileIO,
                  cat_db: CategoriesDB,
                  accounts: dict,  # todo - how to solve the problem that I cannot import accounts type for typing?
-                 db: pd.DataFrame = pd.DataFrame()):
-
+                 db: pd.DataFrame = pd.DataFrame(),
+                 hot_months: Optional[int] = None):
+        """
+        :param hot_months: number of recent months kept resident. None keeps the
+                           whole history resident
+        """
         self._file_io = file_io
         self._path_from_data_root = 'trans_db'
+        self._agg_path_from_data_root = 'trans_db_agg'
+        # the daily sums per account were once of the raw amount, months
+        # stored before are summed again from their partitions
+        self._daily_path_from_data_root = 'trans_db_daily_flows'
+        self._payees_path_from_data_root = 'trans_db_payees'
         self._db: pd.DataFrame = db
         self._full_db: pd.DataFrame = db.copy()
         self._filtered_db: pd.DataFrame = db.copy()
@@ -142,6 +112,27 @@ class TransactionsDBParquet:
         self._specific_month_date: str = ''
         self.change_list = ChangeList()
         self._applied_filters = {}
+        self._write_lock = threading.RLock()
+        self._version = 0
+        self._detail_cols_loaded = True
+        self._hot_months = hot_months
+        self._cold_periods: Set[int] = set()
+        # cold months thawed for the transactions page, see thaw_range
+        self._drilled_periods: Set[int] = set()
+        # period key: version of the db in which the rows of the month last changed
+        self._period_versions: Dict[int, int] = {}
+        self._cube = RollupCube()
+        self._prefix_sums = self._build_prefix_sums(pd.DataFrame())
+        self._payee_cube = PayeeCube()
+        self._dedupe_index = DedupeIndex(file_io)
+        self._anomaly_detector = AnomalyDetector(file_io)
+        self._recurring_detector = RecurringDetector()
+        self._rollover_engine = RolloverEngine(self, cat_db)
+        self._alert_engine = BudgetAlertEngine(file_io, cat_db,
+                                               self._rollover_engine.get_carryover)
+        # rows passed to _apply_row_delta whose alerts are evaluated on publish
+        self._unevaluated_rows: List[Optional[pd.DataFrame]] = []
+        self._reconciler = Reconciler(file_io)
 
     def __getitem__(self, item):
         return TransactionsDBParquet(self._file_io,
@@ -149,16 +140,6 @@ class TransactionsDBParquet:
                                      self._accounts,
                                      self._db.__getitem__(item))
 
-    def __getattr__(self, item):
-        return self._db.__getattr__(item)
-
-    def __setitem__(self, name, value):
-        return TransactionsDBParquet(
-            self._file_io,
-            self._cat_db,
-            self._accounts,
-            self._db.__setitem__(name, value))
-
     def __eq__(self, other):
         return self._db.__eq__(other)
 
@@ -180,72 +161,597 @@ class TransactionsDBParquet:
     def __len__(self):
         return len(self._db)
 
-    def connect(self):
+    def _publish(self, db: pd.DataFrame) -> None:
+        """
+        make a new version of the db visible to readers. The frame must not be
+        modified after it was published
+        """
+        self._db = db
+        self._version += 1
+        self._evaluate_alerts()
+
+    def _evaluate_alerts(self) -> None:
+        """ evaluate the budget alerts on the rows changed in the published version """
+        changed_rows, self._unevaluated_rows = self._unevaluated_rows, []
+        if len(changed_rows):
+            self._alert_engine.evaluate(self._cube, changed_rows,
+                                        get_period_key(*map(int, get_current_year_and_month())))
+
+    def _apply_row_delta(self,
+                         removed: Optional[pd.DataFrame] = None,
+                         added: Optional[pd.DataFrame] = None) -> None:
+        """
+        update the derived data of the db with the rows a writer is about to
+        replace. Called before the new db is published, so readers that see a
+        new version also see its derived data
+        :param removed: the rows as they are in the current db
+        :param added: the rows as they will be in the published db
+        """
+        self._cube = self._cube.apply_delta(removed, added)
+        self._prefix_sums = {col: index.apply_delta(removed, added)
+                             for col, index in self._prefix_sums.items()}
+        self._payee_cube = self._payee_cube.apply_delta(removed, added)
+        self._recurring_detector.apply_delta(removed, added)
+        for rows in [removed, added]:
+            if rows is not None:
+                self._mark_changed(get_period_keys(rows[TransDBSchema.DATE]).unique())
+        self._unevaluated_rows.extend([removed, added])
+
+    def _mark_changed(self, periods: Iterable[int]) -> None:
+        """ record that the rows of the months change in the next published version """
+        for period in periods:
+            self._period_versions[int(period)] = self._version + 1
+
+    def get_changed_periods(self, since_version: Optional[int] = None) -> Set[int]:
+        """
+        period keys of the months whose rows changed, or were thawed, after a
+        version of the db
+        :param since_version: all the stored and resident months if None
+        """
+        return {period for period, version in self._period_versions.items()
+                if since_version is None or version > since_version}
+
+    @staticmethod
+    def _build_prefix_sums(db: pd.DataFrame,
+                           cold_daily_sums: Optional[pd.DataFrame] = None) \
+            -> Dict[str, PrefixSumIndex]:
+        """
+        prefix sums by category and by account of the resident rows
+        :param cold_daily_sums: stored daily sums of the cold months
+        """
+        if not len(db.columns):
+            return {col: PrefixSumIndex(col) for col in PREFIX_SUM_COLS}
+        return {col: PrefixSumIndex.from_rows(db, col, cold_daily_sums)
+                for col in PREFIX_SUM_COLS}
+
+    def snapshot(self, full_rows: bool = False) -> 'TransactionsDBParquet':
+        """
+        get an immutable view of the current version of the db. Use it when a
+        reader needs several consistent reads of the db
+        :param full_rows: load the detail cols first if they were not loaded yet.
+                          Only needed by views that display whole transactions
+        """
+        if full_rows:
+            with self._write_lock:
+                self._load_detail_cols()
+
+        return TransactionsDBParquet(self._file_io,
+                                     self._cat_db,
+                                     self._accounts,
+                                     self._db)
+
+    @_writer
+    def connect(self, lazy_detail_cols: bool = True):
         """
         load parquet files of transactions
+        :param lazy_detail_cols: load only the resident cols now and the detail
+                                 cols (see TransDBSchema) on first use
         :return:
         """
-        pq_files = []
-        for year_dir in self._file_io.get_dirs_in_dir(
-                self._path_from_data_root, full_paths=True):
-            pq_files.extend(self._file_io.load_file(file) for file in
-                            self._file_io.get_files_in_dir(year_dir,
-                                                           full_paths=True))
-
-        if not len(pq_files):
+        partitions = self._list_partitions(self._path_from_data_root)
+        if not len(partitions):
             logger.info('init empty trans db')
             self._init_empty_db()
             return
 
-        # category_vals = self._get_category_vals(pq_files[0])
-        final_df = pd.concat(pq_files)
-        final_df = apply_dtypes(final_df, include_date=False)
-        final_df = self._set_cat_col_categories(final_df)
-        self._db = final_df
+        if self._hot_months is not None:
+            hot_start = self.get_hot_start_period()
+            self._cold_periods = {period for period in partitions if period < hot_start}
+        self._load_dedupe_index(partitions)
+        self._mark_changed(partitions)
 
-        self._sort_db()
+        columns = TransDBSchema.get_resident_cols() if lazy_detail_cols else None
+        final_df = self._load_partitions(columns, self._get_resident_periods())
+        final_df = self._set_cat_col_categories(final_df)
+        self._cube = RollupCube.from_rows(final_df, self._load_cold_aggregates())
+        self._prefix_sums = self._build_prefix_sums(final_df, self._load_cold_daily_sums())
+        self._payee_cube = PayeeCube.from_rows(final_df,
+                                               stored_aggregates=self._load_cold_payee_aggregates())
+        self._anomaly_detector.fit(final_df)
+        self._anomaly_detector.load_flags()
+        self._recurring_detector.fit(final_df)
+        self._alert_engine.load_state()
+        self._reconciler.load_state()
+        self._publish(self._sort_db(final_df))
+        self._detail_cols_loaded = not lazy_detail_cols
 
         # set monthly_trans
         self.set_specific_month(*get_current_year_and_month())
         logger.info('loaded trans db')
 
+    def _list_partitions(self, path_from_data_root: str) -> Dict[int, str]:
+        """
+        list the monthly files stored under a year/month.pq directory layout
+        :return: dict of period key: file path
+        """
+        partitions = {}
+        with contextlib.suppress(FileNotFoundError):  # nothing was saved yet
+            for year_dir in self._file_io.get_dirs_in_dir(path_from_data_root,
+                                                          full_paths=True):
+                year = int(Path(year_dir).name)
+                for file in self._file_io.get_files_in_dir(year_dir, full_paths=True):
+                    partitions[get_period_key(year, int(Path(file).stem))] = file
+
+        return partitions
+
+    def list_partitions(self) -> Dict[int, str]:
+        """ paths of the stored transaction partitions by period key """
+        return self._list_partitions(self._path_from_data_root)
+
+    @property
+    def cold_periods(self) -> Set[int]:
+        """ period keys of the months that are not resident """
+        return set(self._cold_periods)
+
+    def _load_partitions(self,
+                         columns: Optional[List[str]] = None,
+                         periods: Optional[Iterable[int]] = None) -> pd.DataFrame:
+        """
+        load the stored partitions, optionally only some of their columns
+        :param columns: cols to load, all cols if None
+        :param periods: period keys of the partitions to load, all if None
+        :return: the loaded transactions
+        """
+        schema = TransDBSchema.get_arrow_schema()
+        partitions = self._list_partitions(self._path_from_data_root)
+        if periods is not None:
+            partitions = {period: partitions[period] for period in periods
+                          if period in partitions}
+
+        pq_tables = [self._file_io.load_table(file, schema, columns)
+                     for file in partitions.values()]
+        if not len(pq_tables):
+            if columns is not None:
+                schema = pa.schema([schema.field(col) for col in columns])
+            return schema.empty_table().to_pandas()
+
+        # partitions share one schema, so unifying the dictionaries is all that
+        # is needed for the frame to come out with its final dtypes
+        return pa.concat_tables(pq_tables).unify_dictionaries().to_pandas()
+
+    def _get_resident_periods(self) -> List[int]:
+        return [period for period in self._list_partitions(self._path_from_data_root)
+                if period not in self._cold_periods]
+
+    def get_hot_start_period(self) -> Optional[int]:
+        """ period key of the first resident month, None if tiering is off """
+        if self._hot_months is None:
+            return None
+        current_period = get_period_key(*map(int, get_current_year_and_month()))
+        return shift_period_key(current_period, -(self._hot_months - 1))
+
+    @staticmethod
+    def _get_month_path(path_from_data_root: str, year: int, month: int) -> str:
+        return str(Path(path_from_data_root) / str(year) / f'{month}.pq')
+
+    def _load_cold_aggregates(self, periods: Optional[Iterable[int]] = None) -> pd.DataFrame:
+        """
+        load the stored aggregates of the cold months
+        :param periods: period keys of the cold months to load, all if None
+        """
+        aggs = self._load_cold_month_data(self._agg_path_from_data_root, periods)
+        if not len(aggs):
+            return empty_aggregates()
+        return pd.concat(aggs, ignore_index=True)
+
+    def _load_cold_daily_sums(self, periods: Optional[Iterable[int]] = None) -> pd.DataFrame:
+        """
+        load the stored daily sums (see prefix_sums.get_daily_sums) of the cold
+        months
+        :param periods: period keys of the cold months to load, all if None
+        """
+        daily_sums = self._load_cold_month_data(self._daily_path_from_data_root, periods)
+        if not len(daily_sums):
+            return get_daily_sums(pd.DataFrame(), [])
+        return pd.concat(daily_sums, ignore_index=True)
+
+    def _load_cold_payee_aggregates(self,
+                                    periods: Optional[Iterable[int]] = None) -> pd.DataFrame:
+        """
+        load the stored payee aggregates (see payees.aggregate_payees) of the
+        cold months
+        :param periods: period keys of the cold months to load, all if None
+        """
+        payee_aggs = self._load_cold_month_data(self._payees_path_from_data_root, periods)
+        if not len(payee_aggs):
+            return PayeeCube().to_stored()
+        return pd.concat(payee_aggs, ignore_index=True)
+
+    def _load_cold_month_data(self,
+                              path_from_data_root: str,
+                              periods: Optional[Iterable[int]] = None) -> List[pd.DataFrame]:
+        """
+        load data stored per cold month (see _save_month_aggregates). Months
+        without it (e.g. saved before it existed) are aggregated from their
+        partition once and saved
+        """
+        stored = self._list_partitions(path_from_data_root)
+        periods = self._cold_periods if periods is None else self._cold_periods & set(periods)
+        month_data = []
+        for period in sorted(periods):
+            year, month = period // 100, period % 100
+            if period not in stored:
+                month_df = self._load_partitions(
+                    [*TransDBSchema.get_analytics_cols(), TransDBSchema.PAYEE], [period])
+                self._save_month_aggregates(year, month, month_df)
+            month_data.append(self._file_io.load_file(
+                self._get_month_path(path_from_data_root, year, month)))
+
+        return month_data
+
+    def _load_dedupe_index(self, partitions: Dict[int, str]) -> None:
+        """
+        load the dedupe index of the stored months. Months without a stored
+        index (e.g. saved before the index existed) are indexed once and saved
+        """
+        stored = self._list_partitions(self._dedupe_index.path_from_data_root)
+        for period in partitions:
+            if period in stored:
+                self._dedupe_index.load_month(period, stored[period])
+                continue
+
+            month_df = self._load_partitions(TransDBSchema.get_cols_for_dup_checking(),
+                                             [period])
+            self._dedupe_index.update_month(period, month_df)
+
+    def _save_month_aggregates(self, year: int, month: int, month_df: pd.DataFrame) -> None:
+        """
+        store the monthly aggregates, the daily sums and the payee aggregates
+        of a month, which represent it while it is cold
+        """
+        self._file_io.save_file(self._get_month_path(self._agg_path_from_data_root, year, month),
+                                aggregate_monthly(month_df))
+        self._file_io.save_file(self._get_month_path(self._daily_path_from_data_root, year, month),
+                                get_daily_sums(month_df, PREFIX_SUM_COLS))
+        self._file_io.save_file(self._get_month_path(self._payees_path_from_data_root, year, month),
+                                aggregate_payees(month_df))
+
+    @_writer
+    def thaw_periods(self, periods: Iterable[int]) -> None:
+        """
+        load the rows of cold months back into the resident db, e.g. when the
+        user drills into them in the transactions page
+        :param periods: period keys, periods that are not cold are ignored
+        """
+        periods = set(periods) & self._cold_periods
+        if not len(periods):
+            return
+
+        # the cube, the prefix sums and the payee cube already hold the totals
+        # of the thawed months
+        # until the detail cols are loaded, the thawed rows come without them
+        # too and get them with the other resident rows (see _load_detail_cols)
+        columns = None if self._detail_cols_loaded else TransDBSchema.get_resident_cols()
+        rows = self._align_categoricals(self._load_partitions(columns, periods))
+        self._mark_changed(periods)
+        self._publish(self._sort_db(pd.concat([self._db, rows], ignore_index=True)))
+        self._cold_periods -= periods
+        logger.info(f'thawed periods {sorted(periods)}')
+
+    @_writer
+    def thaw_range(self, start_date: pd.Timestamp, end_date: pd.Timestamp) -> None:
+        """
+        drill into the rows between two dates, inclusive - their cold months
+        are loaded and kept resident until the drill in moves to other months
+        or ends (see end_drill_in)
+        """
+        periods = self._get_range_periods(start_date, end_date)
+        self._freeze_periods(self._drilled_periods - periods)
+        thawed = periods & self._cold_periods
+        self.thaw_periods(thawed)
+        self._drilled_periods = (self._drilled_periods & periods) | thawed
+
+    @_writer
+    def end_drill_in(self) -> None:
+        """ move the months thawed by thaw_range back to cold """
+        self._freeze_periods(self._drilled_periods)
+        self._drilled_periods = set()
+
+    @staticmethod
+    def _get_range_periods(start_date: pd.Timestamp, end_date: pd.Timestamp) -> Set[int]:
+        months = pd.Series(pd.date_range(start_date.to_period('M').to_timestamp(),
+                                         end_date, freq='MS'), dtype='datetime64[ns]')
+        return set(get_period_keys(months).tolist())
+
+    @contextlib.contextmanager
+    def _thawed(self, periods: Iterable[int]):
+        """
+        thaw cold months for a write and freeze them back once it is done. Must
+        be called with the writer lock held, and the write must save the
+        months it changes
+        """
+        periods = set(periods) & self._cold_periods
+        self.thaw_periods(periods)
+        yield
+        # left resident if the write failed, so no unsaved change is dropped
+        self._freeze_periods(periods - self._drilled_periods)
+
+    def _freeze_periods(self, periods: Set[int]) -> None:
+        """
+        drop the resident rows of months back to cold. The months must be
+        saved. Their totals stay in the cube, the prefix sums and the payee cube
+        """
+        if not len(periods):
+            return
+
+        is_frozen = get_period_keys(self._db[TransDBSchema.DATE]).isin(list(periods))
+        self._mark_changed(periods)
+        self._publish(self._db[~is_frozen])
+        self._cold_periods |= periods
+        logger.info(f'froze periods {sorted(periods)}')
+
+    @property
+    def rollover_engine(self) -> RolloverEngine:
+        """ the rollover balances of the db, see rollover.py """
+        return self._rollover_engine
+
+    @property
+    def cube(self) -> RollupCube:
+        """ the rollup cube of the current version of the db """
+        return self._cube
+
+    def get_monthly_aggregates(self) -> pd.DataFrame:
+        """ monthly aggregates (see aggregates.py) of the whole history """
+        return self._cube.aggregates
+
+    def get_range_totals(self,
+                         start_date: pd.Timestamp,
+                         end_date: pd.Timestamp,
+                         by: str = TransDBSchema.CAT) -> pd.Series:
+        """
+        total amount per category or account between two dates, inclusive.
+        Cold months are read from their stored daily sums
+        :param by: TransDBSchema.CAT or TransDBSchema.ACCOUNT
+        """
+        return self.get_ranges_totals([start_date], [end_date], by).iloc[0]
+
+    def get_ranges_totals(self,
+                          start_dates: List[pd.Timestamp],
+                          end_dates: List[pd.Timestamp],
+                          by: str = TransDBSchema.CAT) -> pd.DataFrame:
+        """
+        total amount per date range (rows) and category or account (cols),
+        see get_range_totals
+        """
+        return self._prefix_sums[by].get_ranges_totals(start_dates, end_dates)
+
+    def get_top_payees(self,
+                       k: int = 10,
+                       by: str = PayeeSchema.OUTFLOW,
+                       period: Optional[int] = None,
+                       cat: Optional[str] = None,
+                       cat_group: Optional[str] = None) -> pd.DataFrame:
+        """
+        the payees with the most spend or charges, see PayeeCube.get_top. Cold
+        months are read from their stored payee aggregates
+        :param period: period key of the month, all months if None
+        """
+        periods = None if period is None else [period]
+        return self._payee_cube.get_top(k, by, periods, cat, cat_group)
+
+    def get_balances(self, as_of: Optional[pd.Timestamp] = None) -> pd.Series:
+        """
+        balance per account - inflow minus outflow since the first transaction
+        :param as_of: the balances at the end of this day, defaults to the last
+                      day with transactions
+        """
+        as_of = pd.Timestamp.max if as_of is None else as_of
+        return -self._prefix_sums[TransDBSchema.ACCOUNT].get_totals_until(as_of)
+
+    def get_balance_series(self) -> pd.DataFrame:
+        """
+        balance per account (cols) at the end of every day with transactions
+        (index), see get_balances
+        """
+        return -self._prefix_sums[TransDBSchema.ACCOUNT].get_cumulative()
+
+    def verify_prefix_sums(self, periods: Optional[Iterable[int]] = None) -> bool:
+        """
+        whether the incrementally maintained prefix sums match rebuilt ones
+        :param periods: period keys of the months to verify, all if None
+        """
+        periods = None if periods is None else set(periods)
+        with self._write_lock:
+            rebuilt = self._build_prefix_sums(self._get_rows_of_periods(periods),
+                                              self._load_cold_daily_sums(periods))
+            return all(index.equals(rebuilt[col], periods)
+                       for col, index in self._prefix_sums.items())
+
+    def _get_rows_of_periods(self, periods: Optional[Iterable[int]] = None) -> pd.DataFrame:
+        """ the resident rows of some months, all rows if None """
+        db = self._db
+        if periods is None:
+            return db
+        return db[get_period_keys(db[TransDBSchema.DATE]).isin(list(periods))]
+
+    def get_data_token(self) -> str:
+        """
+        token of the analytics data of the db, changes when the rollup cube
+        does. Unlike version it is stable across processes
+        """
+        return self._cube.get_content_hash()
+
+    def compare_periods(self,
+                        base: Tuple[int, int],
+                        compared: Tuple[int, int],
+                        by: str = TransDBSchema.CAT,
+                        value_col: str = TransDBSchema.OUTFLOW) -> pd.DataFrame:
+        """
+        totals of two ranges of months and their deltas by category, group or
+        account, see RollupCube.compare
+        :param base: start and end period keys of the range compared against
+        :param compared: start and end period keys of the compared range
+        """
+        return self._cube.compare(base, compared, by, value_col)
+
+    def get_anomalies(self, period: Optional[int] = None) -> pd.DataFrame:
+        """
+        unusual charges flagged on import (see anomalies.py) that are still in
+        the db, most unusual first. Charges of cold months are kept as they can
+        only be removed once their month is thawed
+        :param period: if given, only the charges of this month
+        """
+        flags = self._anomaly_detector.flags
+        flag_periods = get_period_keys(pd.to_datetime(flags[AnomalySchema.DATE]))
+        flags = flags[flags[AnomalySchema.ID].isin(self._db[TransDBSchema.ID]) |
+                      flag_periods.isin(list(self._cold_periods))]
+        if period is not None:
+            flags = flags[flag_periods[flags.index] == period]
+        return flags.sort_values(AnomalySchema.SCORE, ascending=False)
+
+    def get_budget_alerts(self, period: Optional[int] = None) -> pd.DataFrame:
+        """
+        categories that crossed a budget usage threshold (see alerts.py), the
+        latest first
+        :param period: if given, only the alerts of this month
+        """
+        fired = self._alert_engine.fired
+        if period is not None:
+            fired = fired[fired[AlertSchema.PERIOD] == period]
+        return fired.sort_values(AlertSchema.FIRED_AT, ascending=False)
+
+    def get_recurring(self) -> pd.DataFrame:
+        """
+        recurring series by payee with their next expected date and amount, see
+        recurring.py
+        """
+        return self._recurring_detector.get_recurring()
+
+    def get_suggested_constant_categories(self) -> List[str]:
+        """
+        categories whose every payee is recurring and that are not yet marked
+        is_constant in the categories db
+        """
+        cat_db = self._cat_db.db
+        constant = cat_db.loc[cat_db[CatDBSchema.IS_CONSTANT].astype(bool), CatDBSchema.CAT_NAME]
+        return [cat for cat in self._recurring_detector.get_constant_categories()
+                if cat not in set(constant)]
+
+    def get_specific_month_aggregates(self) -> pd.DataFrame:
+        """ monthly aggregates of the month set with set_specific_month """
+        return self._cube.get_period(self.get_specific_period())
+
+    def get_specific_period(self) -> int:
+        """ period key of the month set with set_specific_month """
+        year, month = self._specific_month_date.split('-')
+        return get_period_key(int(year), int(month))
+
+    def rebuild_cube(self, periods: Optional[Iterable[int]] = None) -> RollupCube:
+        """
+        build the rollup cube from scratch - from the resident rows and the
+        stored aggregates of the cold months
+        :param periods: period keys of the months to build it for, all if None
+        """
+        periods = None if periods is None else set(periods)
+        return RollupCube.from_rows(self._get_rows_of_periods(periods),
+                                    self._load_cold_aggregates(periods))
+
+    def verify_cube(self, periods: Optional[Iterable[int]] = None) -> bool:
+        """
+        whether the incrementally maintained cube matches a rebuilt one
+        :param periods: period keys of the months to verify, all if None
+        """
+        periods = None if periods is None else set(periods)
+        with self._write_lock:
+            return self._cube.equals(self.rebuild_cube(periods), periods)
+
+    def _load_detail_cols(self) -> None:
+        """
+        complete the resident rows with the detail cols from storage. Must be
+        called with the writer lock held
+        """
+        if self._detail_cols_loaded:
+            return
+
+        details = self._load_partitions([TransDBSchema.ID, *TransDBSchema.get_detail_cols()],
+                                        self._get_resident_periods())
+        db = self._db.merge(details, on=TransDBSchema.ID, how='left')
+        self._publish(db[TransDBSchema.get_db_col_vals()])
+        self._detail_cols_loaded = True
+        logger.info('loaded trans db detail cols')
+
     def _set_cat_col_categories(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         given a dict of col_name: cat_vals, set the categorical values of col_name
         to cat_val, in df
         :return: df with set categoricals
         """
-        df[TransDBSchema.CAT] = df[TransDBSchema.CAT].cat.set_categories(
-            self._cat_db.get_categories())
-        df[TransDBSchema.CAT_GROUP] = df[TransDBSchema.CAT_GROUP].\
-            cat.set_categories(self._cat_db.get_group_names())
-        df[TransDBSchema.ACCOUNT] = df[TransDBSchema.ACCOUNT].\
-            cat.set_categories(list(self._accounts.keys()))
+        cat_vals = {TransDBSchema.CAT: self._cat_db.get_categories(),
+                    TransDBSchema.CAT_GROUP: self._cat_db.get_group_names(),
+                    TransDBSchema.ACCOUNT: list(self._accounts.keys())}
+        for col, vals in cat_vals.items():
+            if df[col].cat.categories.tolist() != vals:
+                df[col] = df[col].cat.set_categories(vals)
 
         return df
 
+    def _align_categoricals(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        give the categorical cols of new rows the categories of the db, so that
+        concatenating them to the db keeps the categorical dtypes
+        """
+        for col in TransDBSchema.get_categorical_cols():
+            df[col] = pd.Categorical(df[col],
+                                     categories=self._db[col].cat.categories)
+        return df
+
     def _init_empty_db(self):
         # todo - not in use for now, need to find solution for loading app with empty db
         cols_with_def_value = TransDBSchema.get_non_mandatory_cols()
         cols_with_def_value.update({TransDBSchema.DATE: pd.to_datetime(START_DATE_DEFAULT),
                                     TransDBSchema.PAYEE: 'null',
                                     TransDBSchema.AMOUNT: 0.0,
-                                    TransDBSchema.ID: 0})
-        self._db = pd.DataFrame(cols_with_def_value, index=[0])
-
+                                    TransDBSchema.ID: '0'})
+        db = conform_to_schema(pd.DataFrame(cols_with_def_value, index=[0]))
+        self._cube = RollupCube.from_rows(db)
+        self._prefix_sums = self._build_prefix_sums(db)
+        self._payee_cube = PayeeCube()
+        self._publish(self._set_cat_col_categories(db))
+
+    @_full_row_writer
     def save_db(self, months_to_save: List[Tuple[str, str]]) -> None:
         """
         save the db to a parquet file. Saves only modified months
         :param months_to_save: list of tuples of form (year, month)
         :return:
         """
-        for year, month in months_to_save:
-            year_dir = Path(f'{self._path_from_data_root}/{year}')
-            cond1 = self._db[TransDBSchema.DATE].dt.year == int(year)
-            cond2 = self._db[TransDBSchema.DATE].dt.month == int(month)
-            self._file_io.save_file(str(year_dir / f'{month}.pq'),
-                                    self._db[cond1 & cond2])
-            logger.info(f'saved transactions db to {year_dir / f"{month}.pq"}')
+        # a cold month is written only once its stored rows are resident again,
+        # otherwise the partition would be overwritten with the changed rows only
+        with self._thawed(get_period_key(int(year), int(month))
+                          for year, month in months_to_save):
+            db = self._db
+            for year, month in months_to_save:
+                year_dir = Path(f'{self._path_from_data_root}/{year}')
+                cond1 = db[TransDBSchema.DATE].dt.year == int(year)
+                cond2 = db[TransDBSchema.DATE].dt.month == int(month)
+                month_df = db[cond1 & cond2]
+                self._file_io.save_file(str(year_dir / f'{month}.pq'),
+                                        conform_to_schema(month_df),
+                                        schema=TransDBSchema.get_arrow_schema())
+                self._save_month_aggregates(int(year), int(month), month_df)
+                self._dedupe_index.update_month(get_period_key(int(year), int(month)),
+                                                month_df)
+                logger.info(f'saved transactions db to {year_dir / f"{month}.pq"}')
 
     def save_db_from_uuids(self, uuid_list: List[str]) -> None:
         """
@@ -257,6 +763,7 @@ class TransactionsDBParquet:
         months = self._get_months_from_uuid(uuid_list)
         self.save_db(months)
 
+    @_full_row_writer
     def insert_data(self, df: pd.DataFrame) -> Dict[str, int]:
         """
         insert transactions to the db
@@ -268,27 +775,134 @@ class TransactionsDBParquet:
         orig_len = len(df)
         df = self._remove_duplicate_trans(df)
         if len(df) == 0:
-            return {'added': 0, 'skipped': orig_len - len(df)}
+            return {'added': 0, 'skipped': orig_len - len(df), 'flagged': 0}
         df = self._add_uuids(df)
         df = self._apply_categories_and_groups(df)
-        self._db = pd.concat([self._db, df])
-        self._sort_db()
-        self._db = self._db.reset_index(drop=True)
+        df = self._align_categoricals(df)
+        flags = self._anomaly_detector.add(df)
+        self._apply_row_delta(added=df)
+        self._publish(self._sort_db(pd.concat([self._db, df])))
         self.save_db_from_uuids(df[TransDBSchema.ID].to_list())
+        self.tag_transfers(df[TransDBSchema.DATE].min(), df[TransDBSchema.DATE].max())
+        # the imported months may hold a bill and its payment month
+        imported = set(get_period_keys(df[TransDBSchema.DATE]).tolist())
+        self.reconcile(imported | {shift_period_key(period, -1) for period in imported})
 
-        return {'added': len(df), 'skipped': orig_len - len(df)}
+        return {'added': len(df), 'skipped': orig_len - len(df), 'flagged': len(flags)}
 
-    def _remove_duplicate_trans(self, new_trans_df: pd.DataFrame) -> pd.DataFrame:
+    @_full_row_writer
+    def reconcile(self, periods: Optional[Iterable[int]] = None) -> int:
         """
-        remove duplicate transactions from the new transactions dataframe
+        match the card bills of the given months to their payments from the
+        checking accounts and mark the matched rows reconciled (see reconcile.py)
+        :param periods: period keys of the billing cycles, the resident months
+                        if None (cold months were reconciled when they were
+                        imported). Cold months that are given are thawed first
+        :return: number of rows marked reconciled
         """
-        original_len = len(self._db)
-        tmp_df = pd.concat([self._db, new_trans_df])
-        tmp_df = tmp_df.drop_duplicates(subset=TransDBSchema.get_cols_for_dup_checking(),
-                                        keep='first')
-
-        return tmp_df.iloc[original_len:, :]
+        periods = set(self._get_resident_periods() if periods is None else periods)
+        with self._thawed(periods | {shift_period_key(period, 1) for period in periods}):
+            return self._reconcile_periods(periods)
+
+    def _reconcile_periods(self, periods: Set[int]) -> int:
+        card_accounts = [name for name, account in self._accounts.items()
+                         if not account.is_checking]
+        checking_accounts = [name for name, account in self._accounts.items()
+                             if account.is_checking]
+        reconciled_ids = self._reconciler.reconcile(self._db, card_accounts,
+                                                    checking_accounts, periods)
+        if not len(reconciled_ids):
+            return 0
+
+        db = self._db.copy()
+        is_reconciled = db[TransDBSchema.ID].isin(reconciled_ids)
+        db.loc[is_reconciled, TransDBSchema.RECONCILED] = True
+        db.loc[is_reconciled, TransDBSchema.VERSION] += 1
+        self._apply_row_delta(removed=self._db[is_reconciled], added=db[is_reconciled])
+        self._publish(db)
+        dates = db.loc[is_reconciled, TransDBSchema.DATE]
+        self.save_db(list({(str(date.year), str(date.month)) for date in dates}))
+        logger.info(f'reconciled {len(reconciled_ids)} rows')
+        return len(reconciled_ids)
+
+    @_writer
+    def tag_transfers(self,
+                      start_date: Optional[pd.Timestamp] = None,
+                      end_date: Optional[pd.Timestamp] = None) -> int:
+        """
+        find transfers between accounts (see transfers.py) among the rows
+        between two dates and tag both rows of each. Cold months in the range
+        are thawed first
+        :param start_date: if not given, with end_date, all the resident rows are
+                           searched. Cold months were searched when they were
+                           imported
+        :return: number of transfers found
+        """
+        window = pd.Timedelta(days=TRANSFER_WINDOW_DAYS)
+        if start_date is None or end_date is None:
+            return self._tag_transfers_in(self._db)
+
+        start_date, end_date = start_date - window, end_date + window
+        with self._thawed(self._get_range_periods(start_date, end_date)):
+            db = self._db
+            return self._tag_transfers_in(db[db[TransDBSchema.DATE].between(start_date, end_date)])
+
+    def _tag_transfers_in(self, rows: pd.DataFrame) -> int:
+        """ tag the transfers among rows of the db """
+        db = self._db
+        transfers = find_transfers(rows)
+        if not len(transfers):
+            return 0
+
+        other_ids = pd.concat([
+            transfers.set_index(TransferSchema.OUTFLOW_ID)[TransferSchema.INFLOW_ID],
+            transfers.set_index(TransferSchema.INFLOW_ID)[TransferSchema.OUTFLOW_ID]])
+        is_tagged = db[TransDBSchema.ID].isin(other_ids.index)
+        tagged_db = db.copy()
+        tagged_db.loc[is_tagged, TransDBSchema.TRANSFER] = \
+            db.loc[is_tagged, TransDBSchema.ID].map(other_ids)
+        tagged_db.loc[is_tagged, TransDBSchema.VERSION] += 1
+        self._apply_row_delta(removed=db[is_tagged], added=tagged_db[is_tagged])
+        self._publish(tagged_db)
+        dates = tagged_db.loc[is_tagged, TransDBSchema.DATE]
+        self.save_db(list({(str(date.year), str(date.month)) for date in dates}))
+        logger.info(f'tagged {len(transfers)} transfers')
+        return len(transfers)
+
+    def get_reconcile_mismatches(self, period: Optional[int] = None) -> pd.DataFrame:
+        """
+        card bills that were not matched to a payment (see reconcile.py)
+        :param period: if given, only the bill of this month's charges
+        """
+        mismatches = self._reconciler.mismatches
+        if period is not None:
+            mismatches = mismatches[mismatches[ReconcileSchema.PERIOD] == period]
+        return mismatches.sort_values(ReconcileSchema.PERIOD, ascending=False)
 
+    def _remove_duplicate_trans(self, new_trans_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        remove duplicate transactions from the new transactions dataframe -
+        duplicates within the dataframe and transactions that are already stored.
+        Stored rows are only looked at for months where the dedupe index
+        reports a possible hit
+        """
+        dup_cols = TransDBSchema.get_cols_for_dup_checking()
+        new_trans_df = new_trans_df.drop_duplicates(subset=dup_cols, keep='first').copy()
+        maybe_dup = self._dedupe_index.contains(new_trans_df)
+        if not maybe_dup.any():
+            return new_trans_df
+
+        candidate_periods = set(get_period_keys(
+            new_trans_df.loc[maybe_dup, TransDBSchema.DATE]).tolist())
+        cold_periods = candidate_periods & self._cold_periods
+        resident = self._db[get_period_keys(self._db[TransDBSchema.DATE]).isin(
+            candidate_periods - cold_periods)]
+        stored = pd.concat([resident[dup_cols],
+                            self._load_partitions(dup_cols, cold_periods)])
+
+        is_dup = new_trans_df[dup_cols].merge(stored.drop_duplicates(), how='left',
+                                              indicator=True)['_merge'] == 'both'
+        return new_trans_df[~is_dup.to_numpy()].copy()
 
     @staticmethod
     def _add_uuids(df: pd.DataFrame) -> pd.DataFrame:
@@ -302,17 +916,17 @@ class TransactionsDBParquet:
 
         return df
 
-    def _sort_db(self):
+    @staticmethod
+    def _sort_db(db: pd.DataFrame) -> pd.DataFrame:
         """
-        sort the db by date
+        sort the db by date. Returns a new frame, the given one is left untouched
         :return:
         """
-        self._db['s1'] = self._db[TransDBSchema.SPLIT].str.split('-').str[0]
-        self._db['s2'] = self._db[TransDBSchema.SPLIT].str.split('-').str[2]
-        self._db = self._db.sort_values(by=[TransDBSchema.DATE, 's1', 's2'],
-                                        ascending=False)
-        self.drop(columns=['s1', 's2'], inplace=True)
-        self._db = self._db.reset_index(drop=True)
+        split_parts = db[TransDBSchema.SPLIT].str.split('-')
+        sorted_db = db.assign(s1=split_parts.str[0], s2=split_parts.str[2])
+        sorted_db = sorted_db.sort_values(by=[TransDBSchema.DATE, 's1', 's2'],
+                                          ascending=False)
+        return sorted_db.drop(columns=['s1', 's2']).reset_index(drop=True)
 
     def _apply_categories_and_groups(self, df: pd.DataFrame):
         """
@@ -329,6 +943,7 @@ class TransactionsDBParquet:
 
         return df
 
+    @_full_row_writer
     def add_new_row(self) -> None:
         """
         when adding a new transaction, add a blank row to the db which will
@@ -336,25 +951,25 @@ class TransactionsDBParquet:
         :return:
         """
         uuid = create_uuid()
-        new_row = pd.DataFrame([[None] * self._db.shape[1]],
-                               columns=self._db.columns)
-        new_row[TransDBSchema.ID] = uuid
-        date = datetime.now().strftime('%Y-%m-%d')
-        new_row[TransDBSchema.DATE] = pd.to_datetime(date)
-        new_row[TransDBSchema.ACCOUNT] = ''
-        new_row[TransDBSchema.PAYEE] = ''
-        new_row[TransDBSchema.INFLOW] = 0
-        new_row[TransDBSchema.OUTFLOW] = 0
-
-        db = pd.concat([new_row, self._db])
-        self._db = apply_dtypes(db,
-                                include_date=True,
-                                datetime_format='%Y-%m-%d')
-        self._db = db.reset_index(drop=True)
+        row = dict.fromkeys(TransDBSchema.get_db_col_vals())
+        row.update({TransDBSchema.ID: uuid,
+                    TransDBSchema.DATE: pd.Timestamp(datetime.now().date()),
+                    TransDBSchema.PAYEE: '',
+                    TransDBSchema.MEMO: '',
+                    TransDBSchema.INFLOW: 0.0,
+                    TransDBSchema.OUTFLOW: 0.0,
+                    TransDBSchema.AMOUNT: 0.0,
+                    TransDBSchema.RECONCILED: False,
+                    TransDBSchema.VERSION: 0})
+        new_row = self._align_categoricals(pd.DataFrame([row]))
+
+        self._apply_row_delta(added=new_row)
+        self._publish(pd.concat([new_row, self._db], ignore_index=True))
         logger.info(f'added new row with id {uuid}')
 
         self.save_db_from_uuids([uuid])
 
+    @_writer
     def remove_row_with_id(self, id: str):
         """
         remove row with id
@@ -362,8 +977,9 @@ class TransactionsDBParquet:
         :return:
         """
         months = self._get_months_from_uuid([id])
-        self._db = self._db[self._db[TransDBSchema.ID] != id]
-        self._sort_db()
+        is_removed = self._db[TransDBSchema.ID] == id
+        self._apply_row_delta(removed=self._db[is_removed])
+        self._publish(self._sort_db(self._db[~is_removed]))
         self.save_db(months)
 
     def _update_cat_col_data(self, col_name: str, trans_id: str, value: Any):
@@ -383,10 +999,23 @@ class TransactionsDBParquet:
         if check_null(self._db.loc[index, col_name]):  # only update first time
             self._cat_db.update_payee_to_cat_mapping(payee, cat=value)
 
-        self._update_cat_group(trans_id, value)
-        self._update_data(col_name, trans_id, value)
+        # category and group are published together so readers never see
+        # a category with the group of the previous one
+        group = self._cat_db.get_group_of_category(value)
+        self._update_row(trans_id, {col_name: value,
+                                    TransDBSchema.CAT_GROUP: group})
+
+    @_full_row_writer
+    def submit_change(self, change: Change) -> bool:
+        """
+        apply a change made by the user
+        :return: False if the change was rejected because the row was edited
+                 since the client read it (its row_version is stale)
+        """
+        if self._is_stale(change):
+            logger.info(f'rejected stale change to {change.trans_id}')
+            return False
 
-    def submit_change(self, change: Change):
         if change.change_type == ChangeType.ADD_ROW:
             self.add_new_row()
 
@@ -395,7 +1024,8 @@ class TransactionsDBParquet:
 
         elif change.change_type == ChangeType.CHANGE_DATA:
             if change.current_value == change.prev_value:
-                return
+                # nothing to apply, the row keeps its version
+                return True
             if change.col_name == TransDBSchema.CAT:
                 # move all trans logic to here.
                 # add an optional parameter in the change object
@@ -406,6 +1036,15 @@ class TransactionsDBParquet:
                 self._update_data(change.col_name, change.trans_id, change.current_value)
 
         self.change_list.append(change)
+        return True
+
+    def _is_stale(self, change: Change) -> bool:
+        if change.row_version is None or change.change_type != ChangeType.CHANGE_DATA:
+            return False
+
+        row_version = self._db.loc[self._db[TransDBSchema.ID] == change.trans_id,
+                                   TransDBSchema.VERSION]
+        return len(row_version) == 0 or row_version.iloc[0] != change.row_version
 
     def undo(self):
         pass
@@ -421,27 +1060,42 @@ class TransactionsDBParquet:
         :param value:
         :return:
         """
-        index = self._get_row_index_from_trans_id(trans_id)
-        prev_value = self._db.loc[index, col_name]
-        self._db.loc[index, col_name] = value
+        self._update_row(trans_id, {col_name: value})
 
-        # a change in inflow\outflow occured, should also change amount
-        if col_name in [TransDBSchema.OUTFLOW, TransDBSchema.INFLOW]:
-            self._db.loc[index, TransDBSchema.AMOUNT] = value
+    @_full_row_writer
+    def _update_row(self, trans_id: str, updates: Dict[str, Any]) -> None:
+        """
+        update cells of a single row in a copy of the db and publish it
+        :param trans_id: id of the row to update
+        :param updates: dict of col_name: new value
+        :return:
+        """
+        db = self._db.copy()
+        index = db[db[TransDBSchema.ID] == trans_id].index[0]
+        prev_date = db.loc[index, TransDBSchema.DATE]
+        for col_name, value in updates.items():
+            db.loc[index, col_name] = value
+
+            # a change in inflow\outflow occured, should also change amount
+            if col_name in [TransDBSchema.OUTFLOW, TransDBSchema.INFLOW]:
+                db.loc[index, TransDBSchema.AMOUNT] = value
+
+        db.loc[index, TransDBSchema.VERSION] += 1
+        self._apply_row_delta(removed=self._db.loc[[index]], added=db.loc[[index]])
+        if TransDBSchema.DATE in updates:
+            db = self._sort_db(db)
+        self._publish(db)
 
         # trans moved to another month - save original month to save removal
+        new_date = updates.get(TransDBSchema.DATE)
         if (
-            isinstance(prev_value, pd.Timestamp)
-            and prev_value.month != pd.to_datetime(value).month
+            new_date is not None
+            and isinstance(prev_date, pd.Timestamp)
+            and prev_date.month != pd.to_datetime(new_date).month
         ):
-            self.save_db([(str(prev_value.year), str(prev_value.month))])
+            self.save_db([(str(prev_date.year), str(prev_date.month))])
 
-        uuid_list = [self._db.loc[index, TransDBSchema.ID]]
-
-        if col_name == TransDBSchema.DATE:
-            self._sort_db()
-
-        self.save_db_from_uuids(uuid_list)
+        self.save_db_from_uuids([trans_id])
 
     def set_specific_month(self, year: str, month: str):
         self._specific_month_date = f'{year}-{month}'
@@ -464,13 +1118,6 @@ class TransactionsDBParquet:
 
         return list(months)
 
-    def _update_cat_group(self, trans_id: str, new_value: str):
-        """
-        update the category group of a transaction
-        """
-        group = self._cat_db.get_group_of_category(new_value)
-        self._update_data(TransDBSchema.CAT_GROUP, trans_id, group)
-
     def _create_new_split_row(self,
                               row_to_split: pd.Series,
                               amount: str,
@@ -490,16 +1137,17 @@ class TransactionsDBParquet:
         new_split[
             TransDBSchema.PAYEE] = f'[{split_ind}] {new_split[TransDBSchema.PAYEE].iloc[0]}'
         new_split[TransDBSchema.ID] = create_uuid()
-        new_split.index = [len(self._db)]
 
         new_split[TransDBSchema.CAT] = cat
         new_split[
             TransDBSchema.CAT_GROUP] = self._cat_db.get_group_of_category(cat)
         new_split[TransDBSchema.MEMO] = memo
         new_split[TransDBSchema.SPLIT] = f'{next_split}-{split_ind + 1}'
+        new_split[TransDBSchema.VERSION] = 0
 
         return new_split
 
+    @_full_row_writer
     def apply_split(self,
                     row_id: str,
                     split_amounts: List[str],
@@ -513,19 +1161,22 @@ class TransactionsDBParquet:
         :param split_cats:
         :return:
         """
-        non_na_splits = self._db[TransDBSchema.SPLIT][~self._db[TransDBSchema.SPLIT].isna()]
+        db = self._db
+        non_na_splits = db[TransDBSchema.SPLIT][~db[TransDBSchema.SPLIT].isna()]
         next_split = self._get_next_split_index(non_na_splits)
-        split_row = self._db[self._db[TransDBSchema.ID] == row_id]
+        split_row = db[db[TransDBSchema.ID] == row_id].copy()
         split_row[TransDBSchema.SPLIT] = f'{next_split}-0'
 
-        rows = []
-        for split_ind, (amount, cat, memo) in enumerate(zip(split_amounts, split_cats, split_memos)):
-            new_split_row = self._create_new_split_row(split_row, amount, cat, memo, split_ind, next_split)
-            self._db = pd.concat([self._db, new_split_row])
-            rows.append(new_split_row)
+        rows = [
+            self._align_categoricals(
+                self._create_new_split_row(split_row, amount, cat, memo, split_ind, next_split))
+            for split_ind, (amount, cat, memo)
+            in enumerate(zip(split_amounts, split_cats, split_memos))
+        ]
 
-        self._db.drop(index=split_row.index, inplace=True)
-        self._sort_db()
+        self._apply_row_delta(removed=db.loc[split_row.index], added=pd.concat(rows))
+        db = pd.concat([db.drop(index=split_row.index), *rows], ignore_index=True)
+        self._publish(self._sort_db(db))
         self.save_db_from_uuids([row[TransDBSchema.ID].iloc[0] for row in rows])
         return rows
 
@@ -550,6 +1201,16 @@ class TransactionsDBParquet:
             self._db[self._db[TransDBSchema.CAT_GROUP]
                      == group])
 
+    def get_period_rows(self, period: int) -> pd.DataFrame:
+        """
+        the full rows of a month. A cold month is read from its partition
+        without thawing it
+        """
+        if period in self._cold_periods:
+            return self._sort_db(self._load_partitions(periods=[period]))
+        db = self.snapshot(full_rows=True).db
+        return db[get_period_keys(db[TransDBSchema.DATE]) == period]
+
     def get_data_by_cat(self, cat: str) -> pd.DataFrame:
         """
         get data by category
@@ -580,20 +1241,34 @@ class TransactionsDBParquet:
 
         return db_tmp
 
-    def get_trans_by_month(self, year: str, month: str) -> pd.DataFrame:
+    def get_trans_by_month(self,
+                           year: str,
+                           month: str,
+                           columns: Optional[List[str]] = None) -> pd.DataFrame:
         """
         get transactions of specific month
         :param year: year in for digit format (e.g. 2020)
         :param month: month in two digit format (e.g. 04 for april)
+        :param columns: if given, slice only these columns
         :return: dataframe of data
         """
         if len(year) != 4 or len(month) != 2:
             raise ValueError('year must be in 4 digit format and month must be'
                              ' in two digit format')
-        target_date = f'{year}-{month}'
-        return self._db[
-            self._db[TransDBSchema.DATE].dt.strftime('%Y-%m') == target_date
-        ]
+        db = self._db
+        dates = db[TransDBSchema.DATE]
+        month_mask = (dates.dt.year == int(year)) & (dates.dt.month == int(month))
+        if columns is not None:
+            return db.loc[month_mask, columns]
+        return db[month_mask]
+
+    def get_columns(self, columns: List[str]) -> pd.DataFrame:
+        """
+        get a copy of only some of the columns of the db, e.g. the analytics cols
+        :param columns: cols to slice
+        :return: dataframe of data
+        """
+        return self._db.loc[:, columns]
 
     @staticmethod
     def _get_category_vals(df) -> Dict[str, pd.CategoricalDtype]:
@@ -615,9 +1290,9 @@ class TransactionsDBParquet:
         get records of db to feed into dash datatable
         :return:
         """
-        df = self._db.copy()
+        df = self.snapshot(full_rows=True).db
         if len(self._applied_filters) > 0:
-            df = self._db[reduce(lambda x, y: x & y, self._applied_filters.values())]
+            df = df[reduce(lambda x, y: x & y, self._applied_filters.values())]
 
         formatted_df = format_date_col_for_display(df,
                                                    TransDBSchema.DATE)
@@ -640,10 +1315,23 @@ class TransactionsDBParquet:
     def db(self):
         return self._db
 
+    @property
+    def version(self) -> int:
+        """ incremented every time a new version of the db is published """
+        return self._version
+
     @property
     def specific_month(self):
+        return self.get_specific_month()
+
+    def get_specific_month(self, columns: Optional[List[str]] = None) \
+            -> 'TransactionsDBParquet':
+        """
+        get the transactions of the month set with set_specific_month
+        :param columns: if given, slice only these columns
+        """
         year, month = self._specific_month_date.split('-')
-        trans = self.get_trans_by_month(year, month)
+        trans = self.get_trans_by_month(year, month, columns)
         return TransactionsDBParquet(self._file_io,
                                      self._cat_db,
                                      self._accounts,
@@ -678,3 +1366,22 @@ def apply_dtypes(df: pd.DataFrame,
         bool)
 
     return df
+
+
+def conform_to_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    bring a frame to the dtypes of TransDBSchema.get_arrow_schema before it is
+    written. Only cols whose dtype drifted are cast, so frames coming from the db
+    pass through untouched
+    :param df: dataframe with all the db cols
+    :return: dataframe with the db cols only, in schema order
+    """
+    df = df[TransDBSchema.get_db_col_vals()].copy()
+    for col, dtype in TransDBSchema.get_pandas_dtypes().items():
+        if str(df[col].dtype) == dtype:
+            continue
+        if col == TransDBSchema.RECONCILED:
+            df[col] = df[col].fillna(False)
+        df[col] = df[col].astype(dtype)
+
+    return df
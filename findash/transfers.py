@@ -0,0 +1,77 @@
+from itertools import permutations
+
+import numpy as np
+import pandas as pd
+
+from findash.trans_schema import TransDBSchema
+
+"""
+Detection of transfers between our own accounts - an outflow in one account
+and an inflow of the same amount in another within a few days. Rows are joined
+on the absolute amount in agorot, and for every ordered pair of accounts
+merge_asof matches each inflow to the nearest outflow in date within the
+window, so detection over years of history is a sort and a merge per account
+pair. Both rows of a pair are tagged with the id of the other (see
+TransDBSchema.TRANSFER), and the aggregations leave them out of the income and
+expense figures.
+"""
+
+# days between the outflow and the inflow of a transfer
+TRANSFER_WINDOW_DAYS = 3
+
+
+class TransferSchema:
+    OUTFLOW_ID: str = 'outflow_id'
+    INFLOW_ID: str = 'inflow_id'
+
+
+def is_transfer(df: pd.DataFrame) -> pd.Series:
+    """ whether each row is a tagged transfer, False for frames without the col """
+    if TransDBSchema.TRANSFER not in df.columns:
+        return pd.Series(False, index=df.index)
+    return df[TransDBSchema.TRANSFER].notna()
+
+
+def find_transfers(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    :param df: transactions with at least the id, date, account, amount and
+               transfer cols. Rows already tagged are skipped
+    :return: one row per transfer with the ids of its outflow and inflow rows
+    """
+    rows = df[~is_transfer(df) & df[TransDBSchema.ACCOUNT].notna() &
+              (df[TransDBSchema.AMOUNT] != 0)]
+    rows = pd.DataFrame({TransDBSchema.ID: rows[TransDBSchema.ID],
+                         TransDBSchema.DATE: rows[TransDBSchema.DATE],
+                         TransDBSchema.ACCOUNT: rows[TransDBSchema.ACCOUNT].astype(object),
+                         'agorot': (rows[TransDBSchema.AMOUNT].abs() * 100).round().astype(
+                             np.int64),
+                         'is_outflow': rows[TransDBSchema.AMOUNT] > 0}).sort_values(
+        TransDBSchema.DATE, kind='stable')
+    outflows = rows[rows['is_outflow']]
+    inflows = rows[~rows['is_outflow']]
+
+    pairs = []
+    for out_account, in_account in permutations(rows[TransDBSchema.ACCOUNT].unique(), 2):
+        account_outflows = outflows[outflows[TransDBSchema.ACCOUNT] == out_account]
+        account_inflows = inflows[inflows[TransDBSchema.ACCOUNT] == in_account]
+        if not len(account_outflows) or not len(account_inflows):
+            continue
+        matched = pd.merge_asof(
+            account_inflows[[TransDBSchema.ID, TransDBSchema.DATE, 'agorot']].rename(
+                columns={TransDBSchema.ID: TransferSchema.INFLOW_ID}),
+            account_outflows[[TransDBSchema.ID, TransDBSchema.DATE, 'agorot']].rename(
+                columns={TransDBSchema.ID: TransferSchema.OUTFLOW_ID}).assign(
+                out_date=account_outflows[TransDBSchema.DATE]),
+            on=TransDBSchema.DATE, by='agorot', direction='nearest',
+            tolerance=pd.Timedelta(days=TRANSFER_WINDOW_DAYS))
+        pairs.append(matched.dropna(subset=[TransferSchema.OUTFLOW_ID]))
+
+    if not len(pairs):
+        return pd.DataFrame(columns=[TransferSchema.OUTFLOW_ID, TransferSchema.INFLOW_ID])
+
+    # each row is in one transfer at most, the pairs closest in date first
+    pairs = pd.concat(pairs, ignore_index=True)
+    days_apart = (pairs[TransDBSchema.DATE] - pairs['out_date']).abs()
+    pairs = pairs.loc[days_apart.sort_values(kind='stable').index].drop_duplicates(
+        TransferSchema.OUTFLOW_ID).drop_duplicates(TransferSchema.INFLOW_ID)
+    return pairs[[TransferSchema.OUTFLOW_ID, TransferSchema.INFLOW_ID]].reset_index(drop=True)
@@ -0,0 +1,164 @@
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from findash.aggregates import AggSchema, RollupCube, get_period_range
+
+"""
+Spending trends per category or category group, computed from the monthly
+aggregates of the rollup cube: trailing averages, month over month deltas and
+the share of the month's total spend. Every trend is a frame of period (rows,
+every month from the first to the last) by key (cols). When the cube changes,
+only the months from the first changed one on are recomputed, from the
+trailing window of months before them.
+"""
+
+
+class TrendSchema:
+    OUTFLOW: str = AggSchema.OUTFLOW
+    AVG_3: str = 'avg_3'
+    AVG_6: str = 'avg_6'
+    AVG_12: str = 'avg_12'
+    MOM_DELTA: str = 'mom_delta'
+    SHARE: str = 'share'
+
+    @classmethod
+    def get_trailing_windows(cls) -> Dict[str, int]:
+        return {cls.AVG_3: 3, cls.AVG_6: 6, cls.AVG_12: 12}
+
+    @classmethod
+    def get_trend_names(cls) -> List[str]:
+        return [cls.OUTFLOW, *cls.get_trailing_windows(), cls.MOM_DELTA, cls.SHARE]
+
+
+class Trends:
+    def __init__(self, frames: Dict[str, pd.DataFrame]):
+        """
+        :param frames: trend name (see TrendSchema): period by key frame
+        """
+        self._frames = frames
+
+    def __getitem__(self, trend_name: str) -> pd.DataFrame:
+        return self._frames[trend_name]
+
+    @property
+    def periods(self) -> pd.Index:
+        return self._frames[TrendSchema.OUTFLOW].index
+
+    @property
+    def keys(self) -> List[str]:
+        return self._frames[TrendSchema.OUTFLOW].columns.tolist()
+
+    def get_key(self, key: str) -> pd.DataFrame:
+        """ the trends of a single key, one row per period """
+        return pd.DataFrame({name: frame[key] if key in frame else 0.
+                             for name, frame in self._frames.items()},
+                            index=self.periods)
+
+    def get_period(self, period: int) -> pd.DataFrame:
+        """ the trends of a single period, one row per key """
+        if period not in self.periods:
+            return pd.DataFrame(columns=TrendSchema.get_trend_names(), dtype=float)
+        return pd.DataFrame({name: frame.loc[period] for name, frame in self._frames.items()})
+
+
+def get_outflow_by_period(aggs: pd.DataFrame, key_col: str) -> pd.DataFrame:
+    """
+    :param aggs: monthly aggregates (see aggregates.aggregate_monthly)
+    :param key_col: AggSchema.CAT or AggSchema.CAT_GROUP
+    :return: outflow per period (every month from the first to the last) and key
+    """
+    outflow = aggs.pivot_table(index=AggSchema.PERIOD, columns=key_col,
+                               values=AggSchema.OUTFLOW, aggfunc='sum', fill_value=0.)
+    if not len(outflow):
+        return outflow.astype(float)
+
+    all_periods = get_period_range(outflow.index.min(), outflow.index.max())
+    return outflow.reindex(all_periods, fill_value=0.).astype(float)
+
+
+def get_first_changed(old: pd.DataFrame, new: pd.DataFrame) -> int:
+    """
+    :return: position of the first period of new whose outflow differs from old
+             (keys missing in one of them count as 0), len(new) if none does
+    """
+    if not len(old) or not len(new) or old.index[0] != new.index[0]:
+        return 0
+
+    common = min(len(old), len(new))
+    old, new = old.iloc[:common].align(new.iloc[:common], join='outer', axis=1, fill_value=0.)
+    changed = ~np.isclose(old.to_numpy(), new.to_numpy()).all(axis=1)
+    return int(np.argmax(changed)) if changed.any() else common
+
+
+def compute_trends(outflow: pd.DataFrame,
+                   previous: Optional[Trends] = None,
+                   first_changed: int = 0) -> Trends:
+    """
+    :param outflow: see get_outflow_by_period
+    :param previous: trends of an older outflow frame of the same key col
+    :param first_changed: see get_first_changed. The trends of the periods
+                          before it are taken from previous
+    """
+    if previous is None:
+        first_changed = 0
+
+    # the longest trailing window of the first changed period starts here
+    start = max(first_changed - max(TrendSchema.get_trailing_windows().values()) + 1, 0)
+    rows = outflow.iloc[start:]
+    totals = rows.sum(axis=1)
+    new_frames = {
+        TrendSchema.OUTFLOW: rows,
+        **{name: rows.rolling(window, min_periods=1).mean()
+           for name, window in TrendSchema.get_trailing_windows().items()},
+        TrendSchema.MOM_DELTA: rows.diff().fillna(0.),
+        TrendSchema.SHARE: rows.div(totals.where(totals != 0), axis=0).fillna(0.),
+    }
+
+    frames = {}
+    for name, frame in new_frames.items():
+        frame = frame.iloc[first_changed - start:]
+        if first_changed > 0:
+            kept = previous[name].iloc[:first_changed].reindex(columns=outflow.columns,
+                                                               fill_value=0.)
+            frame = pd.concat([kept, frame])
+        frames[name] = frame
+    return Trends(frames)
+
+
+class TrendEngine:
+    """
+    Trends of the transactions db per key col, updated when the rollup cube of
+    the db changes
+    """
+    def __init__(self, trans_db):  # TransactionsDBParquet, not imported to avoid a cycle
+        self._trans_db = trans_db
+        self._cube: Optional[RollupCube] = None
+        self._trends: Dict[str, Trends] = {}
+        self._lock = threading.Lock()
+
+    def get_trends(self, key_col: str) -> Trends:
+        """
+        :param key_col: AggSchema.CAT or AggSchema.CAT_GROUP
+        """
+        with self._lock:
+            cube = self._trans_db.cube
+            if cube is not self._cube:
+                self._update(cube)
+            if key_col not in self._trends:
+                self._trends[key_col] = compute_trends(
+                    get_outflow_by_period(cube.aggregates, key_col))
+            return self._trends[key_col]
+
+    def _update(self, cube: RollupCube) -> None:
+        aggs = cube.aggregates
+        for key_col, trends in self._trends.items():
+            outflow = get_outflow_by_period(aggs, key_col)
+            old_outflow = trends[TrendSchema.OUTFLOW]
+            if outflow.equals(old_outflow):
+                continue
+            self._trends[key_col] = compute_trends(outflow, trends,
+                                                   get_first_changed(old_outflow, outflow))
+        self._cube = cube
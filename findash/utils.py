@@ -32,6 +32,7 @@ class Change:
     CURRENT_VALUE = 'current_value'
     PREV_VALUE = 'prev_value'
     CHANGE_TYPE = 'change_type'
+    ROW_VERSION = 'row_version'
 
     row_ind: Optional[int]
     trans_id: Optional[str]
@@ -39,6 +40,7 @@ class Change:
     current_value: Optional[str]
     prev_value: Optional[str]
     change_type: ChangeType
+    row_version: Optional[int] = None  # version of the row the change was made on
 
     def __getitem__(self, item):
         attr_names = [self.ROW_IND, self.COL_NAME, self.CURRENT_VALUE,
@@ -60,7 +62,8 @@ class Change:
             self.CHANGE_TYPE: str(self.change_type),
             self.CURRENT_VALUE: curr_val,
             self.PREV_VALUE: prev_val,
-            self.TRANS_ID: self.trans_id
+            self.TRANS_ID: self.trans_id,
+            self.ROW_VERSION: self.row_version
         }
 
     @classmethod
@@ -82,7 +85,8 @@ class Change:
             change_type=ChangeType(change_dict[cls.CHANGE_TYPE]),
             prev_value=prev_val,
             current_value=curr_val,
-            trans_id=change_dict[cls.TRANS_ID]
+            trans_id=change_dict[cls.TRANS_ID],
+            row_version=change_dict.get(cls.ROW_VERSION)
         )
 
 
@@ -301,14 +305,22 @@ def detect_changes_in_table(df: pd.DataFrame,
                        current_value=df.at[row_id, change[0]],
                        prev_value=df_previous.at[row_id, change[0]],
                        change_type=change_type,
-                       trans_id=df.at[row_id, 'id']
+                       trans_id=df.at[row_id, 'id'],
                        # we can use row index here since it is one to one with what's on screen
+                       row_version=_get_row_version(df_previous, row_id)
                        )
             )
 
     return changes
 
 
+def _get_row_version(df: pd.DataFrame, row_ind: int) -> Optional[int]:
+    """ version of a table row, None for tables without the version col """
+    if 'version' not in df.columns or pd.isna(df.at[row_ind, 'version']):
+        return None
+    return int(df.at[row_ind, 'version'])
+
+
 def format_currency_num(num: Union[int, float, str]):
     return f'{num:,.0f}{SHEKEL_SYM}'
 
@@ -0,0 +1,187 @@
+import pandas as pd
+
+from findash.aggregates import AggSchema, RollupCube, aggregate_monthly, get_budget_usage, \
+    get_filter_totals, get_period_keys, get_period_range, shift_period_key, \
+    period_key_to_timestamp
+
+
+def trans_df():
+    return pd.DataFrame({'date': pd.to_datetime(['2023-12-31', '2024-01-01',
+                                                 '2024-01-15', '2024-01-20']),
+                         'cat': pd.Categorical(['food', 'food', 'food', None]),
+                         'cat_group': pd.Categorical(['home', 'home', 'home', None]),
+                         'account': pd.Categorical(['acc1', 'acc1', 'acc1', 'acc2']),
+                         'inflow': [0., 0., 10., 0.],
+                         'outflow': [5., 7., 0., 3.],
+                         'amount': [5., 7., -10., 3.]})
+
+
+def test_period_keys():
+    keys = get_period_keys(trans_df()['date'])
+    assert keys.tolist() == [202312, 202401, 202401, 202401]
+    assert period_key_to_timestamp(keys).iloc[0] == pd.Timestamp('2023-12-01')
+
+
+def test_shift_period_key():
+    assert shift_period_key(202401, -1) == 202312
+    assert shift_period_key(202312, 1) == 202401
+    assert shift_period_key(202405, -17) == 202212
+
+
+def test_period_range():
+    assert get_period_range(202311, 202402).tolist() == [202311, 202312, 202401, 202402]
+    assert get_period_range(202401, 202401).tolist() == [202401]
+
+
+def test_aggregate_monthly():
+    aggs = aggregate_monthly(trans_df())
+    assert aggs.columns.tolist() == AggSchema.get_agg_cols()
+    assert len(aggs) == 3
+
+    jan_food = aggs[(aggs[AggSchema.PERIOD] == 202401) & (aggs[AggSchema.CAT] == 'food')]
+    assert jan_food[AggSchema.OUTFLOW].item() == 7
+    assert jan_food[AggSchema.INFLOW].item() == 10
+    assert jan_food[AggSchema.COUNT].item() == 2
+
+    uncategorized = aggs[aggs[AggSchema.CAT] == '']
+    assert uncategorized[AggSchema.ACCOUNT].item() == 'acc2'
+
+
+def test_aggregate_monthly_empty():
+    aggs = aggregate_monthly(trans_df().iloc[:0])
+    assert len(aggs) == 0
+    assert aggs.columns.tolist() == AggSchema.get_agg_cols()
+
+
+def test_rollup_cube_deltas_match_rebuild():
+    df = trans_df()
+    cube = RollupCube.from_rows(df.iloc[:2])
+    cube = cube.apply_delta(added=df.iloc[2:])
+    assert cube.equals(RollupCube.from_rows(df))
+
+    edited = df.iloc[[1]].copy()
+    edited['outflow'] = 20.
+    edited['cat'] = pd.Categorical(['rent'])
+    cube = cube.apply_delta(removed=df.iloc[[1]], added=edited)
+    assert cube.equals(RollupCube.from_rows(pd.concat([df.drop(index=1), edited])))
+
+
+def test_rollup_cube_drops_emptied_keys():
+    df = trans_df()
+    cube = RollupCube.from_rows(df).apply_delta(removed=df.iloc[[3]])
+    aggs = cube.aggregates
+    assert '' not in aggs[AggSchema.CAT].tolist()
+    assert aggs[AggSchema.COUNT].sum() == 3
+    assert cube.get_period(202312)[AggSchema.OUTFLOW].tolist() == [5.]
+
+
+def test_rollup_cube_get_period():
+    df = trans_df()
+    cube = RollupCube.from_rows(df)
+    aggs = cube.aggregates
+    assert cube.get_period(202312).equals(
+        aggs[aggs[AggSchema.PERIOD] == 202312].reset_index(drop=True))
+
+    # periods without transactions, also ones whose rows were all removed
+    assert not len(cube.get_period(209901))
+    emptied = cube.apply_delta(removed=df[df['date'].dt.year == 2023])
+    assert emptied.get_period(202312).columns.tolist() == AggSchema.get_agg_cols()
+    assert not len(emptied.get_period(202312))
+
+
+def test_rollup_cube_get_period_totals():
+    df = trans_df()
+    cube = RollupCube.from_rows(df)
+    totals = cube.get_totals(202312, 202312)
+    cats = totals.index[:1].tolist()
+    assert cube.get_period_totals(202312, cats).to_dict() == totals[cats].to_dict()
+    assert not len(cube.get_period_totals(209901, cats))
+
+
+def test_rollup_cube_is_immutable():
+    df = trans_df()
+    cube = RollupCube.from_rows(df)
+    cube.apply_delta(removed=df)
+    assert cube.aggregates[AggSchema.COUNT].sum() == 4
+
+
+def test_rollup_cube_content_hash():
+    df = trans_df()
+    cube = RollupCube.from_rows(df.iloc[:2]).apply_delta(added=df.iloc[2:])
+    assert cube.get_content_hash() == RollupCube.from_rows(df).get_content_hash()
+    assert cube.get_content_hash() != RollupCube.from_rows(df.iloc[1:]).get_content_hash()
+
+
+def test_budget_usage():
+    month_aggs = aggregate_monthly(trans_df().iloc[1:].assign(
+        cat=pd.Categorical(['food', 'food', 'fun']),
+        cat_group=pd.Categorical(['home', 'home', 'home'])))
+    categories = pd.DataFrame({'cat_name': ['food', 'fun', 'rent'],
+                               'cat_group': ['home', 'home', 'home'],
+                               'budget': [10., 3., 0.]})
+    cats, groups = get_budget_usage(month_aggs, categories, 85, 100)
+
+    assert cats['usage'].tolist() == [-3, 3, 0]
+    assert cats['usage_pct'].tolist() == [-30, 100, 0]
+    assert cats['color'].tolist() == ['green', 'red', 'green']
+    assert cats['left'].tolist() == [13., 0., 0.]
+
+    group = groups.iloc[0]
+    assert (group['usage'], group['budget'], group['usage_pct']) == (0, 13., 0)
+    assert group[['num_green', 'num_yellow', 'num_red']].tolist() == [2, 0, 1]
+
+
+def test_budget_usage_colored_by_projection():
+    month_aggs = aggregate_monthly(trans_df().iloc[1:].assign(
+        cat=pd.Categorical(['food', 'food', 'fun']),
+        cat_group=pd.Categorical(['home', 'home', 'home'])))
+    categories = pd.DataFrame({'cat_name': ['food', 'fun'],
+                               'cat_group': ['home', 'home'],
+                               'budget': [10., 6.]})
+    projected = pd.Series({'food': 12., 'fun': 4.})
+    cats, groups = get_budget_usage(month_aggs, categories, 85, 100, projected)
+
+    assert cats['usage_pct'].tolist() == [-30, 50]
+    assert cats['projected_pct'].tolist() == [120, 66]
+    assert cats['color'].tolist() == ['red', 'green']
+    assert groups.iloc[0][['projected', 'num_green', 'num_red']].tolist() == [16, 1, 1]
+
+
+def test_budget_usage_with_carryover():
+    month_aggs = aggregate_monthly(trans_df().iloc[1:].assign(
+        cat=pd.Categorical(['food', 'food', 'fun']),
+        cat_group=pd.Categorical(['home', 'home', 'home'])))
+    categories = pd.DataFrame({'cat_name': ['food', 'fun'],
+                               'cat_group': ['home', 'home'],
+                               'budget': [10., 5.]})
+    carryover = pd.Series({'food': 4., 'fun': -8.})
+    cats, groups = get_budget_usage(month_aggs, categories, 85, 100, carryover=carryover)
+
+    assert cats['budget'].tolist() == [14., -3.]
+    assert cats['left'].tolist() == [17., -6.]
+    # an overdrawn budget is red once anything is spent from it
+    assert cats['color'].tolist() == ['green', 'red']
+    assert groups.iloc[0][['budget', 'carryover']].tolist() == [11., -4.]
+
+
+def test_rollup_cube_compare():
+    cube = RollupCube.from_rows(trans_df())
+    assert cube.get_totals(202312, 202401).to_dict() == {'': 3., 'food': 12.}
+
+    comparison = cube.compare((202312, 202312), (202401, 202401), by=AggSchema.ACCOUNT,
+                              value_col=AggSchema.AMOUNT)
+    assert comparison.index.tolist() == ['acc1', 'acc2']
+    assert comparison.loc['acc1'].tolist() == [5., -3., -8., -160.]
+    assert comparison.loc['acc2', 'delta'] == 3.
+    assert pd.isna(comparison.loc['acc2', 'delta_pct'])
+
+
+def test_filter_totals():
+    df = trans_df()
+    totals = get_filter_totals(df, (df['account'] == 'acc1') & (df['date'] >= '2024-01-01'))
+    assert totals[['inflow', 'outflow', 'net', 'count']].tolist() == [10., 7., 3., 2]
+    assert totals['first_date'] == pd.Timestamp('2024-01-01')
+    assert totals['last_date'] == pd.Timestamp('2024-01-15')
+
+    assert get_filter_totals(df, True)['count'] == 4
+    assert pd.isna(get_filter_totals(df, df['cat'] == 'rent')['first_date'])
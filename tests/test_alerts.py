@@ -0,0 +1,92 @@
+import os
+import tempfile
+
+import pandas as pd
+
+from findash.aggregates import RollupCube
+from findash.alerts import BudgetAlertEngine
+from findash.categories_db import CategoriesDB
+from findash.file_io import LocalIO
+
+
+def rows_df(cats, amounts, dates):
+    return pd.DataFrame({'date': pd.to_datetime(dates),
+                         'cat': pd.Categorical(cats),
+                         'cat_group': pd.Categorical(['home'] * len(cats)),
+                         'account': 'acc1',
+                         'inflow': 0.,
+                         'outflow': amounts,
+                         'amount': amounts})
+
+
+def create_cat_db(data_root, rollover_start=0):
+    os.makedirs(os.path.join(data_root, 'cat_db'))
+    LocalIO(data_root).save_file('cat_db/cat_db.pq', pd.DataFrame({
+        'cat_name': ['food', 'rent'],
+        'cat_group': ['home', 'home'],
+        'is_constant': [False, True],
+        'budget': [100., 0.],
+        'rollover_start': [rollover_start, 0]}))
+    return CategoriesDB(LocalIO(data_root))
+
+
+def test_alerts_fire_once_per_threshold():
+    with tempfile.TemporaryDirectory() as data_root:
+        engine = BudgetAlertEngine(LocalIO(data_root), create_cat_db(data_root))
+        cube = RollupCube()
+
+        added = rows_df(['food', 'rent'], [50., 500.], ['2024-02-01', '2024-02-02'])
+        cube = cube.apply_delta(added=added)
+        # under the thresholds, rent has no budget
+        assert not len(engine.evaluate(cube, [None, added], 202402))
+
+        added = rows_df(['food'], [40.], ['2024-02-03'])
+        cube = cube.apply_delta(added=added)
+        fired = engine.evaluate(cube, [None, added], 202402)
+        assert fired['threshold'].tolist() == [85]
+        assert fired['usage'].tolist() == [90.]
+
+        added = rows_df(['food'], [20.], ['2024-02-04'])
+        cube = cube.apply_delta(added=added)
+        assert engine.evaluate(cube, [None, added], 202402)['threshold'].tolist() == [100]
+        assert sorted(engine.fired['threshold']) == [85, 100]
+
+        # the state is reloaded with the alerts already fired
+        reloaded = BudgetAlertEngine(LocalIO(data_root), create_cat_db(data_root + '/reload'))
+        reloaded.load_state()
+        assert len(reloaded.fired) == 2
+
+
+def test_alerts_clear_when_usage_drops():
+    with tempfile.TemporaryDirectory() as data_root:
+        engine = BudgetAlertEngine(LocalIO(data_root), create_cat_db(data_root))
+        added = rows_df(['food'], [110.], ['2024-02-01'])
+        cube = RollupCube().apply_delta(added=added)
+        assert len(engine.evaluate(cube, [None, added], 202402)) == 2
+
+        # rows of other months are not evaluated
+        other = rows_df(['food'], [-110.], ['2024-01-01'])
+        assert not len(engine.evaluate(cube.apply_delta(added=other), [None, other], 202402))
+        assert len(engine.fired) == 2
+
+        refund = rows_df(['food'], [95.], ['2024-02-01'])
+        cube = cube.apply_delta(removed=added, added=refund)
+        assert not len(engine.evaluate(cube, [added, refund], 202402))
+        assert engine.fired['threshold'].tolist() == [85]
+
+
+def test_budgets_include_carryover():
+    with tempfile.TemporaryDirectory() as data_root:
+        carryover = pd.Series({'food': 50.})
+        engine = BudgetAlertEngine(LocalIO(data_root), create_cat_db(data_root, 202401),
+                                   lambda period: carryover)
+        added = rows_df(['food'], [130.], ['2024-02-01'])
+        cube = RollupCube().apply_delta(added=added)
+        # 130 of the 150 available to spend
+        assert engine.evaluate(cube, [None, added], 202402)['threshold'].tolist() == [85]
+
+        # a budget overdrawn by its carryover is crossed by any spend
+        carryover['food'] = -120.
+        added = rows_df(['food'], [1.], ['2024-02-02'])
+        cube = cube.apply_delta(added=added)
+        assert engine.evaluate(cube, [None, added], 202402)['threshold'].tolist() == [100]
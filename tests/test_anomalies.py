@@ -0,0 +1,51 @@
+import tempfile
+
+import pandas as pd
+
+from findash.anomalies import AnomalyDetector
+from findash.file_io import LocalIO
+
+
+def charges_df(payees, cats, outflows, start='2024-01-01'):
+    return pd.DataFrame({'id': [f'{start}-{i}' for i in range(len(payees))],
+                         'date': pd.date_range(start, periods=len(payees), freq='D'),
+                         'payee': payees,
+                         'cat': pd.Categorical(cats),
+                         'outflow': outflows})
+
+
+def history():
+    return charges_df(['gym'] * 6 + ['cafe', 'bakery'] * 3,
+                      ['sport'] * 6 + ['food'] * 6,
+                      [100., 100., 100., 100., 100., 100., 10., 12., 11., 9., 10., 12.])
+
+
+def test_flags_payee_and_category_spikes():
+    with tempfile.TemporaryDirectory() as data_root:
+        detector = AnomalyDetector(LocalIO(data_root))
+        detector.fit(history())
+
+        new = charges_df(['gym', 'gym', 'bakery', 'new shop', 'cafe'],
+                         ['sport', 'sport', 'food', 'food', 'food'],
+                         [300., 100., 40., 50., 0.], start='2024-02-01')
+        flags = detector.score(new)
+        assert flags['payee'].tolist() == ['gym', 'bakery', 'new shop']
+        # bakery has too few charges of its own, it is flagged by its category
+        assert flags['reason'].tolist() == ['payee', 'category', 'category']
+        assert flags['median'].tolist()[0] == 100.
+
+
+def test_add_updates_stats_and_saves_flags():
+    with tempfile.TemporaryDirectory() as data_root:
+        detector = AnomalyDetector(LocalIO(data_root))
+        detector.fit(history())
+        raised = charges_df(['gym'] * 20, ['sport'] * 20, [300.] * 20, start='2024-02-01')
+        flags = detector.add(raised)
+        assert len(flags) == 20
+
+        # the raised price is the new normal once it fills most of the window
+        assert not len(detector.score(charges_df(['gym'], ['sport'], [300.], '2024-03-01')))
+
+        reloaded = AnomalyDetector(LocalIO(data_root))
+        reloaded.load_flags()
+        assert len(reloaded.flags) == 20
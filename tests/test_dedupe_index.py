@@ -0,0 +1,39 @@
+import tempfile
+
+import pandas as pd
+
+from findash.dedupe_index import DedupeIndex, hash_dedupe_keys
+from findash.file_io import LocalIO
+
+
+def month_df():
+    return pd.DataFrame({'payee': ['a', 'b', 'c'],
+                         'amount': [100., 200., 300.],
+                         'date': pd.to_datetime(['2021-01-01', '2021-01-02',
+                                                 '2021-01-03'])})
+
+
+def test_hash_ignores_dtypes():
+    df = month_df()
+    typed = df.assign(payee=df['payee'].astype('category'),
+                      amount=df['amount'].astype(int),
+                      date=df['date'].dt.strftime('%Y-%m-%d'))
+    assert (hash_dedupe_keys(df) == hash_dedupe_keys(typed)).all()
+
+
+def test_contains_and_reload():
+    with tempfile.TemporaryDirectory() as data_root:
+        index = DedupeIndex(LocalIO(data_root))
+        index.update_month(202101, month_df())
+
+        incoming = pd.DataFrame({'payee': ['a', 'b'],
+                                 'amount': [100., 201.],
+                                 'date': pd.to_datetime(['2021-01-01', '2021-01-02'])})
+        assert index.contains(incoming).tolist() == [True, False]
+
+        reloaded = DedupeIndex(LocalIO(data_root))
+        reloaded.load_month(202101, f'{data_root}/trans_db_index/2021/1.pq')
+        assert reloaded.contains(incoming).tolist() == [True, False]
+
+        index.update_month(202101, month_df().iloc[1:])
+        assert index.contains(incoming).tolist() == [False, False]
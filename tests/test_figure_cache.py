@@ -0,0 +1,101 @@
+import tempfile
+import threading
+
+import plotly.graph_objects as go
+
+from findash.figure_cache import FigureCache, memoize_per_version
+
+builds = []
+
+
+def build_bar(value):
+    builds.append(value)
+    return go.Figure(data=[go.Bar(x=['a'], y=[value])])
+
+
+def test_hit_and_token_change():
+    builds.clear()
+    cache = FigureCache()
+    fig = cache.get_or_build(build_bar, (1,), 'token')
+    fig['data'][0]['y'] = [5]
+    assert cache.get_or_build(build_bar, (1,), 'token')['data'][0]['y'] == [1]
+    assert builds == [1]
+
+    cache.get_or_build(build_bar, (1,), 'new token')
+    assert builds == [1, 1]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_lru_eviction():
+    builds.clear()
+    cache = FigureCache(max_size=2)
+    for value in [1, 2, 1, 3]:
+        cache.get_or_build(build_bar, (value,), 'token')
+    assert len(cache) == 2
+
+    cache.get_or_build(build_bar, (1,), 'token')
+    cache.get_or_build(build_bar, (2,), 'token')
+    assert builds == [1, 2, 3, 2]
+
+
+def test_persisted_figures_are_served_by_new_cache():
+    builds.clear()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cached_bar = FigureCache(cache_dir=cache_dir).cached(lambda: 'token')(build_bar)
+        cached_bar(1)
+
+        cache = FigureCache(cache_dir=cache_dir)
+        fig = cache.get_or_build(build_bar, (1,), 'token')
+        assert fig['data'][0]['y'] == [1]
+        assert builds == [1]
+
+        FigureCache(max_size=0, cache_dir=cache_dir)
+        FigureCache(cache_dir=cache_dir).get_or_build(build_bar, (1,), 'token')
+        assert builds == [1, 1]
+
+
+def test_memoize_per_version():
+    builds.clear()
+    version = [1]
+
+    @memoize_per_version(lambda: version[0], max_size=2)
+    def get_data(value):
+        builds.append(value)
+        return value * version[0]
+
+    assert get_data(1) == get_data(1) == 1
+    version[0] = 2
+    assert get_data(1) == 2
+    assert builds == [1, 1]
+
+    # the entries of older versions are evicted first
+    get_data(2)
+    version[0] = 1
+    get_data(1)
+    assert builds == [1, 1, 2, 1]
+
+
+def test_memoize_per_version_is_thread_safe():
+    version = [0]
+    errors = []
+
+    @memoize_per_version(lambda: version[0], max_size=4)
+    def get_data(value):
+        return (version[0], value)
+
+    def read():
+        try:
+            for i in range(2000):
+                get_data(i % 8)
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for _ in range(200):
+        version[0] += 1
+    for reader in readers:
+        reader.join()
+    assert not errors
+    assert get_data(3) == (version[0], 3)
@@ -0,0 +1,118 @@
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+from findash.file_io import LocalIO
+from findash.integrity import IntegrityScanner, check_partition, compare_to_memory, \
+    hash_month_rows
+from findash.trans_schema import TransDBSchema
+
+
+def partition_df():
+    return pd.DataFrame({'id': ['1', '2', '3', '4'],
+                         'date': pd.to_datetime(['2024-01-01', '2024-01-02',
+                                                 '2024-01-03', '2024-01-04']),
+                         'cat': pd.Categorical(['a', 'a', None, 'b']),
+                         'cat_group': pd.Categorical(['g', 'g', None, 'g']),
+                         'account': pd.Categorical(['acc1'] * 4),
+                         'inflow': [0., 0., 10., 0.],
+                         'outflow': [5., 7., 0., 3.],
+                         'amount': [5., 7., -10., 3.],
+                         'payee': ['a', 'b', 'c', 'd'],
+                         'split': [None, None, '1-1', '1-2'],
+                         'version': [0, 0, 0, 1],
+                         'transfer': [None] * 4})
+
+
+def get_checks(df, period=202401):
+    return {d.check: d.trans_ids for d in check_partition(df, period, 'p')}
+
+
+def test_clean_partition():
+    assert get_checks(partition_df()) == {}
+
+
+def test_detects_rule_violations():
+    df = partition_df()
+    df.loc[0, 'id'] = '2'
+    df.loc[1, 'date'] = pd.Timestamp('2024-02-01')
+    df.loc[3, 'amount'] = 4.
+    df.loc[3, 'split'] = '1-3'
+    checks = get_checks(df)
+    assert checks['duplicate_id'] == ['2', '2']
+    assert checks['wrong_month'] == ['2']
+    assert checks['amount_mismatch'] == ['4']
+    assert checks['incomplete_split'] == ['3', '4']
+
+
+def test_compare_to_memory():
+    stored = partition_df()
+    resident = stored.iloc[1:].copy()
+    resident.loc[2, 'outflow'] = 1.
+    checks = {d.check: d.trans_ids for d in compare_to_memory(stored, resident, 'p')}
+    assert checks == {'not_in_memory': ['1'], 'differs_from_memory': ['3']}
+
+
+def test_month_hash_ignores_row_order():
+    df = partition_df()
+    assert (hash_month_rows(df) == hash_month_rows(df.iloc[::-1])).all()
+
+
+class ChangeTrackingTransDB:
+    """ the parts of TransactionsDBParquet the scanner uses """
+    def __init__(self, df, file_io):
+        self.db = df
+        self.version = 1
+        self.cold_periods = set()
+        self.changed = {202401: 1}
+        self.verified = []
+        self._file_io = file_io
+        file_io.save_file('trans_db/2024/1.pq', df, schema=TransDBSchema.get_arrow_schema())
+
+    def snapshot(self):
+        return self
+
+    def list_partitions(self):
+        return {202401: 'trans_db/2024/1.pq'}
+
+    def get_changed_periods(self, since_version=None):
+        return {period for period, version in self.changed.items()
+                if since_version is None or version > since_version}
+
+    def verify_cube(self, periods):
+        self.verified.append(periods)
+        return True
+
+    def verify_prefix_sums(self, periods):
+        return True
+
+
+def stored_df():
+    df = partition_df().assign(memo='', reconciled=False)
+    for col in ['cat', 'cat_group', 'account']:
+        df[col] = df[col].astype(object).astype('category')
+    return df[TransDBSchema.get_db_col_vals()]
+
+
+def test_scan_verifies_changed_months_only():
+    with tempfile.TemporaryDirectory() as data_root:
+        trans_db = ChangeTrackingTransDB(stored_df(), LocalIO(data_root))
+        scanner = IntegrityScanner(LocalIO(data_root), trans_db)
+        assert scanner.scan() == []
+        assert trans_db.verified == [{202401}]
+
+        # nothing changed since the last scan, the manifest is not rewritten
+        manifest = Path(data_root) / 'trans_db_integrity.json'
+        manifest.unlink()
+        assert scanner.scan() == []
+        assert trans_db.verified == [{202401}]
+        assert not manifest.exists()
+
+        # a change in memory that was not stored
+        db = trans_db.db.copy()
+        db.loc[0, 'outflow'] = db.loc[0, 'amount'] = 6.
+        trans_db.db, trans_db.version, trans_db.changed[202401] = db, 2, 2
+        checks = {d.check: d.trans_ids for d in scanner.scan()}
+        assert checks == {'differs_from_memory': ['1']}
+        assert trans_db.verified == [{202401}, {202401}]
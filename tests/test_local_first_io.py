@@ -0,0 +1,92 @@
+import hashlib
+import shutil
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+from findash.file_io import LocalFirstIO
+
+
+class DirBucket:
+    """ bucket stand-in backed by a local dir, ETags are md5 like in s3 """
+    def __init__(self, root: str, data_root: str = ''):
+        self.root = Path(root)
+        self.data_root = data_root
+        self.uploads = []
+
+    def get_key(self, path):
+        return (Path(self.data_root) / path).as_posix()
+
+    def get_etags(self):
+        root = self.root / self.data_root
+        return {p.relative_to(root).as_posix(): hashlib.md5(p.read_bytes()).hexdigest()
+                for p in root.rglob('*') if p.is_file()}
+
+    def write_from_local_file(self, local_file_path, path):
+        self.uploads.append(path)
+        (self.root / path).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy(local_file_path, self.root / path)
+
+    def download_to_local_file(self, path, local_file_path):
+        Path(local_file_path).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy(self.root / path, local_file_path)
+
+
+def test_uploads_only_changed_files():
+    with tempfile.TemporaryDirectory() as local, tempfile.TemporaryDirectory() as remote:
+        bucket = DirBucket(remote)
+        file_io = LocalFirstIO(local, bucket)
+        df = pd.DataFrame({'a': [1, 2]})
+        file_io.save_file('trans_db/2024/1.pq', df)
+        file_io.flush()
+        file_io.save_file('trans_db/2024/1.pq', df)
+        file_io.flush()
+        assert bucket.uploads == ['trans_db/2024/1.pq']
+        assert file_io.load_file('trans_db/2024/1.pq').equals(df)
+
+
+def test_sync_from_bucket_pulls_differing_objects():
+    with tempfile.TemporaryDirectory() as local, tempfile.TemporaryDirectory() as remote:
+        bucket = DirBucket(remote)
+        pd.DataFrame({'a': [1]}).to_parquet(Path(remote) / 'cats.pq')
+        (Path(remote) / 'db.json').write_text('[1]')
+
+        file_io = LocalFirstIO(local, bucket)
+        (Path(local) / 'db.json').write_text('[1]')
+        file_io.sync_from_bucket()
+        file_io.flush()
+
+        assert file_io.load_file('cats.pq')['a'].tolist() == [1]
+        assert bucket.uploads == []
+
+
+def test_sync_from_bucket_pushes_unsynced_local_changes():
+    with tempfile.TemporaryDirectory() as local, tempfile.TemporaryDirectory() as remote:
+        bucket = DirBucket(remote)
+        file_io = LocalFirstIO(local, bucket)
+        file_io.save_file('db.json', [1])
+        file_io.flush()
+
+        # changed locally while the app was down, before it was uploaded
+        (Path(local) / 'db.json').write_text('[2]')
+        (Path(local) / 'new.json').write_text('[3]')
+        file_io = LocalFirstIO(local, bucket)
+        file_io.sync_from_bucket()
+        file_io.flush()
+
+        assert (Path(remote) / 'db.json').read_text() == '[2]'
+        assert (Path(remote) / 'new.json').read_text() == '[3]'
+
+
+def test_keys_are_under_the_bucket_data_root():
+    with tempfile.TemporaryDirectory() as local, tempfile.TemporaryDirectory() as remote:
+        bucket = DirBucket(remote, 'app')
+        file_io = LocalFirstIO(local, bucket)
+        file_io.save_file('trans_db/2024/1.pq', pd.DataFrame({'a': [1]}))
+        file_io.flush()
+        assert bucket.uploads == ['app/trans_db/2024/1.pq']
+
+        pulled = LocalFirstIO(local + '/pulled', bucket)
+        pulled.sync_from_bucket()
+        assert pulled.load_file('trans_db/2024/1.pq')['a'].tolist() == [1]
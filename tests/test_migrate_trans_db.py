@@ -0,0 +1,65 @@
+import tempfile
+
+import pandas as pd
+import pytest
+
+from findash.file_io import LocalIO, create_file_io
+from findash.migrate_trans_db import migrate_trans_db
+from findash.trans_schema import TransDBSchema
+
+
+def legacy_trans_df():
+    """ a partition written before it had a schema, the version and transfer cols """
+    return pd.DataFrame({'id': ['1', '2'],
+                         'date': ['2024-01-05', '2024-01-20'],
+                         'payee': ['a', 'b'],
+                         'cat': ['food', 'rent'],
+                         'cat_group': ['home', 'home'],
+                         'memo': ['j', None],
+                         'account': ['acc1', 'acc1'],
+                         'inflow': [0, 0],
+                         'outflow': [10, 500],
+                         'reconciled': [0, 1],
+                         'amount': [10, 500],
+                         'split': [None, None]})
+
+
+def test_load_table_rejects_schema_mismatch():
+    with tempfile.TemporaryDirectory() as data_root:
+        file_io = LocalIO(data_root)
+        file_io.save_file('trans_db/2024/1.pq', legacy_trans_df())
+        with pytest.raises(ValueError, match='migrate_trans_db'):
+            file_io.load_table('trans_db/2024/1.pq', TransDBSchema.get_arrow_schema())
+
+        # a subset of the cols is validated against the same cols of the schema
+        columns = [TransDBSchema.ID, TransDBSchema.AMOUNT]
+        with pytest.raises(ValueError):
+            file_io.load_table('trans_db/2024/1.pq', TransDBSchema.get_arrow_schema(), columns)
+
+
+def test_migrates_legacy_partition():
+    with tempfile.TemporaryDirectory() as data_root:
+        file_io = LocalIO(data_root)
+        file_io.save_file('trans_db/2024/1.pq', legacy_trans_df())
+        assert len(migrate_trans_db(file_io)) == 1
+        # migrated partitions are left untouched
+        assert not len(migrate_trans_db(file_io))
+
+        df = file_io.load_table('trans_db/2024/1.pq',
+                                TransDBSchema.get_arrow_schema()).to_pandas()
+        assert df.dtypes.astype(str).to_dict() == TransDBSchema.get_pandas_dtypes()
+        assert df[TransDBSchema.VERSION].tolist() == [0, 0]
+        assert df[TransDBSchema.TRANSFER].isna().all()
+        assert df[TransDBSchema.RECONCILED].tolist() == [False, True]
+        assert df[TransDBSchema.AMOUNT].tolist() == [10., 500.]
+
+
+def test_migrates_with_the_file_io_of_the_env(monkeypatch):
+    with tempfile.TemporaryDirectory() as data_root:
+        monkeypatch.setenv('DATA_PATH', data_root)
+        file_io = create_file_io('prod_local')
+        file_io.save_file('trans_db/2024/1.pq', legacy_trans_df())
+        assert len(migrate_trans_db(file_io)) == 1
+
+    with pytest.raises(ValueError):
+        create_file_io('dev')
@@ -0,0 +1,49 @@
+import pandas as pd
+
+from findash.payees import PayeeCube, aggregate_payees
+
+
+def trans_df():
+    return pd.DataFrame({'date': pd.to_datetime(['2024-01-01', '2024-01-02', '2024-02-01',
+                                                 '2024-02-03', '2024-02-04', '2024-02-05']),
+                         'payee': ['gym', 'market', 'gym', 'cafe', None, 'salary'],
+                         'cat': pd.Categorical(['sport', 'food', 'sport', 'food', None, None]),
+                         'cat_group': pd.Categorical(['fun', 'home', 'fun', 'home', None, None]),
+                         'outflow': [10., 50., 10., 5., 3., 0.]})
+
+
+def test_top_payees():
+    cube = PayeeCube.from_rows(trans_df())
+    top = cube.get_top(2)
+    assert top.index.tolist() == ['market', 'gym']
+    assert top['outflow'].tolist() == [50., 20.]
+    assert top['count'].tolist() == [1, 2]
+
+    assert cube.get_top(1, by='count').index.tolist() == ['gym']
+    assert cube.get_top(10, periods=[202402]).index.tolist() == ['gym', 'cafe', '']
+    assert cube.get_top(10, cat_group='home').index.tolist() == ['market', 'cafe']
+    # rows without outflow are not charges
+    assert 'salary' not in cube.get_top(10).index
+
+
+def test_deltas_match_rebuild():
+    df = trans_df()
+    cube = PayeeCube().apply_delta(added=df.iloc[:3]).apply_delta(added=df.iloc[3:])
+    assert cube.equals(PayeeCube.from_rows(df, cube._interner))
+
+    renamed = df.iloc[[1]].assign(payee='gym')
+    cube = cube.apply_delta(removed=df.iloc[[1]], added=renamed)
+    assert cube.get_top(1).loc['gym', 'outflow'] == 70.
+    assert 'market' not in cube.get_top(10).index
+    assert cube.equals(PayeeCube.from_rows(pd.concat([df.drop(index=1), renamed]),
+                                           cube._interner))
+
+
+def test_stored_aggregates():
+    df = trans_df()
+    stored = aggregate_payees(df.iloc[:2])
+    assert sorted(stored['payee']) == ['gym', 'market']
+
+    cube = PayeeCube.from_rows(df.iloc[2:], stored_aggregates=stored)
+    assert cube.equals(PayeeCube.from_rows(df, cube._interner))
+    assert cube.get_top(1).loc['market', 'outflow'] == 50.
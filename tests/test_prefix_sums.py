@@ -0,0 +1,70 @@
+import pandas as pd
+
+from findash.prefix_sums import PrefixSumIndex, get_daily_sums
+
+
+def trans_df():
+    return pd.DataFrame({'date': pd.to_datetime(['2024-01-10', '2024-01-10',
+                                                 '2024-01-20', '2024-02-09']),
+                         'cat': pd.Categorical(['food', 'rent', 'food', None]),
+                         'inflow': 0.,
+                         'outflow': [1., 2., 3., 4.],
+                         'amount': [1., 2., 3., 4.]})
+
+
+def totals(index, start, end):
+    return index.get_range_totals(pd.Timestamp(start), pd.Timestamp(end)).to_dict()
+
+
+def test_range_totals():
+    index = PrefixSumIndex.from_rows(trans_df(), 'cat')
+    assert totals(index, '2024-01-10', '2024-02-09') == {'': 4., 'food': 4., 'rent': 2.}
+    assert totals(index, '2024-01-11', '2024-02-08') == {'': 0., 'food': 3., 'rent': 0.}
+    assert totals(index, '2023-01-01', '2023-12-31') == {'': 0., 'food': 0., 'rent': 0.}
+    assert index.get_range_total(pd.Timestamp('2024-01-01'), pd.Timestamp('2024-01-31'),
+                                 'food') == 4.
+    assert index.get_range_total(pd.Timestamp('2024-01-01'), pd.Timestamp('2024-01-31'),
+                                 'fun') == 0.
+
+
+def test_deltas_match_rebuild():
+    df = trans_df()
+    index = PrefixSumIndex('cat').apply_delta(added=df.iloc[:2])
+    index = index.apply_delta(added=df.iloc[2:])
+    assert index.equals(PrefixSumIndex.from_rows(df, 'cat'))
+
+    moved = df.iloc[[2]].assign(date=pd.Timestamp('2023-12-01'),
+                                cat=pd.Categorical(['fun']))
+    index = index.apply_delta(removed=df.iloc[[2]], added=moved)
+    expected = pd.concat([df.drop(index=2), moved])
+    assert index.equals(PrefixSumIndex.from_rows(expected, 'cat'))
+    assert totals(index, '2023-12-01', '2024-01-31') == {'': 0., 'food': 1., 'fun': 3.,
+                                                         'rent': 2.}
+
+
+def test_totals_until_and_cumulative():
+    index = PrefixSumIndex.from_rows(trans_df(), 'cat')
+    assert index.get_totals_until(pd.Timestamp('2024-01-15')).to_dict() == \
+        {'': 0., 'food': 1., 'rent': 2.}
+    assert index.get_totals_until(pd.Timestamp('2023-01-01')).to_dict() == \
+        {'': 0., 'food': 0., 'rent': 0.}
+    cumulative = index.get_cumulative()
+    assert cumulative.index.tolist() == pd.to_datetime(['2024-01-10', '2024-01-20',
+                                                        '2024-02-09']).tolist()
+    assert cumulative['food'].tolist() == [1., 4., 4.]
+    assert cumulative.iloc[-1].to_dict() == \
+        index.get_totals_until(pd.Timestamp('2024-12-31')).to_dict()
+    assert PrefixSumIndex('cat').get_totals_until(pd.Timestamp('2024-01-01')).empty
+
+
+def test_stored_daily_sums():
+    df = trans_df().assign(account=pd.Categorical(['acc1', 'acc1', 'acc2', 'acc2']))
+    stored = get_daily_sums(df.iloc[:3], ['cat', 'account'])
+    assert set(stored['key_col']) == {'cat', 'account'}
+
+    # the stored days are in the index next to the rows
+    for key_col in ['cat', 'account']:
+        index = PrefixSumIndex.from_rows(df.iloc[3:], key_col, stored)
+        assert index.equals(PrefixSumIndex.from_rows(df, key_col))
+    assert PrefixSumIndex.from_rows(df.iloc[:0], 'cat', stored).equals(
+        PrefixSumIndex.from_rows(df.iloc[:3], 'cat'))
@@ -0,0 +1,52 @@
+import pandas as pd
+
+from findash.aggregates import RollupCube
+from findash.prefix_sums import PrefixSumIndex
+from findash.projections import ProjectionSchema, project_month_end
+
+
+class IndexedTransDB:
+    """ the parts of TransactionsDBParquet projections use """
+    def __init__(self, df):
+        self._index = PrefixSumIndex.from_rows(df, 'cat')
+        self.cube = RollupCube.from_rows(df)
+
+    def get_range_totals(self, start_date, end_date):
+        return self._index.get_range_totals(start_date, end_date)
+
+    def get_ranges_totals(self, start_dates, end_dates):
+        return self._index.get_ranges_totals(start_dates, end_dates)
+
+
+def trans_df():
+    dates = ['2024-01-05', '2024-01-25', '2024-02-05', '2024-02-20', '2024-02-29',
+             '2024-03-05']
+    return pd.DataFrame({'date': pd.to_datetime(dates),
+                         'cat': pd.Categorical(['food'] * 5 + ['fun']),
+                         'cat_group': pd.Categorical(['home'] * 6),
+                         'account': pd.Categorical(['acc1'] * 6),
+                         'inflow': [0.] * 6,
+                         'outflow': [10., 30., 20., 40., 60., 5.],
+                         'amount': [10., 30., 20., 40., 60., 5.]})
+
+
+def test_projects_rest_of_prior_months():
+    trans_db = IndexedTransDB(trans_df())
+    projection = project_month_end(trans_db, 202403, pd.Timestamp('2024-03-10'))
+    # the rest of january is 30 and the rest of february is 100
+    assert projection.loc['food'].tolist() == [0., 65.]
+    assert projection.loc['fun'].tolist() == [5., 5.]
+
+
+def test_ended_month_is_projected_to_its_spend():
+    trans_db = IndexedTransDB(trans_df())
+    projection = project_month_end(trans_db, 202402, pd.Timestamp('2024-03-10'))
+    assert projection.loc['food', ProjectionSchema.PROJECTED] == 120.
+    assert (projection[ProjectionSchema.SPENT] == projection[ProjectionSchema.PROJECTED]).all()
+
+
+def test_shorter_prior_months_have_no_rest():
+    trans_db = IndexedTransDB(trans_df())
+    projection = project_month_end(trans_db, 202403, pd.Timestamp('2024-03-30'))
+    # nothing is left of february after the 30th, january has no spend after it
+    assert projection.loc['food', ProjectionSchema.PROJECTED] == 0.
@@ -0,0 +1,58 @@
+import tempfile
+
+import pandas as pd
+
+from findash.file_io import LocalIO
+from findash.reconcile import Reconciler, match_payments
+
+
+def trans_df():
+    return pd.DataFrame({
+        'id': [f'id{i}' for i in range(9)],
+        'date': pd.to_datetime(['2024-01-03', '2024-01-20', '2024-01-08', '2024-02-10',
+                                '2024-02-05', '2024-02-10', '2024-03-10', '2024-03-01',
+                                '2024-03-25']),
+        'account': pd.Categorical(['cal', 'cal', 'max', 'fibi', 'cal', 'fibi', 'fibi', 'cal',
+                                   'fibi']),
+        'amount': [100., 50.25, 80., 150.25, 200., 40., 195., 30., 150.25],
+        'reconciled': False})
+
+
+def test_matches_bill_to_payment():
+    ids, mismatches = match_payments(trans_df(), ['cal', 'max'], ['fibi'],
+                                     [202401, 202402, 202403])
+    # january's cal bill is paid on feb 10, the later payment of the same
+    # amount is outside the window
+    assert sorted(ids) == ['id0', 'id1', 'id3']
+
+    # march's window is not covered by the checking rows yet
+    assert mismatches[['account', 'period']].values.tolist() == [['cal', 202402],
+                                                                 ['max', 202401]]
+    assert mismatches['payment_id'].tolist()[0] == 'id6'
+    assert mismatches['delta'].tolist()[0] == -5.
+    # no payment within the tolerance
+    assert pd.isna(mismatches['payment_id'].tolist()[1])
+
+
+def test_reconciled_rows_are_skipped():
+    df = trans_df()
+    df.loc[df['id'].isin(['id0', 'id1', 'id3']), 'reconciled'] = True
+    ids, _ = match_payments(df, ['cal'], ['fibi'], [202401])
+    assert not len(ids)
+
+
+def test_reconciler_replaces_mismatches_of_periods():
+    with tempfile.TemporaryDirectory() as data_root:
+        reconciler = Reconciler(LocalIO(data_root))
+        reconciler.reconcile(trans_df(), ['cal', 'max'], ['fibi'], [202401, 202402])
+        assert len(reconciler.mismatches) == 2
+
+        # the february bill was paid in full after all
+        df = trans_df()
+        df.loc[df['id'] == 'id6', 'amount'] = 200.
+        assert reconciler.reconcile(df, ['cal', 'max'], ['fibi'], [202402]) == ['id4', 'id6']
+        assert reconciler.mismatches['account'].tolist() == ['max']
+
+        reloaded = Reconciler(LocalIO(data_root))
+        reloaded.load_state()
+        assert reloaded.mismatches['account'].tolist() == ['max']
@@ -0,0 +1,83 @@
+import pandas as pd
+
+from findash.recurring import RecurringDetector, normalize_payees
+
+
+def trans_df(payees, cats, dates, amounts):
+    return pd.DataFrame({'date': pd.to_datetime(dates),
+                         'payee': payees,
+                         'cat': pd.Categorical(cats),
+                         'amount': amounts})
+
+
+def history():
+    return trans_df(['NETFLIX.COM 1234', 'Netflix.com 5678', 'netflix com', 'NETFLIX.COM 99',
+                     'super', 'super', 'super', 'super'],
+                    ['tv'] * 4 + ['food'] * 4,
+                    ['2024-01-05', '2024-02-05', '2024-03-06', '2024-04-05',
+                     '2024-01-03', '2024-01-09', '2024-02-20', '2024-03-01'],
+                    [-50., -50., -50., -52., -80., -230., -45., -120.])
+
+
+def test_normalize_payees():
+    assert normalize_payees(pd.Series(['NETFLIX.COM 1234', 'Spotify*AB12'])).tolist() == \
+        ['netflix com', 'spotify ab']
+
+
+def test_detects_monthly_series():
+    detector = RecurringDetector()
+    detector.fit(history())
+
+    recurring = detector.get_recurring()
+    assert recurring.index.tolist() == ['netflix com']
+    netflix = recurring.loc['netflix com']
+    assert netflix['frequency'] == 'monthly'
+    assert netflix['expected_amount'] == -50.
+    assert netflix['interval_days'] == 30
+    assert netflix['next_date'] == pd.Timestamp('2024-05-05')
+    assert detector.get_constant_categories() == ['tv']
+
+
+def test_update_recomputes_touched_payees():
+    detector = RecurringDetector()
+    detector.fit(history())
+    detector.update(trans_df(['gym'] * 3, ['sport'] * 3,
+                             ['2024-01-01', '2024-01-08', '2024-01-15'], [-30.] * 3))
+    assert set(detector.get_recurring().index) == {'netflix com', 'gym'}
+
+    # charges off the weekly interval break the series
+    detector.update(trans_df(['gym'], ['sport'], ['2024-01-16'], [-30.]))
+    detector.update(trans_df(['gym'], ['sport'], ['2024-01-17'], [-30.]))
+    assert detector.get_recurring().index.tolist() == ['netflix com']
+
+    fitted = RecurringDetector()
+    fitted.fit(pd.concat([history(), trans_df(['gym'] * 5, ['sport'] * 5,
+                                              ['2024-01-01', '2024-01-08', '2024-01-15',
+                                               '2024-01-16', '2024-01-17'], [-30.] * 5)]))
+    pd.testing.assert_frame_equal(detector._series, fitted._series, check_dtype=False)
+
+
+def test_skips_missing_payees():
+    detector = RecurringDetector()
+    detector.fit(pd.concat([history(), trans_df([None] * 3 + [''] * 3, ['tv'] * 6,
+                                                ['2024-01-01', '2024-02-01', '2024-03-01'] * 2,
+                                                [-10.] * 6)]))
+    assert detector.get_recurring().index.tolist() == ['netflix com']
+
+
+def test_apply_delta_follows_edits_and_deletes():
+    netflix = history().iloc[:4].assign(id=['1', '2', '3', '4'])
+    detector = RecurringDetector()
+    detector.fit(netflix)
+    assert detector.get_recurring().index.tolist() == ['netflix com']
+
+    # renaming the payee of a row moves it to the series of the new payee
+    renamed = netflix.iloc[[3]].assign(payee='hulu')
+    detector.apply_delta(removed=netflix.iloc[[3]], added=renamed)
+    assert detector.get_recurring().loc['netflix com', 'expected_amount'] == -50.
+    assert len(detector._history) == 4
+
+    # two rows are too few for a series
+    detector.apply_delta(removed=netflix.iloc[[0, 1]])
+    assert not len(detector.get_recurring())
+    assert sorted(detector._history['id']) == ['3', '4']
@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from findash.aggregates import RollupCube
+from findash.rollover import RolloverEngine, compute_balances, get_spent_by_period
+from findash.trends import get_first_changed
+
+
+def aggs_df():
+    return pd.DataFrame({'period': [202311, 202311, 202312, 202402],
+                         'cat': ['food', 'rent', 'food', 'food'],
+                         'cat_group': ['home'] * 4,
+                         'account': ['acc1'] * 4,
+                         'inflow': [0.] * 4,
+                         'outflow': [10., 30., 20., 60.],
+                         'amount': [10., 30., 20., 60.],
+                         'count': [1] * 4})
+
+
+def test_balances_carry_over_from_start():
+    spent = get_spent_by_period(aggs_df(), 202311, 202403)
+    assert spent.index.tolist() == [202311, 202312, 202401, 202402, 202403]
+
+    balances = compute_balances(spent, pd.Series({'food': 30., 'rent': 30.}),
+                                pd.Series({'food': 202311, 'rent': 202312}))
+    assert balances['food'].tolist() == [20., 30., 60., 30., 60.]
+    # rent rolls over from december, november's spend is not counted
+    assert balances['rent'].tolist() == [0., 30., 60., 90., 120.]
+
+
+def test_incremental_balances_match_full():
+    budgets = pd.Series({'food': 30.})
+    starts = pd.Series({'food': 202311})
+    old_spent = get_spent_by_period(aggs_df(), 202311, 202402)
+    old_balances = compute_balances(old_spent, budgets, starts)
+
+    aggs = pd.concat([aggs_df(), aggs_df().iloc[[2]].assign(period=202401, amount=50.)])
+    spent = get_spent_by_period(aggs, 202311, 202403)
+    first_changed = get_first_changed(old_spent, spent)
+    assert first_changed == 2
+
+    balances = compute_balances(spent, budgets, starts, old_balances, first_changed)
+    assert np.allclose(balances, compute_balances(spent, budgets, starts))
+    assert balances['food'].tolist() == [20., 30., 10., -20., 10.]
+
+
+def test_engine_pivots_the_spend_from_the_first_changed_month():
+    trans_db = SimpleNamespace(cube=RollupCube(aggs_df()), version=1,
+                               get_changed_periods=lambda since_version: set())
+    cat_db = SimpleNamespace(get_data_token=lambda: 'token',
+                             get_rollover_starts=lambda: pd.Series({'food': 202311}),
+                             db=pd.DataFrame({'cat_name': ['food'], 'budget': [30.]}))
+    engine = RolloverEngine(trans_db, cat_db)
+    assert engine.get_carryover(202402)['food'] == 60.
+
+    # february's food spend drops from 60 to 10
+    cube = RollupCube(aggs_df().assign(amount=[10., 30., 20., 10.]))
+    sliced_from = []
+    get_periods = cube.get_periods
+    cube.get_periods = lambda start, end: sliced_from.append(start) or get_periods(start, end)
+    trans_db.cube, trans_db.version = cube, 2
+    trans_db.get_changed_periods = lambda since_version: {202402} if since_version < 2 else set()
+    assert engine.get_carryover(202403)['food'] == 80.
+    assert sliced_from == [202402]
+
+    full = RolloverEngine(trans_db, cat_db)
+    full.get_carryover(202403)
+    pd.testing.assert_frame_equal(engine._balances, full._balances)
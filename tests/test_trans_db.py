@@ -1,8 +1,15 @@
+import os
 import tempfile
+import threading
+from types import SimpleNamespace
 
 import pandas as pd
 
-from findash.transactions_db import TransactionsDBParquet
+from findash.categories_db import CategoriesDB
+from findash.file_io import LocalIO
+from findash.projections import ProjectionSchema, project_month_end
+from findash.transactions_db import TransactionsDBParquet, TransDBSchema, conform_to_schema
+from findash.utils import Change, ChangeType
 
 """
 1. use composite (custom) strategies for generating a test dataframe
@@ -67,3 +74,325 @@ def test_insert_data():
 
 def test_get_data():
     db = TransactionsDBParquet()
+
+
+def stored_trans_df():
+    return pd.DataFrame({'id': ['1', '2', '3', '4'],
+                         'date': pd.to_datetime(['2024-01-05', '2024-01-20',
+                                                 '2024-02-03', '2024-02-10']),
+                         'payee': ['a', 'b', 'a', 'c'],
+                         'cat': ['food', 'rent', 'food', 'food'],
+                         'cat_group': ['home'] * 4,
+                         'memo': ['j', 'k', 'l', 'm'],
+                         'account': ['acc1'] * 4,
+                         'inflow': [0.] * 4,
+                         'outflow': [10., 500., 20., 30.],
+                         'reconciled': False,
+                         'amount': [10., 500., 20., 30.],
+                         'split': None,
+                         'version': 0,
+                         'transfer': None})
+
+
+def create_trans_db(data_root, hot_months=None, lazy_detail_cols=True, trans_df=None):
+    """
+    a db connected to partitions of trans_df (stored_trans_df by default) saved
+    under data_root
+    """
+    os.makedirs(os.path.join(data_root, 'cat_db'))
+    file_io = LocalIO(data_root)
+    file_io.save_file('cat_db/cat_db.pq', pd.DataFrame({'cat_name': ['food', 'rent'],
+                                                        'cat_group': ['home', 'home'],
+                                                        'is_constant': [False, True],
+                                                        'budget': [100., 0.]}))
+    df = conform_to_schema(stored_trans_df() if trans_df is None else trans_df)
+    for (year, month), month_df in df.groupby([df['date'].dt.year, df['date'].dt.month]):
+        file_io.save_file(f'trans_db/{year}/{month}.pq', month_df,
+                          schema=TransDBSchema.get_arrow_schema())
+
+    trans_db = TransactionsDBParquet(file_io, CategoriesDB(file_io),
+                                     {'acc1': SimpleNamespace(is_checking=True),
+                                      'acc2': SimpleNamespace(is_checking=False)},
+                                     hot_months=hot_months)
+    trans_db.connect(lazy_detail_cols)
+    return trans_db
+
+
+def edit(trans_id, col, value, row_version=None):
+    return Change(None, trans_id, col, value, None, ChangeType.CHANGE_DATA, row_version)
+
+
+def get_row(df, trans_id):
+    return df[df[TransDBSchema.ID] == trans_id].iloc[0]
+
+
+def test_snapshot_is_unaffected_by_later_writes():
+    with tempfile.TemporaryDirectory() as data_root:
+        trans_db = create_trans_db(data_root)
+        snapshot = trans_db.snapshot()
+        assert trans_db.submit_change(edit('1', TransDBSchema.OUTFLOW, 15.))
+        trans_db.remove_row_with_id('2')
+
+        assert get_row(snapshot.db, '1')[TransDBSchema.AMOUNT] == 10.
+        assert len(snapshot) == 4
+        assert get_row(trans_db.db, '1')[TransDBSchema.AMOUNT] == 15.
+        assert len(trans_db) == 3
+
+
+def test_writer_waits_for_writer_lock():
+    with tempfile.TemporaryDirectory() as data_root:
+        trans_db = create_trans_db(data_root)
+        version = trans_db.version
+        writer = threading.Thread(target=trans_db.submit_change,
+                                  args=(edit('1', TransDBSchema.MEMO, 'x'),))
+        with trans_db._write_lock:
+            writer.start()
+            writer.join(timeout=0.5)
+            assert writer.is_alive()
+            assert trans_db.version == version
+
+        writer.join()
+        assert get_row(trans_db.db, '1')[TransDBSchema.MEMO] == 'x'
+
+
+def test_concurrent_writers_lose_no_edits():
+    with tempfile.TemporaryDirectory() as data_root:
+        trans_db = create_trans_db(data_root)
+        trans_db.snapshot(full_rows=True)
+        version = trans_db.version
+        num_edits = 5
+
+        def edit_row(trans_id):
+            for i in range(num_edits):
+                trans_db.submit_change(edit(trans_id, TransDBSchema.MEMO, f'{trans_id}-{i}'))
+
+        writers = [threading.Thread(target=edit_row, args=(trans_id,))
+                   for trans_id in ['1', '2', '3', '4']]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+
+        assert trans_db.version == version + 4 * num_edits
+        db = trans_db.db.set_index(TransDBSchema.ID)
+        assert (db[TransDBSchema.VERSION] == num_edits).all()
+        assert db[TransDBSchema.MEMO].to_dict() == {trans_id: f'{trans_id}-{num_edits - 1}'
+                                                    for trans_id in ['1', '2', '3', '4']}
+
+
+def test_detail_cols_are_loaded_once_on_demand():
+    with tempfile.TemporaryDirectory() as data_root:
+        trans_db = create_trans_db(data_root)
+        assert not set(TransDBSchema.get_detail_cols()) & set(trans_db.db.columns)
+        # readers of the resident cols do not load them
+        assert TransDBSchema.MEMO not in trans_db.snapshot().db.columns
+
+        version = trans_db.version
+        snapshot = trans_db.snapshot(full_rows=True)
+        assert snapshot.db.columns.tolist() == TransDBSchema.get_db_col_vals()
+        assert get_row(snapshot.db, '3')[TransDBSchema.MEMO] == 'l'
+        assert trans_db.version == version + 1
+
+        trans_db.snapshot(full_rows=True)
+        assert trans_db.version == version + 1
+
+
+def test_only_full_row_writers_load_detail_cols():
+    with tempfile.TemporaryDirectory() as data_root:
+        trans_db = create_trans_db(data_root, hot_months=1)
+        version = trans_db.version
+        # thawing a month that is not cold changes nothing
+        trans_db.thaw_periods([209901])
+        assert trans_db.version == version
+
+        trans_db.thaw_periods([202402])
+        assert TransDBSchema.MEMO not in trans_db.db.columns
+        trans_db.tag_transfers()
+        assert TransDBSchema.MEMO not in trans_db.db.columns
+
+        trans_db.submit_change(edit('3', TransDBSchema.MEMO, 'edited'))
+        assert trans_db.db.columns.tolist() == TransDBSchema.get_db_col_vals()
+        assert get_row(trans_db.db, '4')[TransDBSchema.MEMO] == 'm'
+
+
+def test_connect_loads_all_cols_when_not_lazy():
+    with tempfile.TemporaryDirectory() as data_root:
+        trans_db = create_trans_db(data_root, lazy_detail_cols=False)
+        version = trans_db.version
+        assert trans_db.snapshot(full_rows=True).db.columns.tolist() == \
+            TransDBSchema.get_db_col_vals()
+        assert trans_db.version == version
+
+
+def test_update_bumps_row_version():
+    with tempfile.TemporaryDirectory() as data_root:
+        trans_db = create_trans_db(data_root)
+        assert trans_db.submit_change(edit('1', TransDBSchema.OUTFLOW, 15., row_version=0))
+        row = get_row(trans_db.db, '1')
+        assert row[TransDBSchema.VERSION] == 1
+        assert row[TransDBSchema.AMOUNT] == 15.
+        assert get_row(trans_db.db, '2')[TransDBSchema.VERSION] == 0
+
+        # an unchanged value is accepted and leaves the version as is
+        assert trans_db.submit_change(Change(None, '1', TransDBSchema.MEMO, 'j', 'j',
+                                             ChangeType.CHANGE_DATA, 1))
+        assert get_row(trans_db.db, '1')[TransDBSchema.VERSION] == 1
+
+
+def test_rejects_stale_row_version():
+    with tempfile.TemporaryDirectory() as data_root:
+        trans_db = create_trans_db(data_root)
+        assert trans_db.submit_change(edit('1', TransDBSchema.MEMO, 'mine', row_version=0))
+        # another client edited the row it read at version 0
+        assert not trans_db.submit_change(edit('1', TransDBSchema.MEMO, 'theirs', row_version=0))
+        assert not trans_db.submit_change(edit('missing', TransDBSchema.MEMO, 'x', row_version=0))
+
+        row = get_row(trans_db.db, '1')
+        assert row[TransDBSchema.MEMO] == 'mine'
+        assert row[TransDBSchema.VERSION] == 1
+
+
+def test_accepts_chained_edits_of_one_row():
+    with tempfile.TemporaryDirectory() as data_root:
+        trans_db = create_trans_db(data_root)
+        assert trans_db.submit_change(edit('3', TransDBSchema.OUTFLOW, 25., row_version=0))
+        assert trans_db.submit_change(edit('3', TransDBSchema.MEMO, 'split later', row_version=1))
+        assert trans_db.submit_change(edit('3', TransDBSchema.CAT, 'rent', row_version=2))
+
+        row = get_row(trans_db.db, '3')
+        assert row[TransDBSchema.VERSION] == 3
+        assert (row[TransDBSchema.AMOUNT], row[TransDBSchema.MEMO], row[TransDBSchema.CAT]) == \
+            (25., 'split later', 'rent')
+
+
+def test_tracks_changed_periods():
+    with tempfile.TemporaryDirectory() as data_root:
+        trans_db = create_trans_db(data_root)
+        assert trans_db.get_changed_periods() == {202401, 202402}
+        version = trans_db.version
+        assert trans_db.get_changed_periods(version) == set()
+
+        # moving a row to another month changes both
+        assert trans_db.submit_change(edit('4', TransDBSchema.DATE, pd.Timestamp('2024-03-01')))
+        assert trans_db.get_changed_periods(version) == {202402, 202403}
+        assert trans_db.verify_cube({202402, 202403})
+        assert trans_db.verify_prefix_sums({202402, 202403})
+
+        # drift is found in the months it is in only
+        db = trans_db.db
+        trans_db._cube = trans_db.cube.apply_delta(added=db[db[TransDBSchema.ID] == '1'])
+        assert trans_db.verify_cube({202402, 202403})
+        assert not trans_db.verify_cube({202401})
+        assert not trans_db.verify_cube()
+
+
+def test_reconcile_marks_the_months_changed():
+    # the january bill of the acc2 card is paid from acc1 on feb 10, a later
+    # acc1 row covers the payment window
+    card_rows = stored_trans_df().iloc[:2].assign(id=['5', '6'], account='acc2',
+                                                  outflow=[10., 20.], amount=[10., 20.])
+    later_row = stored_trans_df().iloc[[3]].assign(id='7', date=pd.Timestamp('2024-02-25'),
+                                                   outflow=5., amount=5.)
+    with tempfile.TemporaryDirectory() as data_root:
+        trans_db = create_trans_db(data_root, trans_df=pd.concat(
+            [stored_trans_df(), card_rows, later_row], ignore_index=True))
+        version = trans_db.version
+        assert trans_db.reconcile([202401]) == 3
+        assert trans_db.get_changed_periods(version) == {202401, 202402}
+        assert get_row(trans_db.db, '4')[TransDBSchema.RECONCILED]
+        assert trans_db.verify_cube() and trans_db.verify_prefix_sums()
+
+
+def test_reads_of_cold_months_do_not_thaw():
+    with tempfile.TemporaryDirectory() as data_root:
+        trans_db = create_trans_db(data_root, hot_months=1)
+        assert trans_db.cold_periods == {202401, 202402}
+        assert not len(trans_db.db)
+
+        totals = trans_db.get_range_totals(pd.Timestamp('2024-01-10'), pd.Timestamp('2024-02-05'))
+        assert totals.to_dict() == {'food': 20., 'rent': 500.}
+        assert trans_db.get_balances(pd.Timestamp('2024-01-31')).to_dict() == {'acc1': -510.}
+        assert trans_db.get_balance_series()['acc1'].tolist() == [-10., -510., -530., -560.]
+        projection = project_month_end(trans_db, 202402, pd.Timestamp('2024-02-05'))
+        assert projection.loc['rent', ProjectionSchema.PROJECTED] == 500.
+        assert trans_db.reconcile() == 0
+        assert trans_db.tag_transfers() == 0
+        assert trans_db.get_top_payees()['outflow'].to_dict() == {'b': 500., 'a': 30., 'c': 30.}
+        assert trans_db.get_top_payees(period=202402).index.tolist() == ['c', 'a']
+        assert trans_db.cold_periods == {202401, 202402}
+
+        # thawed months are not counted twice
+        trans_db.thaw_periods([202401])
+        assert trans_db.get_balances().to_dict() == {'acc1': -560.}
+        assert trans_db.verify_prefix_sums()
+        assert trans_db.get_top_payees()['count'].to_dict() == {'b': 1, 'a': 2, 'c': 1}
+
+
+def test_balances_are_inflow_minus_outflow_whatever_the_inflow_sign():
+    # acc2 has a plus inflow sign - the raw amount of its inflows is positive
+    plus_sign_rows = stored_trans_df().iloc[:2].assign(
+        id=['5', '6'], account='acc2', inflow=[1000., 0.], outflow=[0., -40.],
+        amount=[1000., -40.])
+    with tempfile.TemporaryDirectory() as data_root:
+        trans_db = create_trans_db(data_root, hot_months=1, trans_df=pd.concat(
+            [stored_trans_df(), plus_sign_rows], ignore_index=True))
+        assert trans_db.cold_periods == {202401, 202402}
+        assert trans_db.get_balances().to_dict() == {'acc1': -560., 'acc2': 960.}
+
+        # an outflow edited into an inflow is stored with a positive amount
+        trans_db.thaw_range(pd.Timestamp('2024-02-01'), pd.Timestamp('2024-02-28'))
+        assert trans_db.submit_change(edit('4', TransDBSchema.OUTFLOW, 0.))
+        assert trans_db.submit_change(edit('4', TransDBSchema.INFLOW, 30.))
+        assert trans_db.get_balances().to_dict() == {'acc1': -500., 'acc2': 960.}
+        assert trans_db.get_balance_series()['acc1'].tolist() == [-10., -510., -530., -500.]
+        assert trans_db.verify_prefix_sums()
+
+        trans_db.end_drill_in()
+        assert trans_db.get_balances().to_dict() == {'acc1': -500., 'acc2': 960.}
+
+
+def test_alerts_are_evaluated_on_the_published_version():
+    with tempfile.TemporaryDirectory() as data_root:
+        trans_db = create_trans_db(data_root)
+        evaluated = []
+        trans_db._alert_engine.evaluate = lambda cube, changed_rows, period: evaluated.append(
+            (trans_db.version, cube is trans_db.cube, len(changed_rows)))
+        trans_db.submit_change(edit('1', TransDBSchema.OUTFLOW, 15.))
+        assert evaluated == [(trans_db.version, True, 2)]
+
+        # publishing without a row delta evaluates nothing
+        trans_db.thaw_periods([202401])
+        assert len(evaluated) == 1
+
+
+def test_thawed_months_return_to_cold():
+    with tempfile.TemporaryDirectory() as data_root:
+        trans_db = create_trans_db(data_root, hot_months=1)
+        trans_db.reconcile([202401])
+        trans_db.tag_transfers(pd.Timestamp('2024-01-01'), pd.Timestamp('2024-02-28'))
+        trans_db.save_db([('2024', '2')])
+        assert trans_db.cold_periods == {202401, 202402}
+        assert not len(trans_db.db)
+
+        trans_db.thaw_range(pd.Timestamp('2024-02-01'), pd.Timestamp('2024-02-28'))
+        assert trans_db.cold_periods == {202401}
+        # edits of the drilled months are saved and keep them resident
+        assert trans_db.submit_change(edit('3', TransDBSchema.OUTFLOW, 25.))
+        assert trans_db.cold_periods == {202401}
+        trans_db.thaw_range(pd.Timestamp('2024-01-01'), pd.Timestamp('2024-01-31'))
+        assert trans_db.cold_periods == {202402}
+
+        trans_db.end_drill_in()
+        assert trans_db.cold_periods == {202401, 202402}
+        assert not len(trans_db.db)
+        assert trans_db.get_balances().to_dict() == {'acc1': -565.}
+        assert trans_db.verify_cube() and trans_db.verify_prefix_sums()
+
+
+def test_period_rows_of_cold_months_are_read_without_thawing():
+    with tempfile.TemporaryDirectory() as data_root:
+        trans_db = create_trans_db(data_root, hot_months=1)
+        rows = trans_db.get_period_rows(202402)
+        assert rows[TransDBSchema.ID].tolist() == ['4', '3']
+        assert rows[TransDBSchema.MEMO].tolist() == ['m', 'l']
+        assert trans_db.cold_periods == {202401, 202402}
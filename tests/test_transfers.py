@@ -0,0 +1,51 @@
+import pandas as pd
+
+from findash.aggregates import aggregate_monthly
+from findash.prefix_sums import PrefixSumIndex
+from findash.transfers import find_transfers
+
+
+def trans_df():
+    return pd.DataFrame({
+        'id': ['1', '2', '3', '4', '5', '6', '7'],
+        'date': pd.to_datetime(['2024-01-05', '2024-01-06', '2024-01-20', '2024-01-28',
+                                '2024-01-10', '2024-01-10', '2024-01-07']),
+        'cat': pd.Categorical([None, None, 'rent', None, 'food', None, None]),
+        'cat_group': pd.Categorical([None, None, 'home', None, 'home', None, None]),
+        'account': pd.Categorical(['fibi', 'savings', 'fibi', 'savings', 'fibi', 'fibi',
+                                   'savings']),
+        'inflow': [0., 1000., 0., 1000., 0., 70., 1000.],
+        'outflow': [1000., 0., 1000., 0., 70., 0., 0.],
+        'amount': [1000., -1000., 1000., -1000., 70., -70., -1000.],
+        'transfer': None})
+
+
+def test_finds_transfer_pairs():
+    transfers = find_transfers(trans_df())
+    # the second inflow of 1000 is a day further from the outflow, the later
+    # pair is out of the window and 70 is refunded within the same account
+    assert transfers.values.tolist() == [['1', '2']]
+
+
+def test_skips_tagged_rows():
+    df = trans_df()
+    df.loc[df['id'].isin(['1', '2']), 'transfer'] = ['2', '1']
+    assert not len(find_transfers(df))
+
+
+def test_aggregates_leave_out_transfers():
+    df = trans_df().iloc[:2]
+    df.loc[:, 'transfer'] = ['2', '1']
+    aggs = aggregate_monthly(df).set_index('account')
+    assert aggs['outflow'].sum() == aggs['inflow'].sum() == 0.
+    assert aggs['transfer_amount'].to_dict() == {'fibi': 1000., 'savings': -1000.}
+    assert aggs['count'].sum() == 2
+
+
+def test_prefix_sums_count_transfers_per_account_only():
+    df = trans_df().iloc[:3]
+    df.loc[:, 'transfer'] = ['2', '1', None]
+    end = pd.Timestamp('2024-01-31')
+    assert PrefixSumIndex.from_rows(df, 'cat').get_totals_until(end).to_dict() == {'rent': 1000.}
+    assert PrefixSumIndex.from_rows(df, 'account').get_totals_until(end).to_dict() == \
+        {'fibi': 2000., 'savings': -1000.}
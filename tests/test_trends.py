@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from findash.aggregates import AggSchema, RollupCube
+from findash.trends import TrendEngine, TrendSchema, compute_trends, get_first_changed, \
+    get_outflow_by_period
+
+
+def aggs_df():
+    return pd.DataFrame({'period': [202311, 202311, 202312, 202402],
+                         'cat': ['food', 'rent', 'food', 'food'],
+                         'cat_group': ['home'] * 4,
+                         'account': ['acc1'] * 4,
+                         'inflow': [0.] * 4,
+                         'outflow': [10., 30., 20., 60.],
+                         'amount': [10., 30., 20., 60.],
+                         'count': [1] * 4})
+
+
+def test_outflow_has_every_month():
+    outflow = get_outflow_by_period(aggs_df(), AggSchema.CAT)
+    assert outflow.index.tolist() == [202311, 202312, 202401, 202402]
+    assert outflow['food'].tolist() == [10., 20., 0., 60.]
+
+
+def test_trends():
+    trends = compute_trends(get_outflow_by_period(aggs_df(), AggSchema.CAT))
+    food = trends.get_key('food')
+    assert food[TrendSchema.AVG_3].tolist() == [10., 15., 10., 80 / 3]
+    assert food[TrendSchema.MOM_DELTA].tolist() == [0., 10., -20., 60.]
+    assert food[TrendSchema.SHARE].tolist() == [0.25, 1., 0., 1.]
+    assert trends.get_period(202311)[TrendSchema.SHARE].to_dict() == {'food': .25, 'rent': .75}
+
+
+def test_incremental_update_matches_full_compute():
+    aggs = pd.concat([aggs_df().assign(period=period)
+                      for period in [202001, 202101, 202201, 202301]], ignore_index=True)
+    old_outflow = get_outflow_by_period(aggs, AggSchema.CAT)
+    old_trends = compute_trends(old_outflow)
+
+    aggs.loc[len(aggs) - 1, 'outflow'] = 100.
+    aggs.loc[len(aggs)] = [202302, 'fun', 'home', 'acc1', 0., 5., 5., 1]
+    outflow = get_outflow_by_period(aggs, AggSchema.CAT)
+    first_changed = get_first_changed(old_outflow, outflow)
+    assert outflow.index[first_changed] == 202301
+
+    updated = compute_trends(outflow, old_trends, first_changed)
+    expected = compute_trends(outflow)
+    for name in TrendSchema.get_trend_names():
+        assert np.allclose(updated[name].to_numpy(), expected[name].to_numpy())
+
+
+class CubeHolder:
+    def __init__(self, cube):
+        self.cube = cube
+
+
+def test_engine_follows_cube():
+    trans_db = CubeHolder(RollupCube(aggs_df()))
+    engine = TrendEngine(trans_db)
+    trends = engine.get_trends(AggSchema.CAT_GROUP)
+    assert engine.get_trends(AggSchema.CAT_GROUP) is trends
+
+    trans_db.cube = RollupCube(aggs_df().iloc[:3])
+    trends = engine.get_trends(AggSchema.CAT_GROUP)
+    assert trends.periods.tolist() == [202311, 202312]
+    assert trends[TrendSchema.AVG_6]['home'].tolist() == [40., 30.]